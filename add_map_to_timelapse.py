@@ -7,7 +7,7 @@ Purpose: for all geotagged images, derive a common map, track progress of each i
 
 TODO:
     1) add option to control map location
-    2) create option to call Open Street Map API for basemap
+    2) create option to download missing basemap tiles (--basemap reads local tiles only)
     3) create standalone executable (see: cpython, PyInstaller)
 
 Author: Steve Foga
@@ -15,159 +15,240 @@ Created: 12 May 2018
 Python version: 2.7.12
 """
 import os
-import glob
 import warnings
-import matplotlib.pyplot as plt
 from PIL import Image
 from collections import OrderedDict
-from lib import common, geotools
+from lib import basemap, common, exif, frames, geotools, maprender, video
 
 ## TODO: add logging module, use debug for coordinate conversion
 ## example: image 756 jumps
 
 
-def main(src, breadcrumbs, keep_map, dryrun, map_size, map_dpi, map_x, map_y, map_line_width, map_alpha, map_point_size,
-         map_point_color, bc_point_size, bc_point_color):
-    if not os.path.isdir(src):
-        raise Exception("src must be a directory")
+DEFAULT_WORKERS = 1
+VIDEO_TASK_SIZE = 2  # frames per task when writing a video (frames are held in memory until written)
+QUEUE_DEPTH = 2  # tasks in flight per process when writing a video
+DEFAULT_BASEMAP_ALPHA = 0.5
+IMG_EXT = '.jpg'  # matched case-insensitively
+MAP_SUFFIX = '_map'  # output frames are written as '<frame>_map.JPG'
 
-    img_in = glob.glob(os.path.join(src, "*.JPG"))
+_render_state = {}  # track and map settings, set by init_render() in each process
 
-    if not img_in:
-        raise Exception("could not find JPG images in {0}".format(src))
 
-    img_coords = OrderedDict()
+def init_render(state):
+    """
+    Store track and map settings for render_frames() (pool initializer)
 
-    it = 0
-    total = len(img_in)
+    :param state: <dict> 'paths', 'coords', 'lats', 'longs', and the map settings used by render_frame()
+    :return:
+    """
+    global _render_state
+    _render_state = state
 
-    for i in img_in:
 
-        it += 1
-        common.progress(it, total, "coords extracted from exif")
+def get_renderer():
+    """
+    Map renderer of this process; created (and the static track drawn) on first use
 
-        #io = Common.open_image(i)
-        #info = io._getexif()
-        image = common.ImageIO(i)
+    :return: <lib.maprender.MapRenderer>
+    """
+    st = _render_state
+    if 'renderer' not in st:
+        st['renderer'] = maprender.MapRenderer(st['lats'], st['longs'], st['map_x_dim'], st['map_y_dim'],
+                                               st['map_line_width'], st['map_alpha'], st['map_point_size'],
+                                               st['map_point_color'], st['bc_point_size'], st['bc_point_color'],
+                                               line_lats=st['line_lats'], line_longs=st['line_longs'],
+                                               basemap=st['basemap'], basemap_alpha=st['basemap_alpha'])
+    return st['renderer']
 
-        #print(info)
 
-        # write [lat, long] to dictonary key 'image.JPG'
-        try:
-            #img_coords[i] = geotools.get_coords(info[34853])
-            img_coords[i] = geotools.get_coords(image.image_exif[34853])
-        except KeyError:
-            warnings.warn("Skipping: Could not find coordinates for image {0}".format(i))
-            continue
+def composite_frame(img_path, value, frame_idx):
+    """
+    Render map for one image and overlay it on a copy of the image
 
-    # grab size of last image opened (assuming all images are same size; to be used for scaling map later)
-    #img_y = io.size[1]
-    #img_x = io.size[0]
-    img_x, img_y = image.get_size()
+    :param img_path: <str> path to image
+    :param value: <list> [lat, long] of image
+    :param frame_idx: <int> position of image in the track (previous images are shown as breadcrumbs, if enabled)
+    :return: <PIL.Image> RGB image with map; info['exif'] holds the EXIF block of the original image
+    """
+    st = _render_state
 
-    map_x_dim, map_y_dim = geotools.calc_map_dims(img_x, img_y, map_size, map_dpi)
+    # render map on top of the cached track layer
+    map_rgba = get_renderer().render(value, frame_idx if st['breadcrumbs'] else 0)
 
-    # set map within target image
-    map_y_pos = geotools.scale_map_to_img(map_y, img_y)
-    map_x_pos = geotools.scale_map_to_img(map_x, img_x)
+    map_img = common.ImageIO.from_image(Image.fromarray(map_rgba, 'RGBA'))
 
-    # determine bounding box of all images
-    lats = [lc[0] for lc in img_coords.values()]
-    longs = [lc[1] for lc in img_coords.values()]
+    # optionally keep a copy of the map
+    if st['keep_map'] and not st['dryrun']:
+        map_img.image_open.save(os.path.splitext(img_path)[0] + "_transparent.png")
 
-    # make plot
-    plt.plot(longs, lats)
+    # open target image, and composite map onto the region it covers (decoded frame is returned, so not closed here;
+    # PIL releases the file once the pixels are loaded)
+    base_img = common.ImageIO(img_path)
+    frame = base_img.overlay_rgb(map_img, st['map_x_pos'], st['map_y_pos'])
 
-    # make plot for each image
-    if breadcrumbs:
-        prev_pts = []
+    # keep EXIF of the original (capture time, GPS) for the written frame
+    frame.info['exif'] = base_img.image_open.info.get('exif', b'')
 
-    it = 0
-    total = len(img_coords)
+    return frame
 
-    for img_path, value in img_coords.items():
 
-        it += 1
-        common.progress(it, total, "maps plotted")
+def render_frame(img_path, value, frame_idx):
+    """
+    Overlay map on a copy of one image (see composite_frame()), and save it as JPG (unless only a video is written)
 
-        '''
-        # open image as plot
-        img = plt.imread(img_path)
-        img_dims = img.shape
-        y_map = img_dims[0] * (map_size * 0.01)
-        x_map = img_dims[1] * (map_size * 0.01)
-        #imgplot = plt.imshow(img)
-        '''
-        # configure map plot dimensions
-        plt.rcParams["figure.figsize"] = (map_x_dim, map_y_dim)
+    :param img_path: <str> path to image
+    :param value: <list> [lat, long] of image
+    :param frame_idx: <int> position of image in the track
+    :return: <str>, <PIL.Image> path to output image, RGB image with map
+    """
+    st = _render_state
 
-        # initiate plots
-        fig, ax = plt.subplots()
+    frame = composite_frame(img_path, value, frame_idx)
 
-        # set farthest background layer as transparent
-        fig.patch.set_alpha(0.0)
+    # save target image to new location
+    img_out = os.path.splitext(img_path)[0] + MAP_SUFFIX + ".JPG"
+    if st['write_frames'] and not st['dryrun']:
+        common.save_jpeg(frame, img_out, preset=st['jpeg_preset'], exif=frame.info.get('exif'))
 
-        # disable map plot frame
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['bottom'].set_visible(False)
-        ax.spines['left'].set_visible(False)
+    return img_out, frame
 
-        ax.plot(longs, lats, linewidth=map_line_width, zorder=1)
-        if not breadcrumbs:
-            ax.plot(value[1], value[0], marker='o', zorder=2, color=map_point_color, markersize=map_point_size)
 
-        else:
-            if prev_pts:  # make breadcrumbs on plot
-                ax.scatter([lc[1] for lc in prev_pts], [lc[0] for lc in prev_pts], c=bc_point_color, s=bc_point_size,
-                           linewidth=0, zorder=2)
-                ax.plot(value[1], value[0], marker='o', color=map_point_color, markersize=map_point_size, zorder=3)
+def render_frames(frames):
+    """
+    Render a task of frames (see render_frame())
+
+    :param frames: <list> frame indices into the track in _render_state
+    :return: <list> raw RGB bytes of each frame if a video is written, otherwise empty
+    """
+    st = _render_state
+    raw_frames = []
+    for idx in frames:
+        _, frame = render_frame(st['paths'][idx], st['coords'][idx], idx)
+        if st['video']:
+            raw_frames.append(frame.tobytes())
+
+    return raw_frames
+
+
+def main(src, breadcrumbs, keep_map, dryrun, map_size, map_dpi, map_x, map_y, map_line_width, map_alpha, map_point_size,
+         map_point_color, bc_point_size, bc_point_color, workers=DEFAULT_WORKERS, video_out=None, fps=video.DEFAULT_FPS,
+         keep_frames=False, ffmpeg='ffmpeg', max_speed=None, simplify=0., basemap_src=None, basemap_zoom=None,
+         basemap_cache=basemap.DEFAULT_CACHE_DIR, basemap_alpha=DEFAULT_BASEMAP_ALPHA,
+         jpeg_preset=common.DEFAULT_JPEG_PRESET):
+    if not os.path.isdir(src):
+        raise Exception("src must be a directory")
 
-            else:
-                ax.plot(value[1], value[0], marker='o', color=map_point_color, markersize=map_point_size, zorder=2)
+    # any case of .jpg, in file name (capture time) order; skip '*_map.JPG' output of earlier runs
+    img_in = [p for p in frames.FrameIndex.scan(src, IMG_EXT).paths
+              if not os.path.splitext(p)[0].endswith(MAP_SUFFIX)]
 
-            prev_pts.append(value)
+    if not img_in:
+        raise Exception("could not find JPG images in {0}".format(src))
 
-        # set axes to specific alpha
-        ax.patch.set_alpha(map_alpha)
+    # read exif headers only (no pixel decode), in parallel
+    img_meta = exif.read_directory_metadata(img_in)
+
+    # convert gps tags of all images to [lat, long] at once
+    track, skipped = geotools.track_from_metadata(img_meta.values())
+
+    if not track.paths:
+        raise Exception("could not find coordinates in any image in {0}".format(src))
+
+    # write [lat, long] to dictonary key 'image.JPG'
+    if max_speed:
+        # keep every image: reject GPS jumps, and interpolate missing/rejected coordinates by capture time
+        img_coords = OrderedDict((i, None) for i in img_meta)
+        img_coords.update(zip(track.paths, zip(track.lats.tolist(), track.longs.tolist())))
+        times = [geotools.seconds_since_epoch(meta.timestamp) for meta in img_meta.values()]
+        img_coords, fixed = geotools.clean_coords(img_coords, times, max_speed=max_speed)
+        for i in fixed:
+            warnings.warn("Interpolated: missing or jumping coordinates for image {0}".format(i))
+    else:
+        for i in skipped:
+            warnings.warn("Skipping: Could not find coordinates for image {0}".format(i))
+        img_coords = OrderedDict(zip(track.paths, zip(track.lats.tolist(), track.longs.tolist())))
 
-        # exclude axes
-        ax.xaxis.set_visible(False)
-        ax.yaxis.set_visible(False)
+    lats = [lc[0] for lc in img_coords.values()]
+    longs = [lc[1] for lc in img_coords.values()]
 
-        # export as transparent
-        png_out = os.path.splitext(img_path)[0] + "_transparent.png"
+    # optionally plot the track line with fewer vertices (current location and breadcrumbs still use every image)
+    if simplify:
+        keep = geotools.simplify(lats, longs, simplify)
+        line_lats = [lats[k] for k in keep]
+        line_longs = [longs[k] for k in keep]
+    else:
+        line_lats, line_longs = lats, longs
+
+    # grab size of last image read (assuming all images are same size; to be used for scaling map later)
+    last_meta = next(reversed(img_meta.values()))
+    if last_meta.size is not None:
+        img_x, img_y = last_meta.size
+    else:
+        # no frame size in the header (e.g., a truncated file); let PIL try
+        try:
+            with Image.open(last_meta.path) as img:
+                img_x, img_y = img.size
+        except OSError as err:
+            raise Exception("could not read image size of {0}: {1}".format(last_meta.path, err))
 
-        fig.savefig(png_out)
-        plt.close('all')
+    map_x_dim, map_y_dim = geotools.calc_map_dims(img_x, img_y, map_size, map_dpi)
+
+    # set map within target image
+    map_y_pos = geotools.scale_map_to_img(map_y, img_y)
+    map_x_pos = geotools.scale_map_to_img(map_x, img_x)
 
-        # open target image
-        #base_img = common.open_image(img_path)
-        #map_img = common.open_image(png_out)
-        base_img = common.ImageIO(img_path)
-        map_img = common.ImageIO(png_out)
+    # stitch basemap tiles once (or load the cached mosaic); every frame reuses it as part of the static map layer
+    if basemap_src:
+        bbox = (min(lats), min(longs), max(lats), max(longs))
+        map_basemap = basemap.load_basemap(basemap_src, bbox, maprender.map_pixel_size(map_x_dim, map_y_dim),
+                                           zoom=basemap_zoom, cache_dir=basemap_cache)
+    else:
+        map_basemap = None
+
+    # each frame is rendered independently (breadcrumbs are derived from the frame's position in the track), so
+    # frames can be handed to any process in any order
+    write_video = bool(video_out) and not dryrun
+    state = {'paths': list(img_coords.keys()), 'coords': list(img_coords.values()), 'lats': lats, 'longs': longs,
+             'breadcrumbs': breadcrumbs, 'keep_map': keep_map, 'dryrun': dryrun, 'map_x_dim': map_x_dim,
+             'map_y_dim': map_y_dim, 'map_x_pos': map_x_pos, 'map_y_pos': map_y_pos, 'map_line_width': map_line_width,
+             'map_alpha': map_alpha, 'map_point_size': map_point_size, 'map_point_color': map_point_color,
+             'bc_point_size': bc_point_size, 'bc_point_color': bc_point_color, 'line_lats': line_lats,
+             'line_longs': line_longs, 'basemap': map_basemap, 'basemap_alpha': basemap_alpha,
+             'jpeg_preset': jpeg_preset, 'video': write_video, 'write_frames': not video_out or keep_frames}
 
-        # overlay PNG on target image
-        #base_img_rgba = base_img.convert("RGBA")
-        #map_img_rgba = map_img.convert("RGBA")
-        #base_img_rgba.paste(map_img_rgba, (map_x_pos, map_y_pos), map_img_rgba)
-        base_img_rgba = base_img.overlay(map_img, map_x_pos, map_y_pos)
+    total = len(img_coords)
+    if video_out:
+        # frames go to the video in track order; keep tasks small and bound the number in flight, so only a few
+        # decoded frames are held in memory at once
+        tasks = common.split_tasks(list(range(total)), VIDEO_TASK_SIZE)
+    else:
+        tasks = common.split_tasks(list(range(total)), common.task_size(total, workers))
+
+    if workers > 1:
+        results = common.schedule(render_frames, tasks, process_count=workers, ordered=write_video,
+                                  max_pending=workers * QUEUE_DEPTH if write_video else None,
+                                  initializer=init_render, initargs=(state,))
+    else:
+        init_render(state)
+        results = ((idx, render_frames(task)) for idx, task in enumerate(tasks))
+
+    writer = video.VideoWriter(video_out, img_x, img_y, fps=fps, ffmpeg=ffmpeg) if write_video else None
 
-        # save target image to new location
-        img_out = os.path.splitext(img_path)[0] + "_map.JPG"
-        if not dryrun:
-            # convert RGBA to RGB w/ mask (otherwise JPG format will not work)
-            # solution found at https://stackoverflow.com/a/9459208
-            #base_img_jpg_out = Image.new("RGB", base_img_rgba.size, (255, 255, 255))
-            #base_img_jpg_out.paste(base_img_rgba, mask=base_img_rgba.split()[3])
-            base_img_jpg_out = base_img_rgba.rgba_to_rgb_mask()
+    it = 0
+    try:
+        for idx, raw_frames in results:
+            for raw_frame in raw_frames:
+                writer.write(raw_frame)
+            it += len(tasks[idx])
+            common.progress(it, total, "maps plotted")
 
-            # write image to JPG file
-            base_img_jpg_out.save(img_out)
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
 
-        # clean up old transparency
-        if not keep_map:
-            os.remove(png_out)
+    if writer:
+        writer.close()
 
 
 if __name__ == "__main__":
@@ -203,13 +284,47 @@ if __name__ == "__main__":
     opt_flag.add_argument("--breadcrumbs", action="store_true",
                           help="Insert gray dots for previously visited location, relative to time series",
                           required=False)
-    opt_flag.add_argument("--keep-map", action="store_true", help="Save copy of map as separate image '*_map.JPG'",
-                          required=False)
+    opt_flag.add_argument("--keep-map", action="store_true",
+                          help="Save copy of map as separate image '*_transparent.png'", required=False)
     opt_flag.add_argument("--dryrun", action="store_true",
                           help="Run script, but do not alter files (cleans up all intermediate files)",
                           default=False)
+    opt_flag.add_argument("--workers", help="Number of processes rendering maps (default={0}; max={1})"
+                          .format(DEFAULT_WORKERS, common.DEFAULT_MAX_CPUS), type=int, default=DEFAULT_WORKERS,
+                          required=False)
+
+    opt_flag.add_argument("--video", help="Encode frames with map straight to this movie file (e.g., ride.mp4) via "
+                                           "ffmpeg, instead of writing '*_map.JPG' images", dest="video_out",
+                          required=False)
+    opt_flag.add_argument("--fps", help="Frame rate of --video (default={0})".format(video.DEFAULT_FPS),
+                          default=video.DEFAULT_FPS, type=float, required=False)
+    opt_flag.add_argument("--keep-frames", action="store_true",
+                          help="With --video, also write '*_map.JPG' images", required=False)
+    opt_flag.add_argument("--ffmpeg", help="Path to ffmpeg executable used by --video (default=ffmpeg)",
+                          default='ffmpeg', required=False)
+
+    opt_flag.add_argument("--jpeg-preset", help="JPEG encoder settings of '*_map.JPG' images: fast, balanced or "
+                                                "archival (default={0})".format(common.DEFAULT_JPEG_PRESET),
+                          choices=sorted(common.JPEG_PRESETS), default=common.DEFAULT_JPEG_PRESET, required=False)
+    opt_flag.add_argument("--max-speed", help="Treat GPS fixes implying more than this speed (meters/second) as jumps; "
+                                               "jumps and images without coordinates get coordinates interpolated "
+                                               "by capture time (default=off; e.g., {0})"
+                          .format(geotools.DEFAULT_MAX_SPEED), type=float, required=False)
+    opt_flag.add_argument("--simplify", help="Simplify plotted track line, dropping vertices closer than this many "
+                                             "meters to the line (default=0, off)", default=0., type=float,
+                          required=False)
 
     # optional map args
+    opt_map.add_argument("--basemap", help="Draw map tiles behind the track, from a local {z}/{x}/{y}.png tile "
+                                           "directory or an .mbtiles file (default=none)", dest="basemap_src",
+                         required=False)
+    opt_map.add_argument("--basemap-zoom", help="Tile zoom level of basemap (default=lowest zoom that covers the map "
+                                                "at full resolution)", type=int, required=False)
+    opt_map.add_argument("--basemap-cache", help="Directory of cached basemap mosaics (default={0})"
+                         .format(basemap.DEFAULT_CACHE_DIR), default=basemap.DEFAULT_CACHE_DIR, required=False)
+    opt_map.add_argument("--basemap-alpha", help="Level of transparency of basemap (range=(0.0,1.0), default={0})"
+                         .format(DEFAULT_BASEMAP_ALPHA), type=restricted_float, default=DEFAULT_BASEMAP_ALPHA,
+                         required=False)
     opt_map.add_argument("--map-size",
                          help="Percent of image space of which the map will occupy (range=(0, 100), default=20)",
                          default=20, type=restricted_int, required=False)
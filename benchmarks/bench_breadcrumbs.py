@@ -0,0 +1,95 @@
+"""
+bench_breadcrumbs.py
+
+Purpose: compare breadcrumb rendering cost along a synthetic track: redrawing every previous point each frame (as
+         add_map_to_timelapse.py used to) versus the incremental breadcrumb layer of lib.maprender.MapRenderer.
+         Per-frame time is sampled at several positions along the track; the full-redraw cost grows with the
+         position (quadratic total), the incremental cost stays flat (linear total).
+
+Usage (from repository root):
+    python -m benchmarks.bench_breadcrumbs --points 10000
+"""
+import time
+import numpy as np
+
+from lib import maprender
+
+
+def synthetic_track(points):
+    """
+    :param points: <int>
+    :return: <list>, <list> lats, longs of a looping synthetic ride
+    """
+    t = np.linspace(0, 6 * np.pi, points)
+    lats = 44.0 + 0.05 * np.sin(t) + 0.0001 * t
+    longs = -94.0 + 0.05 * np.cos(1.5 * t)
+
+    return lats.tolist(), longs.tolist()
+
+
+def make_renderer(lats, longs):
+    return maprender.MapRenderer(lats, longs, 4.6, 3.1, map_line_width=3, map_alpha=0.25, map_point_size=25,
+                                 map_point_color='red', bc_point_size=10, bc_point_color='gray')
+
+
+def render_full_redraw(renderer, value, breadcrumb_count):
+    # previous behavior: scatter every previous point on every frame
+    renderer.canvas.restore_region(renderer.background)
+    if breadcrumb_count:
+        renderer.breadcrumbs.set_offsets(renderer.crumb_offsets[:breadcrumb_count])
+        renderer.ax.draw_artist(renderer.breadcrumbs)
+    renderer.point.set_data([value[1]], [value[0]])
+    renderer.ax.draw_artist(renderer.point)
+
+    return np.array(renderer.canvas.buffer_rgba())
+
+
+def main(points=10000, samples=5, window=50):
+    lats, longs = synthetic_track(points)
+    coords = list(zip(lats, longs))
+    starts = np.linspace(0, points - window, samples).astype(int)
+
+    full = make_renderer(lats, longs)
+    full_ms = []
+    for start in starts:
+        t0 = time.time()
+        for idx in range(start, start + window):
+            render_full_redraw(full, coords[idx], idx)
+        full_ms.append(1000 * (time.time() - t0) / window)
+
+    incremental = make_renderer(lats, longs)
+    incremental_ms = []
+    for start in starts:
+        # bring the layer up to the sample position (as rendering all previous frames would)
+        incremental.render(coords[start], start)
+        t1 = time.time()
+        for idx in range(start, start + window):
+            incremental.render(coords[idx], idx)
+        incremental_ms.append(1000 * (time.time() - t1) / window)
+
+    t0 = time.time()
+    run = make_renderer(lats, longs)
+    for idx, value in enumerate(coords):
+        run.render(value, idx)
+    incremental_total = time.time() - t0
+
+    print("{0} point track, per-frame ms sampled over {1} frames".format(points, window))
+    print("{0:>8} {1:>14} {2:>14}".format("frame", "full redraw", "incremental"))
+    for start, f_ms, i_ms in zip(starts, full_ms, incremental_ms):
+        print("{0:>8} {1:>14.2f} {2:>14.2f}".format(start, f_ms, i_ms))
+    print("incremental total for all {0} frames: {1:.1f}s".format(points, incremental_total))
+    print("full redraw total (estimated from samples): {0:.1f}s".format(np.mean(full_ms) * points / 1000))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark breadcrumb rendering")
+    parser.add_argument("--points", help="Number of track points/frames (default=10000)", type=int, default=10000)
+    parser.add_argument("--samples", help="Number of positions along the track to sample (default=5)", type=int,
+                        default=5)
+    parser.add_argument("--window", help="Frames timed per sample (default=50)", type=int, default=50)
+
+    arguments = parser.parse_args()
+
+    main(**vars(arguments))
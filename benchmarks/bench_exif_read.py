@@ -0,0 +1,98 @@
+"""
+bench_exif_read.py
+
+Purpose: compare reading GPS tags with a full common.ImageIO per frame (the original add_map_to_timelapse loop)
+         against the header-only, threaded lib.exif reader.
+
+Usage (from repository root):
+    python -m benchmarks.bench_exif_read <dir of *.JPG>
+    python -m benchmarks.bench_exif_read --synthetic 500
+"""
+import os
+import glob
+import time
+import shutil
+import tempfile
+import PIL.Image
+
+from lib import common, exif
+
+
+def make_synthetic_frames(dst, count, size=(2304, 1536)):
+    """
+    Write geotagged JPG frames to dst
+
+    :param dst: <str> output dir
+    :param count: <int> number of frames
+    :param size: <tuple> frame size
+    :return: <list> frame paths
+    """
+    frame = PIL.Image.effect_noise(size, 64).convert('RGB')
+    paths = []
+    for i in range(count):
+        tags = PIL.Image.Exif()
+        tags[exif.TAG_DATETIME] = "2018:05:12 10:{0:02d}:{1:02d}".format(i // 60 % 60, i % 60)
+        gps = tags.get_ifd(exif.TAG_GPS_IFD)
+        gps[1] = 'N'
+        gps[2] = (44.0, 11.0, 10.0 + i * 0.01)
+        gps[3] = 'W'
+        gps[4] = (94.0, 0.0, 17.0 + i * 0.01)
+        path = os.path.join(dst, "GOPR{0:05d}.JPG".format(i))
+        frame.save(path, exif=tags)
+        paths.append(path)
+
+    return paths
+
+
+def read_with_imageio(paths):
+    gps = []
+    for path in paths:
+        with common.ImageIO(path) as image:
+            gps.append(image.image_exif.get(exif.TAG_GPS_IFD))
+            image.get_size()
+
+    return gps
+
+
+def main(src=None, synthetic=0, threads=exif.DEFAULT_THREADS):
+    tmp_dir = None
+    if synthetic:
+        tmp_dir = tempfile.mkdtemp()
+        paths = make_synthetic_frames(tmp_dir, synthetic)
+    else:
+        paths = sorted(glob.glob(os.path.join(src, "*.JPG")))
+    if not paths:
+        raise Exception("No JPG frames to read")
+
+    try:
+        t0 = time.time()
+        read_with_imageio(paths)
+        t_imageio = time.time() - t0
+
+        t0 = time.time()
+        exif.read_directory_metadata(paths, threads=threads, show_progress=False)
+        t_header = time.time() - t0
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+    print("{0} frames".format(len(paths)))
+    print("ImageIO loop:        {0:.3f}s ({1:.2f} ms/frame)".format(t_imageio, 1000 * t_imageio / len(paths)))
+    print("header-only reader:  {0:.3f}s ({1:.2f} ms/frame, {2} threads)".format(
+        t_header, 1000 * t_header / len(paths), threads))
+    print("speedup:             {0:.1f}x".format(t_imageio / t_header))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark EXIF/GPS extraction")
+    parser.add_argument("src", nargs='?', help="Dir containing *.JPG images")
+    parser.add_argument("--synthetic", help="Generate this many synthetic geotagged frames instead of using src",
+                        type=int, default=0)
+    parser.add_argument("--threads", help="Reader threads (default={})".format(exif.DEFAULT_THREADS),
+                        type=int, default=exif.DEFAULT_THREADS)
+
+    arguments = parser.parse_args()
+
+    main(**vars(arguments))
@@ -0,0 +1,83 @@
+"""
+bench_jpeg_presets.py
+
+Purpose: report encode time and output size of each JPEG preset (common.JPEG_PRESETS) used for frames written by
+         add_map_to_timelapse.py, on captures from a directory, or on a synthetic 2304x1536 scene if none is given.
+
+Usage (from repository root):
+    python -m benchmarks.bench_jpeg_presets --src /path/to/captures --count 10
+"""
+import io
+import os
+import glob
+import time
+import PIL.Image
+import PIL.ImageFilter
+
+from lib import common
+
+
+def synthetic_capture(size=(2304, 1536)):
+    """
+    Smooth gradient (sky) plus blurred noise (texture), as a stand-in for a real capture
+
+    :param size: <tuple>
+    :return: <PIL.Image> RGB
+    """
+    sky = PIL.Image.linear_gradient('L').resize(size).convert('RGB')
+    texture = PIL.Image.effect_noise(size, 80).filter(PIL.ImageFilter.GaussianBlur(1.5)).convert('RGB')
+    return PIL.Image.blend(sky, texture, 0.5)
+
+
+def load_captures(src, count):
+    """
+    :param src: <str> directory of JPG captures (default=None, synthetic)
+    :param count: <int> max number of captures
+    :return: <list> (RGB image, raw EXIF) tuples
+    """
+    if not src:
+        return [(synthetic_capture(), None)]
+
+    captures = []
+    for path in sorted(glob.glob(os.path.join(src, "*.JPG")) + glob.glob(os.path.join(src, "*.jpg")))[:count]:
+        with PIL.Image.open(path) as image:
+            captures.append((image.convert('RGB'), image.info.get('exif')))
+    if not captures:
+        raise Exception("could not find JPG images in {0}".format(src))
+
+    return captures
+
+
+def main(src=None, count=10, repeat=3):
+    captures = load_captures(src, count)
+    size = captures[0][0].size
+    print("{0} capture(s) of {1}x{2}, best of {3} runs".format(len(captures), size[0], size[1], repeat))
+    print("{0:>10} {1:>12} {2:>12}".format("preset", "ms/frame", "KB/frame"))
+
+    for preset in sorted(common.JPEG_PRESETS, key=lambda p: common.JPEG_PRESETS[p]['quality']):
+        best = None
+        total_bytes = 0
+        for _ in range(repeat):
+            total_bytes = 0
+            t0 = time.time()
+            for image, raw_exif in captures:
+                buf = io.BytesIO()
+                common.save_jpeg(image, buf, preset=preset, exif=raw_exif)
+                total_bytes += buf.tell()
+            elapsed = time.time() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        print("{0:>10} {1:>12.1f} {2:>12.0f}".format(preset, 1000 * best / len(captures),
+                                                     total_bytes / 1024. / len(captures)))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark JPEG presets")
+    parser.add_argument("--src", help="Directory of JPG captures (default=synthetic 2304x1536 scene)", required=False)
+    parser.add_argument("--count", help="Max number of captures to encode (default=10)", type=int, default=10)
+    parser.add_argument("--repeat", help="Runs per preset; the fastest is reported (default=3)", type=int, default=3)
+
+    arguments = parser.parse_args()
+
+    main(**vars(arguments))
@@ -0,0 +1,73 @@
+"""
+bench_task_payload.py
+
+Purpose: measure the bytes pickled and sent to worker processes per classify() task, when the classifier is passed
+         with every task versus loaded once per worker by the pool initializer (the current behavior).
+
+Usage (from repository root):
+    python -m benchmarks.bench_task_payload -m model.pkl
+    python -m benchmarks.bench_task_payload --support-vectors 5000
+"""
+import pickle
+import functools
+import numpy as np
+from sklearn import svm
+
+import classify_images
+from lib import common
+
+
+def synthetic_classifier(support_vectors, features=64):
+    """
+    Fit an RBF SVM on overlapping classes, so nearly every training vector becomes a support vector
+
+    :param support_vectors: <int> approximate number of support vectors
+    :param features: <int> feature vector length
+    :return: <sklearn.svm.SVC>
+    """
+    rng = np.random.RandomState(0)
+    data = rng.rand(support_vectors, features)
+    target = rng.randint(0, 2, support_vectors)
+
+    return svm.SVC(kernel='rbf', C=1, gamma=0.01).fit(data, target)
+
+
+def main(model=None, support_vectors=2000, images=10000, threads=common.DEFAULT_MAX_CPUS):
+    if model:
+        classifier = classify_images.load_model(model).best_estimator_
+    else:
+        classifier = synthetic_classifier(support_vectors)
+
+    paths = ["/home/pi/capture/{0:014d}.jpg".format(20200101000000 + i) for i in range(images)]
+    tasks = common.split_tasks(paths, common.task_size(len(paths), threads))
+
+    per_task = functools.partial(classify_images.apply_classifier, classifier=classifier)
+    per_worker = functools.partial(classify_images.apply_worker_classifier)
+
+    before = len(pickle.dumps((per_task, tasks[0])))
+    after = len(pickle.dumps((per_worker, tasks[0])))
+    model_bytes = len(pickle.dumps(classifier))
+
+    print("{0} support vectors, {1} images in {2} tasks of {3} images, {4} processes".format(
+        classifier.support_vectors_.shape[0], images, len(tasks), len(tasks[0]), threads))
+    print("classifier sent with every task:  {0:>12,} bytes/task  {1:>15,} bytes total".format(
+        before, before * len(tasks)))
+    print("classifier loaded once per worker: {0:>11,} bytes/task  {1:>15,} bytes total".format(
+        after, after * len(tasks) + model_bytes * threads))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure pickled bytes per classification task")
+    parser.add_argument("-m", help="Path to model file (default: fit a synthetic SVM)", dest="model")
+    parser.add_argument("--support-vectors", help="Support vectors of the synthetic SVM (default=2000)", type=int,
+                        default=2000)
+    parser.add_argument("--images", help="Number of images to split into tasks (default=10000)", type=int,
+                        default=10000)
+    parser.add_argument("--threads", help="Number of processes (default={})".format(common.DEFAULT_MAX_CPUS),
+                        type=int, default=common.DEFAULT_MAX_CPUS)
+
+    arguments = parser.parse_args()
+
+    main(**vars(arguments))
@@ -0,0 +1,75 @@
+"""
+bench_track.py
+
+Purpose: compare converting GPS tags of a whole sequence with geotools.track_from_metadata() (one vectorized pass,
+         plus distance/speed/bbox) against calling geotools.get_coords() per image, on synthetic GoPro-style tags.
+         Also reports how far the per-image get_dd() conversion (which treats the seconds rational as decimal
+         minutes) strays from degrees + minutes/60 + seconds/3600.
+
+Usage (from repository root):
+    python -m benchmarks.bench_track --count 100000
+"""
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+from lib import exif, geotools
+
+
+def synthetic_metadata(count):
+    """
+    :param count: <int>
+    :return: <list> exif.ImageMetadata with GPS rationals as stored by GoPro cameras
+    """
+    rng = np.random.default_rng(0)
+    lats = 44.0 + np.cumsum(rng.normal(0, 2e-5, count))
+    longs = -94.0 + np.cumsum(rng.normal(0, 2e-5, count))
+    start = datetime(2018, 1, 1, 8)
+
+    def rationals(dd):
+        dd = abs(dd)
+        deg = int(dd)
+        minutes = int((dd - deg) * 60)
+        seconds = (dd - deg - minutes / 60.) * 3600
+        return ((deg, 1), (minutes, 1), (int(round(seconds * 1e7)), 10000000))
+
+    out = []
+    for i in range(count):
+        gps = {1: 'N', 2: rationals(lats[i]), 3: 'W', 4: rationals(longs[i])}
+        out.append(exif.ImageMetadata("GOPR{0:06d}.JPG".format(i), gps, (4000, 3000), start + timedelta(seconds=i)))
+
+    return out
+
+
+def main(count=100000):
+    metadata = synthetic_metadata(count)
+
+    t0 = time.time()
+    per_image = [geotools.get_coords(meta.gps) for meta in metadata]
+    per_image_secs = time.time() - t0
+
+    t0 = time.time()
+    track, _ = geotools.track_from_metadata(metadata)
+    track_secs = time.time() - t0
+
+    per_image = np.array(per_image)
+    err_m = geotools.haversine(per_image[:, 0], per_image[:, 1], track.lats, track.longs)
+
+    print("{0} synthetic tags".format(count))
+    print("get_coords() per image:         {0:.3f}s ({1:.2f} us/tag)".format(per_image_secs,
+                                                                           1e6 * per_image_secs / count))
+    print("track_from_metadata() (+speed): {0:.3f}s ({1:.2f} us/tag)".format(track_secs, 1e6 * track_secs / count))
+    print("speedup: {0:.1f}x".format(per_image_secs / track_secs))
+    print("get_coords() position error vs DMS: median {0:.1f} m, max {1:.1f} m".format(np.median(err_m), err_m.max()))
+    print("track length {0:.1f} km, bbox {1}".format(track.distance.sum() / 1000., track.bbox))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark GPS track conversion")
+    parser.add_argument("--count", help="Number of synthetic tags (default=100000)", type=int, default=100000)
+
+    arguments = parser.parse_args()
+
+    main(**vars(arguments))
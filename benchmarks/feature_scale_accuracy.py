@@ -0,0 +1,97 @@
+"""
+feature_scale_accuracy.py
+
+Purpose: report how reduced-resolution feature extraction (--feature-scale) changes classification results, relative
+         to full resolution feature vectors, on a labeled set of images.
+
+Usage (from repository root):
+    python -m benchmarks.feature_scale_accuracy --pos good/ --neg bad/ -m model.pkl --scales 2 4 8 512
+"""
+import os
+import glob
+import time
+import pickle
+import numpy as np
+
+from lib import common
+
+
+logger = common.logger
+
+
+def vectorize(images, feature_scale):
+    """
+    Vectorize images at a given feature scale
+
+    :param images: <list> image paths
+    :param feature_scale: <int>
+    :return: <numpy.ndarray>, <float> vectors (one row per image) and seconds elapsed
+    """
+    t0 = time.time()
+    vectors = [common.ImageIO(img).get_feature_vector(feature_scale=feature_scale) for img in images]
+
+    return np.array(vectors), time.time() - t0
+
+
+def main(group_a, group_b, model, img_ext='.jpg', scales=(2, 4, 8)):
+    """
+    :param group_a: <str> dir of positive/good images (label 1)
+    :param group_b: <str> dir of negative/bad images (label 0)
+    :param model: <str> path to model file made by generate_classifier.py
+    :param img_ext: <str> image extension (e.g., '.jpg')
+    :param scales: <list> feature scales to compare against full resolution
+    :return: <list> one dict of statistics per scale
+    """
+    images_a = sorted(glob.glob(os.path.join(group_a, '*' + img_ext)))
+    images_b = sorted(glob.glob(os.path.join(group_b, '*' + img_ext)))
+    if not images_a or not images_b:
+        raise Exception("Could not find *{0} images in {1} and {2}".format(img_ext, group_a, group_b))
+    images = images_a + images_b
+    labels = np.array([1] * len(images_a) + [0] * len(images_b))
+
+    classifier = pickle.load(open(model, 'rb')).best_estimator_
+
+    full_vec, full_time = vectorize(images, 1)
+    full_pred = classifier.predict(full_vec)
+
+    stats = [{'scale': 1, 'seconds': full_time, 'l1': 0.0, 'agreement': 1.0,
+              'accuracy': float(np.mean(full_pred == labels))}]
+    for scale in scales:
+        common.check_feature_scale(scale)
+        vec, elapsed = vectorize(images, scale)
+        pred = classifier.predict(vec)
+        stats.append({'scale': scale,
+                      'seconds': elapsed,
+                      'l1': float(np.mean(np.abs(vec - full_vec).sum(axis=1))),
+                      'agreement': float(np.mean(pred == full_pred)),
+                      'accuracy': float(np.mean(pred == labels))})
+
+    print("{0} images ({1} positive, {2} negative)".format(len(images), len(images_a), len(images_b)))
+    print("{0:>8} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10}".format("scale", "seconds", "speedup", "mean L1",
+                                                                   "agreement", "accuracy"))
+    for row in stats:
+        print("{0:>8} {1:>10.2f} {2:>10.1f} {3:>10.4f} {4:>10.3f} {5:>10.3f}".format(
+            row['scale'], row['seconds'], full_time / row['seconds'], row['l1'], row['agreement'], row['accuracy']))
+
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare classification at reduced feature scales against full "
+                                                 "resolution")
+
+    req_named = parser.add_argument_group("Required named arguments")
+
+    req_named.add_argument("--pos", help="Dir of positive/good images", dest="group_a", required=True)
+    req_named.add_argument("--neg", help="Dir of negative/bad images", dest="group_b", required=True)
+    req_named.add_argument("-m", help="Path to model file", dest="model", required=True)
+
+    parser.add_argument("-e", help="Image extension (default=.jpg)", dest="img_ext", default='.jpg', required=False)
+    parser.add_argument("--scales", help="Feature scales to compare (default=2 4 8)", nargs='+', type=int,
+                        default=[2, 4, 8], required=False)
+
+    arguments = parser.parse_args()
+
+    main(**vars(arguments))
@@ -10,53 +10,122 @@ Python version: 3.8.2
 """
 import os
 import glob
+import pickle
+import functools
 from itertools import chain
 import numpy as np
-import multiprocessing as mp
 
-from lib import common
+from lib import cache, common
 
 
 logger = common.logger
 
 
-def apply_classifier(image, classifier):
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_CHUNK_SIZE = 8  # images per vectorization task in classify_stream()
+QUEUE_DEPTH = 2  # vectorization tasks queued per process in classify_stream()
+
+_worker_classifier = None  # set in each worker process by init_worker_classifier()
+
+
+def predict_batches(classifier, vectors, batch_size=DEFAULT_BATCH_SIZE, scores=False):
     """
+    Predict classes for a list of feature vectors, in batches
 
-    :param image: <list>
-    :param classifier:
+    :param classifier: fitted sklearn estimator
+    :param vectors: <list or numpy.ndarray> feature vectors, one per image
+    :param batch_size: <int> number of vectors per predict() call
+    :param scores: <bool> also return decision_function() scores
+    :return: <list>, <list> classes (0 or 1), and scores (None if scores=False), in the order of vectors
+    """
+    if batch_size < 1:
+        raise Exception("batch_size must be greater than 0, value supplied: {}".format(batch_size))
+
+    matrix = np.ascontiguousarray(vectors, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+
+    classes = []
+    decision = [] if scores else None
+    for start in range(0, matrix.shape[0], batch_size):
+        batch = matrix[start:start + batch_size]
+        # run classifier to determine if image is in group A (1) or group B (0)
+        classes.extend(classifier.predict(batch).tolist())
+        if scores:
+            decision.extend(classifier.decision_function(batch).tolist())
+
+    return classes, decision
+
+
+def load_model(model):
+    """
+    Load model file made by generate_classifier.py (if not already loaded)
+
+    :param model: <str or sklearn.grid_search.GridSearchCV> path to model file, or the model itself
+    :return: <sklearn.grid_search.GridSearchCV>
+    """
+    if isinstance(model, str):
+        with open(model, 'rb') as f:
+            return pickle.load(f)
+    return model
+
+
+def init_worker_classifier(model):
+    """
+    Pool initializer: load the classifier once per worker process, so tasks only carry image paths
+
+    :param model: <str or sklearn.grid_search.GridSearchCV> path to model file, or the model itself
     :return:
     """
-    img_and_class = []
-    for img in image:
-        logger.debug("   classifying {} ...".format(img))
-        # read target image(s)
-        img_open = common.ImageIO(img)
+    global _worker_classifier
+    _worker_classifier = load_model(model).best_estimator_
 
-        img_vec = img_open.get_feature_vector()
 
-        # reshape vector (sklearn >= 0.19 requires this)
-        np_vec = np.array(img_vec).reshape((len(img_vec), 1)).reshape(1, -1)
+def apply_worker_classifier(image, **kwargs):
+    """
+    apply_classifier() using the classifier loaded by init_worker_classifier()
 
-        # run classifier to determine if image is in group A (1) or group B (0)
-        img_class = classifier.predict(np_vec)
+    :param image: <list>
+    :param kwargs: keyword arguments of apply_classifier()
+    :return: <list>
+    """
+    return apply_classifier(image, _worker_classifier, **kwargs)
 
-        img_and_class.append((img, img_class))
 
-    return img_and_class
+def apply_classifier(image, classifier, feature_scale=common.DEFAULT_FEATURE_SCALE, cache_path=None,
+                     cache_size=cache.DEFAULT_CACHE_SIZE, batch_size=DEFAULT_BATCH_SIZE, scores=False):
+    """
 
+    :param image: <list>
+    :param classifier:
+    :param feature_scale: <int> resolution reduction applied before vectorizing (see common.reduce_for_features)
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :param batch_size: <int> number of images per predict() call
+    :param scores: <bool> append the decision_function() score to each result
+    :return: <list> (/path/to/image.ext, 0_or_1) or (/path/to/image.ext, 0_or_1, score), in the order of image
+    """
+    # read target image(s)
+    img_vecs = cache.vectorize(image, feature_scale=feature_scale, cache_path=cache_path, cache_size=cache_size)
+    if not img_vecs:
+        return []
+
+    logger.debug("   classifying {} images ...".format(len(image)))
+    img_class, img_score = predict_batches(classifier, img_vecs, batch_size=batch_size, scores=scores)
 
-def classify(img_in, img_ext, model, threads=1, subset_count=False):
+    if scores:
+        return list(zip(image, img_class, img_score))
+    return list(zip(image, img_class))
+
+
+def find_images(img_in, img_ext, subset_count=False):
     """
-    Classify images, return text file of file paths of grouped images.
+    Find images to classify
 
     :param img_in: <str> Path to images to be classified
     :param img_ext: <str> Image extension, e.g., '.jpg'
-    :param model: <sklearn.grid_search.GridSearchCV> model file (hint: read with pickle.load())
-    :param threads: <int> number of threads to use for image classification process (default=1)
     :param subset_count: <int> subset number of test images to use instead of the entire dataset
-
-    :return: <list> zipped with (/path/to/image.ext, 0_or_1)
+    :return: <list> image paths
     """
     # find images
     img_path = os.path.join(img_in, '*' + img_ext)
@@ -75,26 +144,90 @@ def classify(img_in, img_ext, model, threads=1, subset_count=False):
         logger.info("Subset specified, using only first {} images".format(subset_count))
         img = img[0:subset_count]
 
-    # get the best estimate from the classifier
-    logger.info("Getting classifier ...")
-    classifier = model.best_estimator_
+    return img
+
+
+def classify_stream(img, model, threads=1, feature_scale=common.DEFAULT_FEATURE_SCALE, cache_path=None,
+                    cache_size=cache.DEFAULT_CACHE_SIZE, batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE,
+                    scores=False):
+    """
+    Classify images as a stream: worker processes vectorize small chunks of images (see common.schedule()), at most
+    QUEUE_DEPTH chunks per process are pending at once, and the classifier is applied to each chunk as soon as it is
+    ready.
+
+    :param img: <list> image paths
+    :param model: <str or sklearn.grid_search.GridSearchCV> path to model file, or model (hint: read with
+                  pickle.load()); the classifier runs in the calling process, so it is never sent to workers
+    :param threads: <int> number of processes used to vectorize images (default=1)
+    :param feature_scale: <int> resolution reduction applied before vectorizing; should match the value used to
+                          train the model
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :param batch_size: <int> max number of images per predict() call
+    :param chunk_size: <int> number of images per vectorization task
+    :param scores: <bool> include the decision_function() score as a third item of each result
+    :return: <generator> yields (/path/to/image.ext, 0_or_1), in the order of img
+    """
+    classifier = load_model(model).best_estimator_
+    chunks = common.split_tasks(img, chunk_size)
+    vectorize_task = functools.partial(cache.vectorize_with_stats, feature_scale=feature_scale, cache_path=cache_path,
+                                       cache_size=cache_size)
+    hits = misses = 0
+
+    for idx, (img_vecs, chunk_hits, chunk_misses) in common.schedule(vectorize_task, chunks, process_count=threads,
+                                                                     max_pending=threads * QUEUE_DEPTH):
+        hits += chunk_hits
+        misses += chunk_misses
+
+        img_class, img_score = predict_batches(classifier, img_vecs, batch_size=batch_size, scores=scores)
+        if scores:
+            for out in zip(chunks[idx], img_class, img_score):
+                yield out
+        else:
+            for out in zip(chunks[idx], img_class):
+                yield out
+
+    if cache_path:
+        logger.info("feature cache: {0} hits, {1} misses".format(hits, misses))
+    cache.evict_cache(cache_path, cache_size)
+
+
+def classify(img_in, img_ext, model, threads=1, subset_count=False, feature_scale=common.DEFAULT_FEATURE_SCALE,
+             cache_path=None, cache_size=cache.DEFAULT_CACHE_SIZE, batch_size=DEFAULT_BATCH_SIZE, scores=False):
+    """
+    Classify images, return text file of file paths of grouped images.
+
+    :param img_in: <str> Path to images to be classified
+    :param img_ext: <str> Image extension, e.g., '.jpg'
+    :param model: <str or sklearn.grid_search.GridSearchCV> path to model file, or model (hint: read with
+                  pickle.load()); loaded once per worker process
+    :param threads: <int> number of threads to use for image classification process (default=1)
+    :param subset_count: <int> subset number of test images to use instead of the entire dataset
+    :param feature_scale: <int> resolution reduction applied before vectorizing; should match the value used to
+                          train the model
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :param batch_size: <int> number of images per predict() call
+    :param scores: <bool> include the decision_function() score as a third item of each result
+
+    :return: <list> zipped with (/path/to/image.ext, 0_or_1)
+    """
+    img = find_images(img_in, img_ext, subset_count=subset_count)
 
     # output = []
     # counter = 0
     logger.info("Applying classifier to each image ...")
 
-    batch_imgs = common.batch_split(input_values=img, process_count=threads)
-    # send batches to unique processes
-    pool = mp.Pool(processes=threads)
-    classification_out = []
-    try:
-        results = [pool.apply_async(apply_classifier, args=(i, classifier, )) for i in batch_imgs.values()]
-        classification_out = [p.get() for p in results]
-    except KeyboardInterrupt:
-        pool.terminate()
-        logger.info("pool terminated.")
-
-    logger.debug("classification_out[0][0]: {}".format(classification_out[0][0]))
+    # hand out small tasks, so processes that finish early pick up more work; the classifier is loaded once per
+    # process by the pool initializer, so tasks only carry image paths
+    tasks = common.split_tasks(img, common.task_size(len(img), threads))
+    classify_task = functools.partial(apply_worker_classifier, feature_scale=feature_scale, cache_path=cache_path,
+                                      cache_size=cache_size, batch_size=batch_size, scores=scores)
+    classification_out = [result for _, result in common.schedule(classify_task, tasks, process_count=threads,
+                                                                   initializer=init_worker_classifier,
+                                                                   initargs=(model,))]
+    cache.evict_cache(cache_path, cache_size)
+
     # un-nest lists
     classication_unnested = list(chain(*classification_out))
     logger.debug("len(classification_unnested): {}".format(len(classication_unnested)))
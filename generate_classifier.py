@@ -18,34 +18,42 @@ day-and-night-an-image-classifier-with-scikit-learn/
 """
 import os
 import glob
+import io
 import json
 import time
-import multiprocessing as mp
+import functools
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn import svm
 import pickle
+import numpy as np
 
-from lib import common
+from lib import cache, common
 
 
 DEFAULT_MAX_CPUS = common.DEFAULT_MAX_CPUS
+VECTOR_FORMATS = ['json', 'npy']
+DEFAULT_VECTOR_FORMAT = 'json'
+FEATURE_BLOCKS = 4  # blocks per RGB channel of the color histogram (see cache.vectorize)
+VECTOR_STORE_NAME = 'image_vectors_blocks{0}_scale{1}.npy'  # one store per feature settings
+VECTOR_FILE_EXTS = ('.json', '.npy')
 logger = common.logger
 
 
-def calc_img_vector(img_path):
+def calc_img_vector(img_path, feature_scale=common.DEFAULT_FEATURE_SCALE, cache_path=None,
+                    cache_size=cache.DEFAULT_CACHE_SIZE):
     """
 
     :param img_path: <str or list>
-    :return: <ImageIO object OR list of ImageIO objects>
+    :param feature_scale: <int> resolution reduction applied before vectorizing (see common.reduce_for_features)
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :return: <list> feature vector(s)
     """
     if type(img_path) == str:
         img_path = [img_path]
-    image = []
-    for img in img_path:
-        logger.debug("     reading image {} ...".format(img))
-        image.append(common.ImageIO(img).get_feature_vector())
 
-    return image
+    return cache.vectorize(img_path, blocks=FEATURE_BLOCKS, feature_scale=feature_scale, cache_path=cache_path,
+                           cache_size=cache_size)
 
 
 def train_classifier(train_a, train_b, class_out):
@@ -56,8 +64,8 @@ def train_classifier(train_a, train_b, class_out):
     :param class_out: <str> path to output
     :return: <sklearn.grid_search.GridSearchCV> training model (also pickles to file)
     """
-    # combine good and bad vectors
-    data = train_a + train_b
+    # combine good and bad vectors (lists from JSON files, or arrays from .npy vector stores)
+    data = np.vstack([train_a, train_b])
 
     # allocate training classes for each image vector
     target = [1] * len(train_a) + [0] * len(train_b)
@@ -99,10 +107,13 @@ def get_files(f_path, f_pattern):
 def read_vector_file(vec_path):
     """
 
-    :param vec_path:
-    :return:
+    :param vec_path: <str> path to .json vector file or .npy vector store
+    :return: <list or numpy.ndarray>
     """
-    logger.info("     reading vector file {} ...")
+    if os.path.splitext(vec_path)[1] == '.npy':
+        return read_vector_store(vec_path)[0]
+
+    logger.info("     reading vector file {} ...".format(vec_path))
     with open(vec_path) as f:
         output = json.load(f)
     logger.info("     ... done")
@@ -125,39 +136,255 @@ def write_vector_file(vec_path, data):
     logger.info("     ... done")
 
 
-def thread_image_vectorization(group, img_ext, thread_count):
+def vector_store_sources(store_path):
+    """
+    Path of the sidecar file listing the source image of each row in a vector store
+
+    :param store_path: <str> path to .npy vector store
+    :return: <str>
+    """
+    return os.path.splitext(store_path)[0] + '.txt'
+
+
+def vector_store_name(feature_scale=common.DEFAULT_FEATURE_SCALE, blocks=FEATURE_BLOCKS):
+    """
+    :param feature_scale: <int>
+    :param blocks: <int>
+    :return: <str> file name of the vector store holding vectors computed with these settings
+    """
+    return VECTOR_STORE_NAME.format(blocks, feature_scale)
+
+
+def source_stat(path):
+    """
+    :param path: <str> image path
+    :return: <tuple> (size, mtime_ns), used to tell whether an image changed since it was vectorized
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_store_sources(store_path):
+    """
+    Read the sidecar of a vector store; each line is 'path<TAB>size<TAB>mtime_ns' (or only the path, if unknown)
+
+    :param store_path: <str> path to .npy vector store
+    :return: <list> (source image path, (size, mtime_ns) or None) of each row
+    """
+    sources = []
+    sources_path = vector_store_sources(store_path)
+    if os.path.isfile(sources_path):
+        with open(sources_path) as f:
+            for line in f.read().splitlines():
+                fields = line.split('\t')
+                if len(fields) == 3:
+                    sources.append((fields[0], (int(fields[1]), int(fields[2]))))
+                else:
+                    sources.append((line, None))
+
+    return sources
+
+
+def _source_lines(sources, stats):
+    if stats is None:
+        stats = [None] * len(sources)
+
+    return [src + '\n' if stat is None else '{0}\t{1}\t{2}\n'.format(src, *stat)
+            for src, stat in zip(sources, stats)]
+
+
+def read_vector_store(store_path, mmap=True):
+    """
+    Read a binary vector store (float32 .npy, one row per image) and the source path of each row
+
+    :param store_path: <str> path to .npy vector store
+    :param mmap: <bool> memory-map the vectors instead of reading them into memory
+    :return: <numpy.ndarray>, <list> vectors, source image paths
+    """
+    logger.info("     reading vector store {} ...".format(store_path))
+    vectors = np.load(store_path, mmap_mode='r' if mmap else None)
+    sources = [src for src, _ in read_store_sources(store_path)]
+    if len(sources) != vectors.shape[0]:
+        raise Exception("Vector store {0} has {1} rows but {2} lists {3} sources".format(
+            store_path, vectors.shape[0], vector_store_sources(store_path), len(sources)))
+    logger.info("     ... done ({} vectors)".format(vectors.shape[0]))
+
+    return vectors, sources
+
+
+def write_vector_store(store_path, vectors, sources, stats=None):
+    """
+    Replace a binary vector store (e.g., after removing rows); files are written then renamed
+
+    :param store_path: <str> path to .npy vector store
+    :param vectors: <numpy.ndarray> feature vectors
+    :param sources: <list> source image path of each vector
+    :param stats: <list> (size, mtime_ns) of each source (default=None, unknown)
+    :return:
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    tmp_path = "{0}.{1}.tmp.npy".format(os.path.splitext(store_path)[0], os.getpid())
+    np.save(tmp_path, vectors)
+    sources_path = vector_store_sources(store_path)
+    with open(sources_path + '.tmp', 'w') as f:
+        f.writelines(_source_lines(sources, stats))
+    os.replace(tmp_path, store_path)
+    os.replace(sources_path + '.tmp', sources_path)
+
+
+def append_vector_store(store_path, vectors, sources, stats=None):
+    """
+    Append vectors to a binary vector store, creating it if needed
+
+    Rows are appended to the end of the .npy file and only its header is rewritten, so existing vectors are not
+    read or rewritten (unless the header grows past its padding).
+
+    :param store_path: <str> path to .npy vector store
+    :param vectors: <list> feature vectors
+    :param sources: <list> source image path of each vector
+    :param stats: <list> (size, mtime_ns) of each source (default=None, unknown; see source_stat())
+    :return:
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or vectors.shape[0] != len(sources):
+        raise Exception("Expected one vector per source; got {0} vectors and {1} sources".format(
+            vectors.shape, len(sources)))
+
+    logger.info("     appending {0} vectors to {1} ...".format(len(sources), store_path))
+    if not os.path.isfile(store_path):
+        np.save(store_path, vectors)
+    else:
+        with open(store_path, 'r+b') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            data_offset = f.tell()
+            if fortran_order or dtype != vectors.dtype or shape[1:] != vectors.shape[1:]:
+                raise Exception("Cannot append {0} {1} vectors to store with shape {2} and dtype {3}".format(
+                    vectors.shape, vectors.dtype, shape, dtype))
+
+            header = io.BytesIO()
+            header_dict = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                           'shape': (shape[0] + vectors.shape[0],) + shape[1:]}
+            if version == (1, 0):
+                np.lib.format.write_array_header_1_0(header, header_dict)
+            else:
+                np.lib.format.write_array_header_2_0(header, header_dict)
+            header = header.getvalue()
+
+            if len(header) == data_offset:
+                f.seek(0, 2)
+                f.write(vectors.tobytes())
+                f.seek(0)
+                f.write(header)
+            else:
+                existing = np.fromfile(f, dtype=dtype).reshape(shape)
+                f.close()
+                np.save(store_path, np.concatenate([existing, vectors]))
+
+    with open(vector_store_sources(store_path), 'a') as f:
+        f.writelines(_source_lines(sources, stats))
+    logger.info("     ... done")
+
+
+def update_vector_store(group, img_ext, thread_count, feature_scale=common.DEFAULT_FEATURE_SCALE, cache_path=None,
+                        cache_size=cache.DEFAULT_CACHE_SIZE):
+    """
+    Bring the vector store of group up to date with its images, and return the whole store: rows of images that were
+    removed (or moved to the other group) or changed since they were vectorized are dropped, and new or changed
+    images are vectorized and appended
+
+    :param group: <str> path to input image(s); the store is written to <group>/image_vectors_blocks<B>_scale<S>.npy
+                  (see vector_store_name()), so vectors computed with other settings are never mixed in
+    :param img_ext: <str> image extension (e.g., '.jpg')
+    :param thread_count: <int>
+    :param feature_scale: <int> resolution reduction applied before vectorizing
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :return: <numpy.ndarray> memory-mapped vectors
+    """
+    store_path = os.path.join(group, vector_store_name(feature_scale))
+    files = get_files(group, img_ext)
+    current = {f: source_stat(f) for f in files}
+
+    known = set()
+    if os.path.isfile(store_path):
+        vectors, _ = read_vector_store(store_path)
+        entries = read_store_sources(store_path)
+        keep = []
+        for row, (src, stat) in enumerate(entries):
+            if src not in known and stat is not None and current.get(src) == stat:
+                keep.append(row)
+                known.add(src)
+        if len(keep) < len(entries):
+            logger.info("     removing {0} stale vectors from {1}".format(len(entries) - len(keep), store_path))
+            kept_vectors = np.array(vectors[keep])
+            del vectors
+            write_vector_store(store_path, kept_vectors, [entries[row][0] for row in keep],
+                               [entries[row][1] for row in keep])
+
+    new_files = [f for f in files if f not in known]
+    logger.info("     {0} new or changed images to vectorize in {1}".format(len(new_files), group))
+    if new_files:
+        vectors = thread_image_vectorization(group, img_ext, thread_count, feature_scale=feature_scale,
+                                             cache_path=cache_path, cache_size=cache_size, input_files=new_files)
+        append_vector_store(store_path, vectors, new_files, [current[f] for f in new_files])
+
+    return read_vector_store(store_path)[0]
+
+
+def thread_image_vectorization(group, img_ext, thread_count, feature_scale=common.DEFAULT_FEATURE_SCALE,
+                               cache_path=None, cache_size=cache.DEFAULT_CACHE_SIZE, input_files=None):
     """
 
     :param group: <str> path to input image(s)
     :param img_ext: <str> image extension (e.g., '.jpg')
     :param thread_count: <int>
+    :param feature_scale: <int> resolution reduction applied before vectorizing
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :param input_files: <list> image paths to vectorize instead of every image in group
     :return: <list>
     """
-    # get number of images for each process
-    input_files = get_files(group, img_ext)
-    batch_imgs = common.batch_split(input_files, process_count=thread_count)
-    logger.debug("batch_imgs: {}".format(batch_imgs))
+    if input_files is None:
+        input_files = get_files(group, img_ext)
+
+    # hand out small tasks, so processes that finish early pick up more work
+    tasks = common.split_tasks(input_files, common.task_size(len(input_files), thread_count))
+    logger.debug("{0} images in {1} tasks".format(len(input_files), len(tasks)))
+    vectorize_task = functools.partial(cache.vectorize_with_stats, blocks=FEATURE_BLOCKS, feature_scale=feature_scale,
+                                       cache_path=cache_path, cache_size=cache_size)
+    hits = misses = 0
 
-    # send batches to unique processes
-    pool = mp.Pool(processes=thread_count)
     vector_out = []
-    try:
-        results = [pool.apply_async(calc_img_vector, args=(i,)) for i in batch_imgs.values()]
-        vector_out = [p.get() for p in results]
-    except KeyboardInterrupt:
-        pool.terminate()
-        logger.info("pool terminated.")
-    return vector_out[0]  # call index 0 to remove outer list
+    for _, (vectors, task_hits, task_misses) in common.schedule(vectorize_task, tasks, process_count=thread_count):
+        vector_out.extend(vectors)
+        hits += task_hits
+        misses += task_misses
+    if cache_path:
+        logger.info("     feature cache: {0} hits, {1} misses".format(hits, misses))
+    cache.evict_cache(cache_path, cache_size)
 
+    return vector_out
 
-def main(group_a, group_b, class_out, img_ext='.jpg', threads=1, dryrun=False):
+
+def main(group_a, group_b, class_out, img_ext='.jpg', threads=1, feature_scale=common.DEFAULT_FEATURE_SCALE,
+         cache_path=None, cache_size=cache.DEFAULT_CACHE_SIZE, vector_format=DEFAULT_VECTOR_FORMAT, dryrun=False):
     """
 
-    :param group_a: <str> path to 'good' images OR json files
-    :param group_b: <str> path to 'bad' images OR json files
+    :param group_a: <str> path to 'good' images OR .json/.npy vector file
+    :param group_b: <str> path to 'bad' images OR .json/.npy vector file
     :param class_out: <str> path and filename of output file
-    :param img_ext: <str> image extension, e.g., '.jpg', '.png' (ignored if group_a and group_b are .json)
+    :param img_ext: <str> image extension, e.g., '.jpg', '.png' (ignored if group_a and group_b are vector files)
     :param threads: <int> number of threads to use for image vectorization process (default=1)
+    :param feature_scale: <int> 1 (full resolution), 2, 4 or 8 (1/N JPEG draft decode), or >8 (max edge in pixels)
+    :param cache_path: <str> path to feature cache database, reused across runs (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :param vector_format: <str> 'json' writes a new timestamped JSON file per run; 'npy' keeps a float32 vector store
+                          per feature settings (image_vectors_*.npy + .txt) in each image dir and only vectorizes new
+                          or changed images
     :param dryrun: <bool> run code but do not save classifier
     :return:
     """
@@ -166,6 +393,9 @@ def main(group_a, group_b, class_out, img_ext='.jpg', threads=1, dryrun=False):
     logger.info("     group_b: {}".format(group_b))
     logger.info("     class_out: {}".format(class_out))
     logger.info("     img_ext: {}".format(img_ext))
+    logger.info("     feature_scale: {}".format(feature_scale))
+    logger.info("     cache_path: {}".format(cache_path))
+    logger.info("     vector_format: {}".format(vector_format))
     logger.info("     dryrun: {}\n".format(dryrun))
 
     # sanitize args
@@ -173,29 +403,41 @@ def main(group_a, group_b, class_out, img_ext='.jpg', threads=1, dryrun=False):
         err_msg = "class_out (-o) is a directory, must include a file name!"
         logger.error(err_msg)
         raise Exception(err_msg)
+    common.check_feature_scale(feature_scale)
 
-    # if the inputs are not JSON files, they are assumed to be images
+    # if the inputs are not JSON or .npy vector files, they are assumed to be dirs of images
     # generate vectors for all images
-    logger.info("Checking to see if inputs are images or JSON files ...")
-    ext_a = os.path.splitext(group_a[-1])
+    logger.info("Checking to see if inputs are images or vector files ...")
+    ext_a = os.path.splitext(group_a)[1]
     logger.debug("     ext_a: {}".format(ext_a))
-    ext_b = os.path.splitext(group_b[-1])
+    ext_b = os.path.splitext(group_b)[1]
     logger.debug("     ext_b: {}".format(ext_b))
 
-    if ext_a != '.json' and ext_b != '.json':
+    if ext_a not in VECTOR_FILE_EXTS and ext_b not in VECTOR_FILE_EXTS:
         logger.info("Calculating image vectors ...")
-        vector_a = thread_image_vectorization(group=group_a, img_ext=img_ext, thread_count=threads)
-        vector_b = thread_image_vectorization(group=group_b, img_ext=img_ext, thread_count=threads)
-
-        # write vector files to disk
-        if not dryrun:
-            write_vector_file(group_a, vector_a)
-            write_vector_file(group_b, vector_b)
+        if vector_format == 'npy' and not dryrun:
+            # only images missing from each dir's vector store are vectorized
+            vector_a = update_vector_store(group=group_a, img_ext=img_ext, thread_count=threads,
+                                           feature_scale=feature_scale, cache_path=cache_path, cache_size=cache_size)
+            vector_b = update_vector_store(group=group_b, img_ext=img_ext, thread_count=threads,
+                                           feature_scale=feature_scale, cache_path=cache_path, cache_size=cache_size)
         else:
-            print("--dryrun used, no results saved.")
-
-    elif ext_a == '.json' and ext_b == '.json':
-        logger.info("Reading vectorized image inputs from JSON files ...")
+            vector_a = thread_image_vectorization(group=group_a, img_ext=img_ext, thread_count=threads,
+                                                  feature_scale=feature_scale, cache_path=cache_path,
+                                                  cache_size=cache_size)
+            vector_b = thread_image_vectorization(group=group_b, img_ext=img_ext, thread_count=threads,
+                                                  feature_scale=feature_scale, cache_path=cache_path,
+                                                  cache_size=cache_size)
+
+            # write vector files to disk
+            if not dryrun:
+                write_vector_file(group_a, vector_a)
+                write_vector_file(group_b, vector_b)
+            else:
+                print("--dryrun used, no results saved.")
+
+    elif ext_a in VECTOR_FILE_EXTS and ext_b in VECTOR_FILE_EXTS:
+        logger.info("Reading vectorized image inputs from vector files ...")
         vector_a = read_vector_file(group_a)
         vector_b = read_vector_file(group_b)
 
@@ -214,13 +456,28 @@ if __name__ == "__main__":
 
     req_named = parser.add_argument_group("Required named arguments")
 
-    req_named.add_argument("--pos", help="Dir of positive/good images)", dest="group_a", required=True)
-    req_named.add_argument("--neg", help="Dir of negative/bad images)", dest="group_b", required=True)
+    req_named.add_argument("--pos", help="Dir of positive/good images (or .json/.npy vector file)", dest="group_a",
+                           required=True)
+    req_named.add_argument("--neg", help="Dir of negative/bad images (or .json/.npy vector file)", dest="group_b",
+                           required=True)
     req_named.add_argument("-o", help="Path and filename for output classification", dest="class_out", required=True)
 
     parser.add_argument("-e", help="Image extent (default=.jpg)", dest="img_ext", default='.jpg', required=False)
     parser.add_argument("--threads", help="Number of processes to spawn for image vectorization (default={})"
                         .format(DEFAULT_MAX_CPUS), default=DEFAULT_MAX_CPUS, type=int, required=False)
+    parser.add_argument("--feature-scale", help="Reduce resolution before vectorizing: 2, 4 or 8 for a 1/N JPEG draft "
+                                                "decode, or >8 for a max edge in pixels (default={})"
+                        .format(common.DEFAULT_FEATURE_SCALE), default=common.DEFAULT_FEATURE_SCALE, type=int,
+                        dest="feature_scale", required=False)
+    parser.add_argument("--cache", help="Path to feature cache database; vectors of unchanged images are reused "
+                                        "across runs (default=no cache)", dest="cache_path", required=False)
+    parser.add_argument("--cache-size", help="Max number of vectors held in the feature cache (default={})"
+                        .format(cache.DEFAULT_CACHE_SIZE), default=cache.DEFAULT_CACHE_SIZE, type=int,
+                        dest="cache_size", required=False)
+    parser.add_argument("--vector-format", help="Format of saved image vectors; 'npy' appends new images to a "
+                                                "float32 store in each image dir (default={})"
+                        .format(DEFAULT_VECTOR_FORMAT), default=DEFAULT_VECTOR_FORMAT, choices=VECTOR_FORMATS,
+                        dest="vector_format", required=False)
     parser.add_argument("--dryrun", help="Run script, but do not execute actions", action="store_true", required=False)
 
     arguments = parser.parse_args()
@@ -0,0 +1,236 @@
+"""
+basemap.py
+
+Purpose: basemap layer for the map overlay, from raster map tiles on disk (a {z}/{x}/{y}.png tile directory or an
+         MBTiles file; no network access). The tiles covering the track are stitched once, resampled from web mercator
+         rows to the linear latitude axis of the map plot, and the mosaic is cached on disk keyed by source, bounding
+         box and zoom, so later runs (and every frame) reuse it.
+"""
+import io
+import os
+import json
+import math
+import sqlite3
+import hashlib
+import numpy as np
+from PIL import Image
+
+from lib import common
+
+
+logger = common.logger
+
+TILE_SIZE = 256  # pixels
+MAX_ZOOM = 19
+MARGIN = 0.05  # fraction of the track extent added on each side (matches matplotlib's default axes margins)
+MIN_SPAN = 0.001  # decimal degrees; minimum extent of the basemap (e.g., for a track that did not move)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "timelapse-tools", "basemap")
+TILE_EXTS = ('.png', '.jpg', '.jpeg')
+
+
+def lon_to_px(lon, zoom):
+    """
+    :param lon: <float or numpy.ndarray> decimal degrees
+    :param zoom: <int>
+    :return: <float or numpy.ndarray> global web mercator pixel column at zoom
+    """
+    return (np.asarray(lon, dtype=np.float64) + 180.) / 360. * TILE_SIZE * 2 ** zoom
+
+
+def lat_to_px(lat, zoom):
+    """
+    :param lat: <float or numpy.ndarray> decimal degrees
+    :param zoom: <int>
+    :return: <float or numpy.ndarray> global web mercator pixel row at zoom
+    """
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    return (1. - np.log(np.tan(phi) + 1. / np.cos(phi)) / math.pi) / 2. * TILE_SIZE * 2 ** zoom
+
+
+def basemap_extent(bbox):
+    """
+    Extent of the basemap for a track bounding box, including margins
+
+    :param bbox: <tuple> (min_lat, min_long, max_lat, max_long) of the track
+    :return: <tuple> (min_long, max_long, min_lat, max_lat), as used by matplotlib's imshow()
+    """
+    min_lat, min_long, max_lat, max_long = bbox
+    pad_lat = max(max_lat - min_lat, MIN_SPAN) * MARGIN + max(MIN_SPAN - (max_lat - min_lat), 0) / 2.
+    pad_long = max(max_long - min_long, MIN_SPAN) * MARGIN + max(MIN_SPAN - (max_long - min_long), 0) / 2.
+
+    return min_long - pad_long, max_long + pad_long, min_lat - pad_lat, max_lat + pad_lat
+
+
+class TileDirectory():
+    """
+    Tiles stored as {zoom}/{x}/{y}.png (or .jpg), as written by most tile downloaders
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def zoom_levels(self):
+        return sorted(int(z) for z in os.listdir(self.path) if z.isdigit())
+
+    def get_tile(self, zoom, x, y):
+        """
+        :return: <bytes> encoded tile, None if missing
+        """
+        for ext in TILE_EXTS:
+            tile_path = os.path.join(self.path, str(zoom), str(x), str(y) + ext)
+            if os.path.isfile(tile_path):
+                with open(tile_path, 'rb') as f:
+                    return f.read()
+        return None
+
+    def close(self):
+        pass
+
+
+class MBTiles():
+    """
+    Tiles stored in an MBTiles (SQLite) file; rows are numbered bottom up (TMS)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect("file:{0}?mode=ro".format(os.path.abspath(path)), uri=True)
+
+    def zoom_levels(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT zoom_level FROM tiles ORDER BY zoom_level")]
+
+    def get_tile(self, zoom, x, y):
+        """
+        :return: <bytes> encoded tile, None if missing
+        """
+        row = self.conn.execute("SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                                (zoom, x, 2 ** zoom - 1 - y)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def close(self):
+        self.conn.close()
+
+
+def open_tile_source(path):
+    """
+    :param path: <str> tile directory, or .mbtiles file
+    :return: <TileDirectory or MBTiles>
+    """
+    if os.path.isdir(path):
+        return TileDirectory(path)
+    if os.path.isfile(path):
+        return MBTiles(path)
+    raise Exception("basemap source {0} is not a tile directory or MBTiles file".format(path))
+
+
+def choose_zoom(extent, size, zoom_levels):
+    """
+    Lowest available zoom at which the extent covers at least size pixels (else the highest available zoom)
+
+    :param extent: <tuple> (min_long, max_long, min_lat, max_lat)
+    :param size: <tuple> (x_size, y_size) of the rendered map, in pixels
+    :param zoom_levels: <list> zoom levels available in the tile source
+    :return: <int>
+    """
+    if not zoom_levels:
+        raise Exception("basemap source has no tiles")
+
+    min_long, max_long, min_lat, max_lat = extent
+    for zoom in sorted(zoom_levels):
+        width = lon_to_px(max_long, zoom) - lon_to_px(min_long, zoom)
+        height = lat_to_px(min_lat, zoom) - lat_to_px(max_lat, zoom)
+        if width >= size[0] and height >= size[1]:
+            return zoom
+
+    return max(zoom_levels)
+
+
+def stitch(source, extent, zoom):
+    """
+    Stitch the tiles covering extent, and resample them so rows are linear in latitude (as on the map plot)
+
+    :param source: <TileDirectory or MBTiles>
+    :param extent: <tuple> (min_long, max_long, min_lat, max_lat)
+    :param zoom: <int>
+    :return: <numpy.ndarray> RGBA mosaic, uint8; missing tiles are transparent
+    """
+    min_long, max_long, min_lat, max_lat = extent
+    x0, x1 = lon_to_px(min_long, zoom), lon_to_px(max_long, zoom)
+    y0, y1 = lat_to_px(max_lat, zoom), lat_to_px(min_lat, zoom)
+
+    tx0, tx1 = int(x0 // TILE_SIZE), int(x1 // TILE_SIZE)
+    ty0, ty1 = int(y0 // TILE_SIZE), int(y1 // TILE_SIZE)
+    mosaic = Image.new('RGBA', ((tx1 - tx0 + 1) * TILE_SIZE, (ty1 - ty0 + 1) * TILE_SIZE))
+
+    missing = 0
+    for tx in range(tx0, tx1 + 1):
+        for ty in range(ty0, ty1 + 1):
+            data = source.get_tile(zoom, tx, ty)
+            if data is None:
+                missing += 1
+                continue
+            with Image.open(io.BytesIO(data)) as tile:
+                mosaic.paste(tile.convert('RGBA'), ((tx - tx0) * TILE_SIZE, (ty - ty0) * TILE_SIZE))
+    if missing:
+        logger.warning("basemap: {0} tiles missing at zoom {1}".format(missing, zoom))
+
+    # sample mosaic at pixel centers: columns are linear in longitude, rows linear in latitude
+    width = max(int(round(x1 - x0)), 1)
+    height = max(int(round(y1 - y0)), 1)
+    cols = lon_to_px(min_long + (np.arange(width) + 0.5) / width * (max_long - min_long), zoom)
+    rows = lat_to_px(max_lat - (np.arange(height) + 0.5) / height * (max_lat - min_lat), zoom)
+    cols = np.clip((cols - tx0 * TILE_SIZE).astype(np.intp), 0, mosaic.width - 1)
+    rows = np.clip((rows - ty0 * TILE_SIZE).astype(np.intp), 0, mosaic.height - 1)
+
+    return np.asarray(mosaic)[np.ix_(rows, cols)]
+
+
+def cache_key(source_path, extent, zoom):
+    """
+    :param source_path: <str>
+    :param extent: <tuple>
+    :param zoom: <int>
+    :return: <str> file name of the cached mosaic; includes the mtime of the source (for a tile directory, only
+             changes when zoom level directories are added or removed)
+    """
+    key = json.dumps([os.path.abspath(source_path), os.stat(source_path).st_mtime_ns, zoom,
+                      [round(v, 7) for v in extent]])
+    return "basemap_z{0}_{1}.png".format(zoom, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+
+def load_basemap(source_path, bbox, size, zoom=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Basemap for a track, from the on-disk cache or stitched from tiles
+
+    :param source_path: <str> tile directory, or .mbtiles file
+    :param bbox: <tuple> (min_lat, min_long, max_lat, max_long) of the track
+    :param size: <tuple> (x_size, y_size) of the rendered map, in pixels; used to choose the zoom
+    :param zoom: <int> tile zoom level (default=None, choose from size)
+    :param cache_dir: <str> directory of cached mosaics (default=None, no caching)
+    :return: <numpy.ndarray>, <tuple> RGBA mosaic, extent (min_long, max_long, min_lat, max_lat)
+    """
+    extent = basemap_extent(bbox)
+    source = open_tile_source(source_path)
+    try:
+        if zoom is None:
+            zoom = choose_zoom(extent, size, source.zoom_levels())
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise Exception("basemap zoom must be in range [0, {0}]; value supplied: {1}".format(MAX_ZOOM, zoom))
+
+        cache_path = os.path.join(cache_dir, cache_key(source_path, extent, zoom)) if cache_dir else None
+        if cache_path and os.path.isfile(cache_path):
+            logger.info("basemap: using cached mosaic {0}".format(cache_path))
+            with Image.open(cache_path) as cached:
+                return np.asarray(cached.convert('RGBA')), extent
+
+        logger.info("basemap: stitching tiles at zoom {0} ...".format(zoom))
+        image = stitch(source, extent, zoom)
+    finally:
+        source.close()
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write then rename, so concurrent runs never read a partial file
+        tmp_path = "{0}.{1}.tmp".format(cache_path, os.getpid())
+        Image.fromarray(image, 'RGBA').save(tmp_path, format='PNG')
+        os.replace(tmp_path, cache_path)
+
+    return image, extent
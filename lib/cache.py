@@ -0,0 +1,201 @@
+"""
+cache.py
+
+Purpose: persistent on-disk cache of image feature vectors (SQLite), keyed by file path and feature parameters, and
+         validated against file size and modification time, so re-running a classifier does not decode images that
+         were already vectorized.
+"""
+import os
+import time
+import sqlite3
+import numpy as np
+
+from lib import common
+
+
+logger = common.logger
+
+DEFAULT_CACHE_SIZE = 200000  # max number of cached vectors (~100 MB for 64-bin histograms)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (path, params)
+);
+CREATE INDEX IF NOT EXISTS features_last_used ON features (last_used);
+"""
+
+
+def feature_params(blocks=4, feature_scale=common.DEFAULT_FEATURE_SCALE):
+    """
+    Build cache key describing how a histogram feature vector was computed
+
+    :param blocks: <int>
+    :param feature_scale: <int>
+    :return: <str>
+    """
+    return "hist:blocks={0}:scale={1}".format(blocks, feature_scale)
+
+
+class FeatureCache():
+    """
+    SQLite-backed vector cache; entries are invalidated when the file size or mtime changes, and the least recently
+    used entries are removed by evict() once the cache holds more than max_entries vectors.
+
+    Lookups read in autocommit mode and queue their writes (new vectors, last_used times), which flush() writes in one
+    short transaction, so worker processes sharing the database never hold its write lock while decoding images.
+    """
+    def __init__(self, db_path, max_entries=DEFAULT_CACHE_SIZE):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._inserts = {}  # {(path, params): row}, vectors computed since the last flush()
+        self._touches = []
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
+
+    def flush(self):
+        """
+        Write queued vectors and last_used times in one transaction
+        """
+        if not self._inserts and not self._touches:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)",
+                                  self._inserts.values())
+            self.conn.executemany("UPDATE features SET last_used=? WHERE path=? AND params=?", self._touches)
+        self._inserts = {}
+        self._touches = []
+
+    def lookup(self, path, params, compute):
+        """
+        Return cached vector for path, or compute it and queue it for the next flush()
+
+        :param path: <str> image path
+        :param params: <str> feature parameters (see feature_params())
+        :param compute: <function> called as compute(path) on a cache miss; must return a list of floats
+        :return: <list>
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        pending = self._inserts.get((path, params))
+        if pending and pending[2] == stat.st_size and pending[3] == stat.st_mtime_ns:
+            self.hits += 1
+            return np.frombuffer(pending[5], dtype=np.float64).tolist()
+        row = self.conn.execute("SELECT size, mtime_ns, vector FROM features WHERE path=? AND params=?",
+                                (path, params)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            self.hits += 1
+            self._touches.append((time.time(), path, params))
+            return np.frombuffer(row[2], dtype=np.float64).tolist()
+
+        self.misses += 1
+        vector = compute(path)
+        self._inserts[(path, params)] = (path, params, stat.st_size, stat.st_mtime_ns, time.time(),
+                                         np.asarray(vector, dtype=np.float64).tobytes())
+
+        return vector
+
+    def evict(self):
+        """
+        Remove least recently used entries beyond max_entries (counts the whole table, so call it once per run)
+
+        :return: <int> number of entries removed
+        """
+        self.flush()
+        count = self.conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        with self.conn:
+            self.conn.execute("DELETE FROM features WHERE rowid IN "
+                              "(SELECT rowid FROM features ORDER BY last_used LIMIT ?)", (excess,))
+        logger.debug("feature cache: evicted {} entries".format(excess))
+
+        return excess
+
+
+def evict_cache(cache_path, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Trim the feature cache to cache_size vectors; run once per run, in the parent process, after the workers finish
+
+    :param cache_path: <str> path to feature cache database (None: no caching, nothing to do)
+    :param cache_size: <int> max number of vectors held in the cache
+    :return: <int> number of entries removed
+    """
+    if not cache_path:
+        return 0
+    with FeatureCache(cache_path, max_entries=cache_size) as fc:
+        return fc.evict()
+
+
+def _read_feature_vector(img_path, blocks, feature_scale):
+    with common.ImageIO(img_path) as image:
+        return image.get_feature_vector(blocks=blocks, feature_scale=feature_scale)
+
+
+def vectorize_with_stats(img_paths, blocks=4, feature_scale=common.DEFAULT_FEATURE_SCALE, cache_path=None,
+                         cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Calculate feature vectors of images, consulting the feature cache first (if supplied)
+
+    :param img_paths: <list> image paths
+    :param blocks: <int> number of blocks to subdivide each channel of the RGB space (default=4)
+    :param feature_scale: <int> resolution reduction applied before vectorizing (see common.reduce_for_features)
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the cache (see evict_cache())
+    :return: <list>, <int>, <int> feature vectors (in the order of img_paths), cache hits, cache misses
+    """
+    if not cache_path:
+        vectors = []
+        for img in img_paths:
+            logger.debug("     reading image {} ...".format(img))
+            vectors.append(_read_feature_vector(img, blocks, feature_scale))
+        return vectors, 0, 0
+
+    params = feature_params(blocks, feature_scale)
+    with FeatureCache(cache_path, max_entries=cache_size) as cache:
+        vectors = [cache.lookup(img, params, lambda p: _read_feature_vector(p, blocks, feature_scale))
+                   for img in img_paths]
+
+    return vectors, cache.hits, cache.misses
+
+
+def vectorize(img_paths, blocks=4, feature_scale=common.DEFAULT_FEATURE_SCALE, cache_path=None,
+              cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Calculate feature vectors of images, consulting the feature cache first (if supplied), and log cache hits/misses
+
+    :param img_paths: <list> image paths
+    :param blocks: <int> number of blocks to subdivide each channel of the RGB space (default=4)
+    :param feature_scale: <int> resolution reduction applied before vectorizing (see common.reduce_for_features)
+    :param cache_path: <str> path to feature cache database (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the cache
+    :return: <list> feature vectors, in the order of img_paths
+    """
+    vectors, hits, misses = vectorize_with_stats(img_paths, blocks=blocks, feature_scale=feature_scale,
+                                                 cache_path=cache_path, cache_size=cache_size)
+    if cache_path:
+        logger.info("     feature cache: {0} hits, {1} misses".format(hits, misses))
+
+    return vectors
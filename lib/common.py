@@ -10,11 +10,28 @@ Python version: 3.7.3
 """
 import os
 import sys
+import time
+import queue
+import pickle
 import PIL.Image
 import logging
+import numpy as np
+import multiprocessing as mp
 
 
 DEFAULT_MAX_CPUS = os.cpu_count()
+DRAFT_SCALES = (1, 2, 4, 8)
+DEFAULT_FEATURE_SCALE = 1
+TASKS_PER_PROCESS = 8  # target number of tasks handed to each process by schedule()
+MAX_TASK_SIZE = 32  # max number of items per task
+
+# JPEG encoder settings used by save_jpeg(); subsampling 2 is 4:2:0 chroma, 0 is 4:4:4 (full chroma)
+JPEG_PRESETS = {
+    'fast': {'quality': 85, 'subsampling': 2, 'optimize': False, 'progressive': False},
+    'balanced': {'quality': 90, 'subsampling': 2, 'optimize': True, 'progressive': False},
+    'archival': {'quality': 95, 'subsampling': 0, 'optimize': True, 'progressive': True},
+}
+DEFAULT_JPEG_PRESET = 'balanced'
 
 logger = logging.getLogger("logger")
 logger.setLevel(logging.DEBUG)
@@ -73,45 +90,427 @@ def batch_split(input_values, process_count):
     return chunk_out
 
 
+def scan_dir(src, ext=None):
+    """
+    List files in a directory with a single directory scan
+
+    :param src: <str> directory
+    :param ext: <str or tuple> file extension(s) to keep, matched case-insensitively (e.g., '.jpg' also matches
+                '.JPG'); default=None, all files
+    :return: <list> sorted file paths
+    """
+    if isinstance(ext, str):
+        ext = (ext,)
+    ext = tuple(e.lower() for e in ext) if ext else None
+
+    paths = []
+    with os.scandir(src) as entries:
+        for entry in entries:
+            if ext and not entry.name.lower().endswith(ext):
+                continue
+            if entry.is_file():
+                paths.append(entry.path)
+
+    return sorted(paths)
+
+
+def task_size(item_count, process_count, tasks_per_process=TASKS_PER_PROCESS, max_size=MAX_TASK_SIZE):
+    """
+    Pick number of items per task, so each process gets several small tasks
+
+    :param item_count: <int>
+    :param process_count: <int>
+    :param tasks_per_process: <int>
+    :param max_size: <int>
+    :return: <int>
+    """
+    size = -(-item_count // (process_count * tasks_per_process))  # ceiling division
+    return max(1, min(size, max_size))
+
+
+def split_tasks(input_values, size):
+    """
+    Split a list of items into tasks of (at most) size items, preserving order
+
+    :param input_values: <list>
+    :param size: <int>
+    :return: <list> of lists
+    """
+    return [input_values[i:i + size] for i in range(0, len(input_values), size)]
+
+
+def _timed_task(func, task):
+    t0 = time.time()
+    result = func(task)
+    return os.getpid(), time.time() - t0, len(task), result
+
+
+def log_worker_stats(stats, wall_time):
+    """
+    Log per-process task counts and throughput collected by schedule()
+
+    :param stats: <dict> {pid: [tasks, items, busy_seconds]}
+    :param wall_time: <float> elapsed seconds
+    :return:
+    """
+    for pid, (tasks, items, busy) in sorted(stats.items()):
+        logger.info("     worker {0}: {1} tasks, {2} items, {3:.1f}s busy ({4:.0%}), {5:.2f} items/s".format(
+            pid, tasks, items, busy, busy / wall_time if wall_time else 0, items / busy if busy else 0))
+
+
+def schedule(func, tasks, process_count=1, max_pending=None, ordered=True, initializer=None, initargs=()):
+    """
+    Run func(task) for each task on a process pool, dispatching a new task whenever a process finishes one (rather
+    than splitting the work up front), and yield results as they become available.
+
+    :param func: <function> picklable (module level) function taking one task
+    :param tasks: <list> tasks, e.g., from split_tasks()
+    :param process_count: <int> number of processes
+    :param max_pending: <int> max number of tasks submitted but not yet yielded (default=None, no limit); bounds
+                        memory when results are consumed slower than they are produced
+    :param ordered: <bool> yield results in the order of tasks (otherwise in completion order)
+    :param initializer: <function> called once in each process when it starts
+    :param initargs: <tuple> arguments for initializer
+    :return: <generator> yields (task_index, result)
+    """
+    done = queue.Queue()
+    stats = {}
+    buffered = {}
+    task_iter = enumerate(tasks)
+    next_out = 0
+    outstanding = 0
+    t0 = time.time()
+
+    if tasks and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("     task payload: {} bytes pickled per task".format(len(pickle.dumps((func, tasks[0])))))
+
+    pool = mp.Pool(processes=process_count, initializer=initializer, initargs=initargs)
+
+    def submit():
+        item = next(task_iter, None)
+        if item is None:
+            return False
+        idx, task = item
+        pool.apply_async(_timed_task, args=(func, task),
+                         callback=lambda out, idx=idx: done.put((idx, out, None)),
+                         error_callback=lambda err, idx=idx: done.put((idx, None, err)))
+        return True
+
+    try:
+        while (max_pending is None or outstanding < max_pending) and submit():
+            outstanding += 1
+
+        while outstanding:
+            idx, out, err = done.get()
+            if err is not None:
+                raise err
+            pid, busy, items, result = out
+            worker = stats.setdefault(pid, [0, 0, 0.0])
+            worker[0] += 1
+            worker[1] += items
+            worker[2] += busy
+
+            if ordered:
+                buffered[idx] = result
+                ready = []
+                while next_out in buffered:
+                    ready.append((next_out, buffered.pop(next_out)))
+                    next_out += 1
+            else:
+                ready = [(idx, result)]
+
+            for ready_idx, ready_result in ready:
+                outstanding -= 1
+                if submit():
+                    outstanding += 1
+                yield ready_idx, ready_result
+
+    except KeyboardInterrupt:
+        logger.info("pool terminated.")
+        raise
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+    log_worker_stats(stats, time.time() - t0)
+
+
+def save_jpeg(image, path, preset=DEFAULT_JPEG_PRESET, exif=None):
+    """
+    Write an image as JPEG with the encoder settings of a preset (see JPEG_PRESETS)
+
+    :param image: <PIL.Image> RGB image
+    :param path: <str or file object> output
+    :param preset: <str> 'fast', 'balanced' or 'archival'
+    :param exif: <bytes> raw EXIF block to copy into the output, e.g., image.info['exif'] of the source image
+                 (default=None, no EXIF)
+    :return:
+    """
+    if preset not in JPEG_PRESETS:
+        raise Exception("JPEG preset must be one of {0}; value supplied: {1}".format(sorted(JPEG_PRESETS), preset))
+
+    options = dict(JPEG_PRESETS[preset])
+    if exif:
+        options['exif'] = exif
+    image.save(path, format='JPEG', **options)
+
+
+_UNSET = object()
+
+
 class ImageIO():
+    """
+    Image file wrapper; the file is opened, and EXIF, size, RGBA conversion and pixel data are each read, on first
+    access and cached. Use close() (or a with statement) to release the file handle.
+    """
+    __slots__ = ('image_path', '_image_open', '_image_exif', '_size', '_rgba', '_pixels')
+
     def __init__(self, image_path):
         self.image_path = image_path
-        self.image_open = PIL.Image.open(self.image_path)
-        self.image_exif = self.image_open._getexif()
-        self.rgba = None
+        self._image_open = None
+        self._image_exif = _UNSET
+        self._size = None
+        self._rgba = None
+        self._pixels = None
+
+    @classmethod
+    def from_image(cls, image):
+        """
+        Wrap an in-memory PIL image (e.g., a rendered map), with no file behind it
+
+        :param image: <PIL.Image>
+        :return: <ImageIO>
+        """
+        image_io = cls(None)
+        image_io._image_open = image
+        return image_io
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the file handle and drop cached pixel data (EXIF and size remain cached)
+        """
+        if self._image_open is not None:
+            self._image_open.close()
+            self._image_open = None
+        self._rgba = None
+        self._pixels = None
+
+    @property
+    def image_open(self):
+        if self._image_open is None:
+            self._image_open = PIL.Image.open(self.image_path)
+        return self._image_open
+
+    @property
+    def image_exif(self):
+        if self._image_exif is _UNSET:
+            getexif = getattr(self.image_open, '_getexif', None)
+            self._image_exif = (getexif() if getexif else None) or {}
+        return self._image_exif
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = self.image_open.size
+        return self._size
+
+    @property
+    def rgba(self):
+        if self._rgba is None:
+            self._rgba = self.image_open.convert("RGBA")
+        return self._rgba
+
+    @property
+    def pixels(self):
+        if self._pixels is None:
+            self._pixels = np.asarray(self.image_open)
+        return self._pixels
 
     def get_size(self):
-        return self.image_open.size
+        return self.size
 
     def overlay(self, image2, map_x_pos, max_y_pos):
-        # TODO: use self.rgba() variable, and make this fucntion update self()
-        base_img_rgba = self.image_open.convert("RGBA")
-        map_img_rgba = image2.image_open.convert("RGBA")
-        base_img_rgba.paste(map_img_rgba, (map_x_pos, max_y_pos), map_img_rgba)
+        """
+        Paste image2 onto this image (in place), using the alpha band of image2 as the mask
+
+        :param image2: <ImageIO>
+        :param map_x_pos: <int>
+        :param max_y_pos: <int>
+        :return: <ImageIO> self
+        """
+        self.rgba.paste(image2.rgba, (map_x_pos, max_y_pos), image2.rgba)
+
+        return self
 
-        return base_img_rgba
+    def overlay_rgb(self, image2, map_x_pos, map_y_pos):
+        """
+        Composite image2 onto this RGB image (in place), for JPEG output. Only the region covered by image2 is
+        converted and blended; the result has the same pixels as overlay() followed by rgba_to_rgb_mask().
+
+        :param image2: <ImageIO>
+        :param map_x_pos: <int>
+        :param map_y_pos: <int>
+        :return: <PIL.Image> this image, RGB
+        """
+        if self.image_open.mode != 'RGB':
+            return self.overlay(image2, map_x_pos, map_y_pos).rgba_to_rgb_mask()
+
+        frame = self.image_open
+        x_size, y_size = image2.size
+        box = (max(map_x_pos, 0), max(map_y_pos, 0), min(map_x_pos + x_size, frame.width),
+               min(map_y_pos + y_size, frame.height))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return frame
+
+        roi = ImageIO.from_image(frame.crop(box))
+        frame.paste(roi.overlay(image2, map_x_pos - box[0], map_y_pos - box[1]).rgba_to_rgb_mask(), box[:2])
+        self._rgba = None
+        self._pixels = None
+
+        return frame
 
     def rgba_to_rgb_mask(self):
-        base_img_jpg_out = PIL.Image.new("RGB", self.image_open.size, (255, 255, 255))
-        base_img_jpg_out.paste(self.image_open, mask=self.image_open.split()[3])
+        base_img_jpg_out = PIL.Image.new("RGB", self.size, (255, 255, 255))
+        base_img_jpg_out.paste(self.rgba, mask=self.rgba.split()[3])
 
         return base_img_jpg_out
 
-    def get_feature_vector(self, blocks=4):
-        if not self.image_open.mode == 'RGB':
-            raise Exception("Image mode {0} not supported.".format(self.image_open.mode))
+    def get_feature_vector(self, blocks=4, feature_scale=DEFAULT_FEATURE_SCALE):
+        if feature_scale == 1:
+            if not self.image_open.mode == 'RGB':
+                raise Exception("Image mode {0} not supported.".format(self.image_open.mode))
+            return calc_pixel_histogram(self.pixels, blocks=blocks)
 
-        feature = [0] * blocks * blocks * blocks
-        pixel_count = 0
-        for pixel in self.image_open.getdata():
-            ridx = int(pixel[0] / (256 / blocks))
-            gidx = int(pixel[1] / (256 / blocks))
-            bidx = int(pixel[2] / (256 / blocks))
-            idx = ridx + gidx * blocks + bidx * blocks * blocks
-            feature[idx] += 1
-            pixel_count += 1
+        # reduced decodes must start from an undecoded image, so use a separate handle
+        with PIL.Image.open(self.image_path) as image:
+            return calc_feature_vector(reduce_for_features(image, feature_scale), blocks=blocks)
 
-        return [x / float(pixel_count) for x in feature]
+
+def check_feature_scale(feature_scale):
+    """
+    Validate feature scale value
+
+    :param feature_scale: <int> 1 (full resolution), 2, 4 or 8 (1/N draft decode), or >8 (max edge in pixels)
+    :return: <int>
+    """
+    if feature_scale in DRAFT_SCALES or feature_scale > DRAFT_SCALES[-1]:
+        return feature_scale
+    raise Exception("feature_scale must be one of {0} or greater than {1}; value supplied: {2}"
+                    .format(DRAFT_SCALES, DRAFT_SCALES[-1], feature_scale))
+
+
+def reduce_for_features(image, feature_scale=DEFAULT_FEATURE_SCALE):
+    """
+    Reduce resolution of an image before computing its feature vector
+
+    Must be called before the pixel data is loaded. JPEGs use a DCT-scaled draft decode, so the full resolution
+    image is never decoded; other formats are decoded and then reduced.
+
+    :param image: <PIL.Image> opened (not yet loaded) image
+    :param feature_scale: <int> 1 (full resolution), 2, 4 or 8 (1/N draft decode), or >8 (max edge in pixels)
+    :return: <PIL.Image>
+    """
+    check_feature_scale(feature_scale)
+    if feature_scale == 1:
+        return image
+
+    if feature_scale in DRAFT_SCALES:
+        if image.format == 'JPEG':
+            x_size, y_size = image.size
+            image.draft(image.mode, (x_size // feature_scale, y_size // feature_scale))
+            return image
+        return image.reduce(feature_scale)
+
+    # fixed max edge; thumbnail() applies draft mode itself, then resamples
+    image.thumbnail((feature_scale, feature_scale))
+    return image
+
+
+def _bin_lookup(blocks):
+    """
+    Build lookup table mapping each 8-bit channel value to its histogram bin
+
+    :param blocks: <int> number of blocks used to subdivide each channel
+    :return: <numpy.ndarray> uint32 array of length 256
+    """
+    # power-of-two block counts reduce to a plain bit-shift
+    if blocks & (blocks - 1) == 0 and blocks <= 256:
+        return np.arange(256, dtype=np.uint32) >> (8 - (blocks.bit_length() - 1))
+
+    # otherwise mirror the float math of the reference implementation exactly
+    return np.array([int(v / (256 / blocks)) for v in range(256)], dtype=np.uint32)
+
+
+def calc_feature_vector(image, blocks=4):
+    """
+    Calculate normalized RGB color histogram of an image (vectorized with numpy)
+
+    Output is identical to calc_feature_vector_reference(), so models trained with either remain compatible.
+
+    :param image: <PIL.Image> image in RGB mode
+    :param blocks: <int> number of blocks to subdivide each channel of the RGB space (default=4)
+    :return: <list> feature vector of length blocks**3
+    """
+    if not image.mode == 'RGB':
+        raise Exception("Image mode {0} not supported.".format(image.mode))
+
+    return calc_pixel_histogram(np.asarray(image), blocks=blocks)
+
+
+def calc_pixel_histogram(pixels, blocks=4):
+    """
+    Calculate normalized RGB color histogram of a pixel array
+
+    :param pixels: <numpy.ndarray> uint8 array with RGB as the last dimension
+    :param blocks: <int> number of blocks to subdivide each channel of the RGB space (default=4)
+    :return: <list> feature vector of length blocks**3
+    """
+    pixels = pixels.reshape(-1, 3)
+    pixel_count = pixels.shape[0]
+    if pixel_count == 0:
+        raise Exception("Image contains no pixels.")
+
+    lut = _bin_lookup(blocks)
+    idx = lut[pixels[:, 0]]
+    idx += lut[pixels[:, 1]] * blocks
+    idx += lut[pixels[:, 2]] * (blocks * blocks)
+
+    feature = np.bincount(idx, minlength=blocks * blocks * blocks)
+
+    return (feature / float(pixel_count)).tolist()
+
+
+def calc_feature_vector_reference(image, blocks=4):
+    """
+    Calculate normalized RGB color histogram of an image, one pixel at a time
+
+    Slow reference implementation, kept to validate calc_feature_vector().
+
+    :param image: <PIL.Image> image in RGB mode
+    :param blocks: <int> number of blocks to subdivide each channel of the RGB space (default=4)
+    :return: <list> feature vector of length blocks**3
+    """
+    if not image.mode == 'RGB':
+        raise Exception("Image mode {0} not supported.".format(image.mode))
+
+    feature = [0] * blocks * blocks * blocks
+    pixel_count = 0
+    for pixel in image.getdata():
+        ridx = int(pixel[0] / (256 / blocks))
+        gidx = int(pixel[1] / (256 / blocks))
+        bidx = int(pixel[2] / (256 / blocks))
+        idx = ridx + gidx * blocks + bidx * blocks * blocks
+        feature[idx] += 1
+        pixel_count += 1
+
+    return [x / float(pixel_count) for x in feature]
 
 
 '''
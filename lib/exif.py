@@ -0,0 +1,193 @@
+"""
+exif.py
+
+Purpose: read GPS, size and timestamp from JPEG headers without decoding pixel data. Only the marker segments ahead
+         of the image data are read (APP1/EXIF and the start-of-frame header), so a full directory of frames can be
+         scanned with a few kilobytes of I/O per file.
+"""
+import struct
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from lib import common
+
+
+DEFAULT_THREADS = 8
+MAX_HEADER_BYTES = 1024 * 1024  # stop looking for SOF/APP1 after this many bytes
+
+TAG_DATETIME = 306
+TAG_EXIF_IFD = 34665
+TAG_GPS_IFD = 34853
+TAG_DATETIME_ORIGINAL = 36867
+EXIF_TIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+# start-of-frame markers (baseline, progressive, lossless, arithmetic); all carry the frame size
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+SOS_MARKER = 0xDA
+APP1_MARKER = 0xE1
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+# TIFF field type -> (struct code, byte size)
+TIFF_TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('L', 4), 5: ('LL', 8), 7: ('B', 1), 9: ('l', 4),
+              10: ('ll', 8)}
+
+ImageMetadata = namedtuple('ImageMetadata', ['path', 'gps', 'size', 'timestamp'])
+
+
+def _read_ifd(tiff, offset, endian):
+    """
+    Read one IFD of a TIFF structure
+
+    Values are returned in the same layout as PIL's _getexif(): strings for ASCII, (numerator, denominator) for
+    single rationals, tuples for multi-value fields and bytes for BYTE/UNDEFINED fields.
+
+    :param tiff: <bytes> TIFF payload of the APP1 segment
+    :param offset: <int> offset of the IFD within tiff
+    :param endian: <str> '<' or '>'
+    :return: <dict> {tag: value}
+    """
+    tags = {}
+    if offset + 2 > len(tiff):
+        return tags
+    entry_count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    for i in range(entry_count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, field_type, count = struct.unpack_from(endian + 'HHL', tiff, entry)
+        if field_type not in TIFF_TYPES:
+            continue
+        code, size = TIFF_TYPES[field_type]
+        data_len = size * count
+        if data_len <= 4:
+            data_offset = entry + 8
+        else:
+            data_offset = struct.unpack_from(endian + 'L', tiff, entry + 8)[0]
+        if data_offset + data_len > len(tiff):
+            continue
+        raw = tiff[data_offset:data_offset + data_len]
+
+        if field_type == 2:
+            value = raw.split(b'\x00', 1)[0].decode('ascii', 'replace')
+        elif field_type in (1, 7):
+            value = raw
+        elif field_type in (5, 10):
+            value = tuple(struct.unpack_from(endian + code, raw, j * size) for j in range(count))
+            if count == 1:
+                value = value[0]
+        else:
+            value = struct.unpack(endian + code * count, raw)
+            if count == 1:
+                value = value[0]
+        tags[tag] = value
+
+    return tags
+
+
+def parse_tiff(tiff):
+    """
+    Parse the TIFF structure of an EXIF segment
+
+    :param tiff: <bytes> payload following the 'Exif\\0\\0' header
+    :return: <dict> IFD0 and EXIF IFD tags, with tag 34853 holding a dict of GPS tags (as PIL's _getexif())
+    """
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        raise Exception("Invalid TIFF byte order marker {0}".format(tiff[:2]))
+
+    tags = _read_ifd(tiff, struct.unpack_from(endian + 'L', tiff, 4)[0], endian)
+    if TAG_EXIF_IFD in tags:
+        tags.update(_read_ifd(tiff, tags.pop(TAG_EXIF_IFD), endian))
+    if TAG_GPS_IFD in tags:
+        tags[TAG_GPS_IFD] = _read_ifd(tiff, tags[TAG_GPS_IFD], endian)
+
+    return tags
+
+
+def read_header(image_path):
+    """
+    Read the EXIF tags and frame size of a JPEG, without decoding pixel data
+
+    :param image_path: <str>
+    :return: <dict>, <tuple> EXIF tags ({} if none) and (x_size, y_size) (None if not found)
+    """
+    tags = {}
+    size = None
+    with open(image_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            raise Exception("{0} is not a JPEG file".format(image_path))
+
+        while f.tell() < MAX_HEADER_BYTES:
+            byte = f.read(1)
+            if not byte:
+                break
+            if byte != b'\xff':
+                continue
+            marker = f.read(1)
+            while marker == b'\xff':  # fill bytes
+                marker = f.read(1)
+            if not marker:
+                break
+            marker = marker[0]
+            if marker in STANDALONE_MARKERS:
+                continue
+            if marker == SOS_MARKER:
+                break
+
+            seg_len = struct.unpack('>H', f.read(2))[0] - 2
+            if marker == APP1_MARKER and not tags:
+                payload = f.read(seg_len)
+                if payload[:6] == b'Exif\x00\x00':
+                    tags = parse_tiff(payload[6:])
+            elif marker in SOF_MARKERS:
+                y_size, x_size = struct.unpack('>HH', f.read(5)[1:])
+                size = (x_size, y_size)
+                break
+            else:
+                f.seek(seg_len, 1)
+
+    return tags, size
+
+
+def read_metadata(image_path):
+    """
+    Read GPS tags, size and capture timestamp of a JPEG
+
+    :param image_path: <str>
+    :return: <ImageMetadata> gps is None if the image is not geotagged; timestamp is None if not recorded
+    """
+    tags, size = read_header(image_path)
+
+    timestamp = None
+    for tag in (TAG_DATETIME_ORIGINAL, TAG_DATETIME):
+        try:
+            timestamp = datetime.strptime(tags[tag].strip(), EXIF_TIME_FORMAT)
+            break
+        except (KeyError, ValueError):
+            continue
+
+    return ImageMetadata(image_path, tags.get(TAG_GPS_IFD) or None, size, timestamp)
+
+
+def read_directory_metadata(image_paths, threads=DEFAULT_THREADS, show_progress=True):
+    """
+    Read metadata of many JPEGs in parallel
+
+    :param image_paths: <list> paths to JPEG images
+    :param threads: <int> number of threads reading headers (default=8)
+    :param show_progress: <bool> display progress bar
+    :return: <OrderedDict> {image_path: ImageMetadata}, in the order of image_paths
+    """
+    metadata = OrderedDict()
+    total = len(image_paths)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for it, meta in enumerate(executor.map(read_metadata, image_paths), 1):
+            metadata[meta.path] = meta
+            if show_progress:
+                common.progress(it, total, "headers read")
+
+    return metadata
@@ -0,0 +1,279 @@
+"""
+frames.py
+
+Purpose: index the frames of a capture directory once (a single directory scan), with the capture time parsed from
+         each file name (e.g., '20180512103005.jpg' from scripts/default_capture.sh, or '2018-05-12_10:30:05.jpg'
+         before batch_rename.py) or read from EXIF, so tools can list frames and query them by time range without
+         listing the directory again. Time-of-day windows (e.g., '22:00-02:00' or 'sunset-30-sunset+30') select frames
+         from every day with one bisect per window per day.
+"""
+import os
+import re
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+from lib import cache, common, exif, geotools
+
+
+TIME_FORMAT = "%Y%m%d%H%M%S"  # file names written by scripts/default_capture.sh
+# year, month, day, hour, minute, second; optionally separated by one character (e.g., '2018-05-12_10:30:05')
+TIME_RE = re.compile(r'(?<!\d)(\d{4})\D?(\d{2})\D?(\d{2})\D?(\d{2})\D?(\d{2})\D?(\d{2})(?!\d)')
+
+EXIF_TIME_PARAMS = "exif:time"  # cache key of EXIF capture times (see lib.cache)
+SUN_EVENTS = ('sunrise', 'sunset')
+# a window endpoint is a time of day ('HH' or 'HH:MM'), or a sun event with an offset in minutes (e.g., 'sunrise-30')
+ENDPOINT = r'\d{1,2}(?::\d{2})?|(?:sunrise|sunset)(?:[+-]\d+)?'
+WINDOW_RE = re.compile(r'({0})-({0})'.format(ENDPOINT))
+
+# timestamp: capture time parsed from the file name (or read from EXIF), None if unknown
+Frame = namedtuple('Frame', ['path', 'timestamp'])
+
+# start and end are (event, minutes): minutes after midnight if event is None, else minutes after event ('sunrise' or
+# 'sunset'); a window whose end is not after its start ends on the next day (e.g., '22:00-02:00')
+TimeWindow = namedtuple('TimeWindow', ['start', 'end'])
+
+
+def parse_timestamp(path):
+    """
+    :param path: <str> frame path
+    :return: <datetime.datetime> capture time in the file name, None if not found or not a valid time
+    """
+    match = TIME_RE.search(os.path.splitext(os.path.basename(path))[0])
+    if match is None:
+        return None
+    try:
+        return datetime.strptime("".join(match.groups()), TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def exif_timestamps(paths, cache_path=None):
+    """
+    Capture times from EXIF (DateTimeOriginal, else DateTime), reading only JPEG headers
+
+    :param paths: <list> JPEG paths
+    :param cache_path: <str> path to cache database, so later runs skip unchanged files (default=None, no caching)
+    :return: <list> datetime.datetime, None if a file has no capture time
+    """
+    def read_seconds(path):
+        return [geotools.seconds_since_epoch(exif.read_metadata(path).timestamp)]
+
+    if cache_path:
+        with cache.FeatureCache(cache_path) as fc:
+            seconds = [fc.lookup(p, EXIF_TIME_PARAMS, read_seconds)[0] for p in paths]
+            common.logger.info("exif times: {0} cached, {1} read".format(fc.hits, fc.misses))
+            fc.evict()
+    else:
+        seconds = [geotools.seconds_since_epoch(meta.timestamp)
+                   for meta in exif.read_directory_metadata(paths, show_progress=False).values()]
+
+    return [None if np.isnan(s) else geotools.EPOCH + timedelta(seconds=s) for s in seconds]
+
+
+class FrameIndex():
+    """
+    Frames of a directory in file name order, with a capture time index for range queries
+    """
+    def __init__(self, paths, timestamps=None):
+        """
+        :param paths: <list> frame paths, in order
+        :param timestamps: <list> capture time of each frame (default=None, parse from the file names)
+        """
+        if timestamps is None:
+            timestamps = [parse_timestamp(p) for p in paths]
+        self.frames = [Frame(p, t) for p, t in zip(paths, timestamps)]
+
+        # frames with a capture time, in time order (ties in file name order)
+        timed = sorted((f for f in self.frames if f.timestamp is not None), key=lambda f: f.timestamp)
+        self.timed = timed
+        self.times = [f.timestamp for f in timed]
+
+    @classmethod
+    def scan(cls, src, ext=None, exif_time=False, cache_path=None):
+        """
+        :param src: <str> directory
+        :param ext: <str or tuple> file extension(s) to keep, matched case-insensitively (default=None, all files)
+        :param exif_time: <bool> read capture times from EXIF instead of the file names (JPEG only)
+        :param cache_path: <str> with exif_time, path to cache database of EXIF times (default=None, no caching)
+        :return: <FrameIndex>
+        """
+        paths = common.scan_dir(src, ext)
+
+        return cls(paths, exif_timestamps(paths, cache_path) if exif_time else None)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __getitem__(self, item):
+        return self.frames[item]
+
+    @property
+    def paths(self):
+        """
+        :return: <list> frame paths, in file name order
+        """
+        return [f.path for f in self.frames]
+
+    @property
+    def untimed(self):
+        """
+        :return: <list> frames without a capture time in the file name
+        """
+        return [f for f in self.frames if f.timestamp is None]
+
+    def between(self, start=None, end=None):
+        """
+        Frames captured in [start, end)
+
+        :param start: <datetime.datetime> (default=None, from the first frame)
+        :param end: <datetime.datetime> (default=None, to the last frame)
+        :return: <list> frames, in time order; frames without a capture time are never included
+        """
+        lo = 0 if start is None else bisect_left(self.times, start)
+        hi = len(self.times) if end is None else bisect_left(self.times, end)
+
+        return self.timed[lo:hi]
+
+    def days(self):
+        """
+        :return: <list> dates with at least one frame, in order
+        """
+        return sorted({t.date() for t in self.times})
+
+    def select(self, windows, lat=None, lon=None, utc_offset=None):
+        """
+        Frames captured in any of the windows, on any day
+
+        :param windows: <list> TimeWindow (see parse_window())
+        :param lat: <float> latitude of the camera, for sunrise/sunset windows
+        :param lon: <float> longitude of the camera, for sunrise/sunset windows
+        :param utc_offset: <float> hours from UTC of the capture times, for sunrise/sunset windows (default=None, the
+                           local time zone of this computer on each day)
+        :return: <list> frames, in time order
+        """
+        days = set(self.days())
+        # also start windows on the day before each day with frames, for windows past midnight (the day before may
+        # have no frames of its own, e.g., the first day, or after a day without captures)
+        days = sorted(days | {day - timedelta(days=1) for day in days})
+
+        ranges = []
+        for window in windows:
+            ranges.extend(window_ranges(window, days, lat=lat, lon=lon, utc_offset=utc_offset))
+
+        # merge overlapping ranges, so frames in several windows are selected once
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        selected = []
+        for start, end in merged:
+            selected.extend(self.between(start, end))
+
+        return selected
+
+
+def _parse_endpoint(text):
+    """
+    :param text: <str> e.g., '08', '08:30', 'sunrise' or 'sunset-45'
+    :return: <tuple> (event, minutes)
+    """
+    for event in SUN_EVENTS:
+        if text.startswith(event):
+            return event, int(text[len(event):] or 0)
+
+    hour, _, minute = text.partition(':')
+    hour, minute = int(hour), int(minute or 0)
+    if hour > 24 or minute > 59 or (hour == 24 and minute):
+        raise Exception("time of day must be in range [00:00, 24:00]; value supplied: {0}".format(text))
+
+    return None, hour * 60 + minute
+
+
+def parse_window(spec):
+    """
+    :param spec: <str> 'START-END', each a time of day ('HH' or 'HH:MM') or a sun event with an optional offset in
+                 minutes ('sunrise', 'sunset+30'); e.g., '07:30-09:00', '22:00-02:00', 'sunset-30-sunset+30'
+    :return: <TimeWindow>
+    """
+    match = WINDOW_RE.fullmatch(spec.strip().lower())
+    if match is None:
+        raise Exception("time window must be START-END, each HH[:MM] or sunrise/sunset[+-MINUTES]; value supplied: "
+                        "{0}".format(spec))
+
+    return TimeWindow(_parse_endpoint(match.group(1)), _parse_endpoint(match.group(2)))
+
+
+def hour_window(time_start, time_end):
+    """
+    :param time_start: <int> start hour
+    :param time_end: <int> end hour (inclusive)
+    :return: <TimeWindow>
+    """
+    return TimeWindow((None, time_start * 60), (None, (time_end + 1) * 60))
+
+
+def _local_utc_offset(day):
+    """
+    :return: <float> hours from UTC of this computer's time zone at noon on day
+    """
+    return datetime.combine(day, time(12)).astimezone().utcoffset().total_seconds() / 3600.
+
+
+def _resolve(endpoint, day, sun):
+    """
+    :param endpoint: <tuple> (event, minutes)
+    :param day: <datetime.date>
+    :param sun: <function> sun(day) returns (sunrise, sunset)
+    :return: <datetime.datetime>, None if the sun event does not happen that day
+    """
+    event, minutes = endpoint
+    if event is None:
+        base = datetime.combine(day, time())
+    else:
+        base = sun(day)[SUN_EVENTS.index(event)]
+        if base is None:
+            return None
+
+    return base + timedelta(minutes=minutes)
+
+
+def window_ranges(window, days, lat=None, lon=None, utc_offset=None):
+    """
+    :param window: <TimeWindow>
+    :param days: <list> datetime.date on which the window starts
+    :param lat: <float> latitude, for sunrise/sunset windows
+    :param lon: <float> longitude, for sunrise/sunset windows
+    :param utc_offset: <float> hours from UTC (default=None, the local time zone of this computer on each day)
+    :return: <list> (start, end) datetimes, end exclusive; days without a sunrise/sunset are skipped
+    """
+    if (window.start[0] or window.end[0]) and (lat is None or lon is None):
+        raise Exception("sunrise/sunset windows require the camera's latitude and longitude")
+
+    sun_cache = {}
+
+    def sun(day):
+        if day not in sun_cache:
+            offset = _local_utc_offset(day) if utc_offset is None else utc_offset
+            sun_cache[day] = geotools.sun_times(day, lat, lon, utc_offset=offset)
+        return sun_cache[day]
+
+    ranges = []
+    for day in days:
+        start = _resolve(window.start, day, sun)
+        end = _resolve(window.end, day, sun)
+        if end is not None and start is not None and end <= start:
+            end = _resolve(window.end, day + timedelta(days=1), sun)
+        if start is None or end is None:
+            continue
+        ranges.append((start, end))
+
+    return ranges
@@ -6,6 +6,22 @@ Purpose: general tools for handing geospatial information.
 Author:     Steve Foga
 Created:    03 Aug 2019
 """
+from collections import OrderedDict, namedtuple
+from datetime import datetime, time, timedelta
+from itertools import chain
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371008.8  # mean earth radius, in meters
+NEGATIVE_REFS = ('S', 'W')
+EPOCH = datetime(1970, 1, 1)
+DEFAULT_MAX_SPEED = 50.  # meters/second (180 km/h); faster movement between fixes is treated as a GPS jump
+JUMP_LOOKAHEAD = 5  # fixes checked after a suspected jump, to tell a spike from a real change of position
+SUN_ZENITH = 90.833  # degrees; sun's upper limb on the horizon, including atmospheric refraction (NOAA)
+
+# lats/longs in decimal degrees; times in seconds (NaN if unknown); distance (meters) and speed (meters/second) are
+# relative to the previous frame (0 and NaN for the first frame); bbox is (min_lat, min_long, max_lat, max_long)
+Track = namedtuple('Track', ['paths', 'lats', 'longs', 'times', 'distance', 'speed', 'bbox'])
 
 
 def get_dd(crds):
@@ -89,4 +105,322 @@ def scale_map_to_img(map_dim, img_dim):
     # using /1.6 to offset from the lower left edge
     map_pos = int(round((map_dim * img_dim) / 1.6))
 
-    return map_pos
\ No newline at end of file
+    return map_pos
+
+
+def rationals_to_float(values):
+    """
+    Convert EXIF rationals to floats, in one pass
+
+    :param values: <list> sequences of rationals (one per coordinate), either (numerator, denominator) tuples or
+                   numbers (e.g., PIL's IFDRational)
+    :return: <numpy.ndarray> float64, shape (len(values), rationals per value); NaN where the denominator is 0
+    """
+    if not values:
+        return np.empty((0, 0))
+
+    if isinstance(values[0][0], tuple):
+        # flatten (numerator, denominator) pairs straight into one buffer (much faster than nested np.asarray)
+        pairs = np.fromiter(chain.from_iterable(chain.from_iterable(values)), dtype=np.float64)
+        pairs = pairs.reshape(len(values), -1, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            arr = pairs[..., 0] / pairs[..., 1]
+        arr[~np.isfinite(arr)] = np.nan
+    else:
+        arr = np.asarray(values, dtype=np.float64)
+
+    return arr
+
+
+def dms_to_dd(dms, refs):
+    """
+    Convert degrees, minutes, seconds to signed decimal degrees
+
+    :param dms: <numpy.ndarray> shape (n, 3) of degrees, minutes, seconds
+    :param refs: <list> hemisphere of each coordinate ('N', 'S', 'E' or 'W')
+    :return: <numpy.ndarray> shape (n,)
+    """
+    dms = np.asarray(dms, dtype=np.float64).reshape(-1, 3)
+    dd = dms[:, 0] + dms[:, 1] / 60. + dms[:, 2] / 3600.
+    negative = np.isin(np.asarray(refs), NEGATIVE_REFS)
+
+    return np.where(negative, -dd, dd)
+
+
+def haversine(lats1, longs1, lats2, longs2):
+    """
+    Great-circle distance between coordinates
+
+    :param lats1: <numpy.ndarray> decimal degrees
+    :param longs1: <numpy.ndarray> decimal degrees
+    :param lats2: <numpy.ndarray> decimal degrees
+    :param longs2: <numpy.ndarray> decimal degrees
+    :return: <numpy.ndarray> meters
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lats1, longs1, lats2, longs2))
+    a = np.sin((lat2 - lat1) / 2.) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.) ** 2
+
+    return 2. * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0., 1.)))
+
+
+def build_track(paths, lats, longs, times=None):
+    """
+    Derive per-frame distance, speed and bounding box of a track
+
+    :param paths: <list> image path of each frame
+    :param lats: <numpy.ndarray> decimal degrees
+    :param longs: <numpy.ndarray> decimal degrees
+    :param times: <numpy.ndarray> seconds of each frame, NaN if unknown (default=None, all unknown)
+    :return: <Track>
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    longs = np.asarray(longs, dtype=np.float64)
+    times = np.full(lats.shape, np.nan) if times is None else np.asarray(times, dtype=np.float64)
+
+    distance = np.zeros(lats.shape)
+    speed = np.full(lats.shape, np.nan)
+    if lats.size > 1:
+        distance[1:] = haversine(lats[:-1], longs[:-1], lats[1:], longs[1:])
+        elapsed = np.diff(times)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speed[1:] = np.where(elapsed > 0, distance[1:] / elapsed, np.nan)
+
+    if lats.size:
+        bbox = (float(lats.min()), float(longs.min()), float(lats.max()), float(longs.max()))
+    else:
+        bbox = None
+
+    return Track(list(paths), lats, longs, times, distance, speed, bbox)
+
+
+def track_from_metadata(metadata):
+    """
+    Build a track from the GPS tags of a sequence of images; the rational GPS tags of all images are converted in one
+    vectorized pass (degrees + minutes/60 + seconds/3600)
+
+    :param metadata: <iterable> lib.exif.ImageMetadata of each image (path, gps tags, capture timestamp), in frame
+                     order
+    :return: <Track>, <list> track of geotagged images, paths of images without usable coordinates
+    """
+    tagged, skipped = [], []
+    for meta in metadata:
+        try:
+            gps = meta.gps
+            if len(gps[2]) == 3 and len(gps[4]) == 3 and gps[1] and gps[3]:
+                tagged.append(meta)
+                continue
+        except (KeyError, TypeError):
+            pass
+        skipped.append(meta.path)
+
+    if not tagged:
+        return build_track([], [], []), skipped
+
+    paths = [meta.path for meta in tagged]
+    lats = dms_to_dd(rationals_to_float([meta.gps[2] for meta in tagged]), [meta.gps[1] for meta in tagged])
+    longs = dms_to_dd(rationals_to_float([meta.gps[4] for meta in tagged]), [meta.gps[3] for meta in tagged])
+
+    # capture time as seconds since 1970 (NaN if not recorded)
+    times = np.fromiter((seconds_since_epoch(meta.timestamp) for meta in tagged), dtype=np.float64,
+                        count=len(tagged))
+
+    # drop frames with zero denominators
+    valid = np.isfinite(lats) & np.isfinite(longs)
+    if not valid.all():
+        skipped.extend(p for p, ok in zip(paths, valid) if not ok)
+        paths = [p for p, ok in zip(paths, valid) if ok]
+
+    return build_track(paths, lats[valid], longs[valid], times[valid]), skipped
+
+
+def seconds_since_epoch(timestamp):
+    """
+    :param timestamp: <datetime.datetime or None> naive capture time
+    :return: <float> seconds since 1970, NaN if timestamp is None
+    """
+    return (timestamp - EPOCH).total_seconds() if timestamp else np.nan
+
+
+def frame_times(times):
+    """
+    Make frame times usable for speed and interpolation: unknown times are interpolated from the frame position,
+    and runs of identical times (EXIF times have 1 second resolution) are spread evenly up to the next distinct time
+
+    :param times: <numpy.ndarray> seconds, NaN if unknown
+    :return: <numpy.ndarray> seconds, non-decreasing if times is; frame index if no time is known
+    """
+    times = np.asarray(times, dtype=np.float64)
+    index = np.arange(times.size, dtype=np.float64)
+    known = np.isfinite(times)
+    if not known.any():
+        return index
+    times = np.interp(index, index[known], times[known])
+
+    # spread runs of repeated times over the interval to the next time
+    starts = np.flatnonzero(np.r_[True, np.diff(times) != 0])
+    ends = np.r_[starts[1:], times.size]
+    step = np.r_[np.diff(times[starts]), np.nan] / (ends - starts)
+    if starts.size > 1:
+        step[-1] = step[-2] if ends[-1] - starts[-1] > 1 else 0.
+    else:
+        step[-1] = 0.
+    run_offset = index - np.repeat(starts, ends - starts)
+
+    return times + run_offset * np.repeat(step, ends - starts)
+
+
+def find_jumps(lats, longs, times, max_speed=DEFAULT_MAX_SPEED):
+    """
+    Find fixes that imply moving faster than max_speed from the last good fix. A fix is only rejected if one of the
+    next JUMP_LOOKAHEAD fixes is again reachable from the last good fix (a spike); otherwise the track really moved
+    (e.g., after a gap in recording) and the fix is kept.
+
+    :param lats: <numpy.ndarray> decimal degrees
+    :param longs: <numpy.ndarray> decimal degrees
+    :param times: <numpy.ndarray> seconds (see frame_times())
+    :param max_speed: <float> meters/second
+    :return: <numpy.ndarray> bool, True for rejected fixes
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    longs = np.asarray(longs, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    jumps = np.zeros(lats.size, dtype=bool)
+
+    def speeds(i, js):
+        dist = haversine(lats[i], longs[i], lats[js], longs[js])
+        elapsed = np.abs(times[js] - times[i])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(elapsed > 0, dist / elapsed, np.where(dist > 0, np.inf, 0.))
+
+    if lats.size < 2:
+        return jumps
+
+    # the first fix has no good fix before it; reject it if its neighbours agree with each other but not with it
+    last = 0
+    if lats.size > 2 and speeds(0, 1) > max_speed and speeds(1, 2) <= max_speed:
+        jumps[0] = True
+        last = 1
+
+    for i in range(last + 1, lats.size):
+        if speeds(last, i) <= max_speed:
+            last = i
+            continue
+        ahead = np.arange(i + 1, min(i + 1 + JUMP_LOOKAHEAD, lats.size))
+        if ahead.size and (speeds(last, ahead) <= max_speed).any():
+            jumps[i] = True
+        else:
+            last = i
+
+    return jumps
+
+
+def clean_coords(img_coords, times, max_speed=DEFAULT_MAX_SPEED):
+    """
+    Reject GPS jumps and fill missing fixes: fixes implying more than max_speed are rejected (see find_jumps()), and
+    rejected or missing fixes are linearly interpolated by time between the surrounding good fixes (fixes before the
+    first or after the last good fix take its position)
+
+    :param img_coords: <OrderedDict> image path -> [lat, long] (None if the image has no fix), in frame order
+    :param times: <list> capture time of each image, in seconds (NaN if unknown); need not be increasing
+    :return: <OrderedDict>, <list> image path -> (lat, long) for every image, paths of images whose fix was
+             interpolated; empty if no image has a fix
+    """
+    paths = list(img_coords.keys())
+    coords = np.array([c if c is not None else (np.nan, np.nan) for c in img_coords.values()],
+                      dtype=np.float64).reshape(-1, 2)
+    has_fix = np.isfinite(coords).all(axis=1)
+    if not has_fix.any():
+        return OrderedDict(), []
+
+    times = frame_times(times)
+
+    # frame order is not always time order (e.g., file names after a camera counter rolls over), and both jump
+    # rejection and interpolation need increasing times; work in time order, then map back to frame order
+    order = np.argsort(times, kind='stable')
+    times, coords, has_fix = times[order], coords[order], has_fix[order]
+    good = has_fix.copy()
+    good[has_fix] = ~find_jumps(coords[has_fix, 0], coords[has_fix, 1], times[has_fix], max_speed=max_speed)
+
+    lats = np.empty_like(times)
+    longs = np.empty_like(times)
+    lats[order] = np.interp(times, times[good], coords[good, 0])
+    longs[order] = np.interp(times, times[good], coords[good, 1])
+    good_frames = np.empty_like(good)
+    good_frames[order] = good
+    fixed = [p for p, ok in zip(paths, good_frames) if not ok]
+
+    return OrderedDict(zip(paths, zip(lats.tolist(), longs.tolist()))), fixed
+
+
+def simplify(lats, longs, tolerance):
+    """
+    Douglas-Peucker simplification of a polyline
+
+    :param lats: <numpy.ndarray> decimal degrees
+    :param longs: <numpy.ndarray> decimal degrees
+    :param tolerance: <float> max distance of a dropped vertex from the simplified line, in meters
+    :return: <numpy.ndarray> indices of kept vertices (always includes the first and last)
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    longs = np.asarray(longs, dtype=np.float64)
+    if lats.size < 3 or tolerance <= 0:
+        return np.arange(lats.size)
+
+    # local equirectangular projection, in meters
+    y = np.radians(lats) * EARTH_RADIUS_M
+    x = np.radians(longs) * EARTH_RADIUS_M * np.cos(np.radians(np.mean(lats)))
+
+    keep = np.zeros(lats.size, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, lats.size - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        seg_len = np.hypot(dx, dy)
+        if seg_len > 0:
+            dist = np.abs(px * dy - py * dx) / seg_len
+        else:
+            dist = np.hypot(px, py)
+        split = int(np.argmax(dist))
+        if dist[split] > tolerance:
+            split += first + 1
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return np.flatnonzero(keep)
+
+
+def sun_times(day, lat, lon, utc_offset=0.):
+    """
+    Sunrise and sunset, from NOAA's general solar position equations (accurate to about a minute at mid latitudes;
+    no network access)
+
+    :param day: <datetime.date>
+    :param lat: <float> decimal degrees, north positive
+    :param lon: <float> decimal degrees, east positive
+    :param utc_offset: <float> hours added to UTC to get the returned (local) times, e.g., -5 for CDT
+    :return: <tuple> (sunrise, sunset) naive datetimes; (None, None) if the sun does not rise or set that day
+    """
+    # fractional year at noon, in radians
+    gamma = 2 * np.pi / 365. * (day.timetuple().tm_yday - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma) -
+                       0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma) - 0.006758 * np.cos(2 * gamma) +
+            0.000907 * np.sin(2 * gamma) - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    phi = np.radians(lat)
+    cos_ha = np.cos(np.radians(SUN_ZENITH)) / (np.cos(phi) * np.cos(decl)) - np.tan(phi) * np.tan(decl)
+    if not -1. <= cos_ha <= 1.:
+        # polar night or midnight sun
+        return None, None
+    ha = np.degrees(np.arccos(cos_ha))
+
+    midnight = datetime.combine(day, time()) + timedelta(hours=utc_offset)
+    sunrise = midnight + timedelta(minutes=float(720. - 4. * (lon + ha) - eqtime))
+    sunset = midnight + timedelta(minutes=float(720. - 4. * (lon - ha) - eqtime))
+
+    return sunrise, sunset
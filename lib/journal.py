@@ -0,0 +1,120 @@
+"""
+journal.py
+
+Purpose: append-only journal of sort_images.py, recording the class of each image and whether it was moved, so an
+         interrupted run can resume without classifying images again. Records are JSON lines; writes are flushed and
+         fsynced in batches (every SYNC_INTERVAL records or SYNC_SECONDS), so journaling does not throttle runs on SD
+         cards. A crash can lose the last unsynced records; those images are classified again on resume.
+"""
+import os
+import json
+import time
+from collections import namedtuple
+
+from lib import common
+
+
+logger = common.logger
+
+SYNC_INTERVAL = 256  # records between fsyncs
+SYNC_SECONDS = 5.  # max seconds between fsyncs
+CLASSIFIED = 'classified'
+MOVED = 'moved'
+
+# status: CLASSIFIED or MOVED; dst: destination path (None until moved)
+Entry = namedtuple('Entry', ['img_class', 'status', 'dst'])
+
+
+def read_journal(journal_path):
+    """
+    Read the latest entry of each image; torn or invalid lines (e.g., from a crash while writing) are skipped
+
+    :param journal_path: <str>
+    :return: <dict> {absolute image path: Entry}; empty if the journal does not exist
+    """
+    entries = {}
+    if not os.path.isfile(journal_path):
+        return entries
+
+    bad = 0
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                entries[record['path']] = Entry(record['class'], record['status'], record.get('dst'))
+            except (ValueError, KeyError, TypeError):
+                bad += 1
+    if bad:
+        logger.warning("journal {0}: skipped {1} unreadable records".format(journal_path, bad))
+
+    return entries
+
+
+class Journal():
+    """
+    Append records to a journal file, syncing them to disk in batches
+    """
+    def __init__(self, journal_path, resume=False):
+        """
+        :param journal_path: <str>
+        :param resume: <bool> keep the records of earlier runs (otherwise start a new journal)
+        """
+        self.journal_path = journal_path
+        self.entries = read_journal(journal_path) if resume else {}
+        self.f = open(journal_path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self.f.tell():
+            with open(journal_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+            if torn:
+                # end the torn last record, so the next record starts on its own line
+                self.f.write("\n")
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.f is None:
+            return
+        self.sync()
+        self.f.close()
+        self.f = None
+
+    def sync(self):
+        """
+        Flush pending records to disk
+        """
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def _sync_if_due(self):
+        self._pending += 1
+        if self._pending >= SYNC_INTERVAL or time.time() - self._last_sync >= SYNC_SECONDS:
+            self.sync()
+
+    def record(self, path, img_class, status, dst=None):
+        """
+        :param path: <str> image path
+        :param img_class: <int> 1 (good/matching) or 0 (bad/non-matching)
+        :param status: <str> CLASSIFIED or MOVED
+        :param dst: <str> destination path, once moved
+        :return:
+        """
+        path = os.path.abspath(path)
+        self.f.write(json.dumps({'path': path, 'class': int(img_class), 'status': status, 'dst': dst}) + "\n")
+        self.entries[path] = Entry(int(img_class), status, dst)
+        self._sync_if_due()
+
+    def lookup(self, path):
+        """
+        :param path: <str> image path
+        :return: <Entry> latest entry of path, None if not in the journal
+        """
+        return self.entries.get(os.path.abspath(path))
@@ -0,0 +1,131 @@
+"""
+maprender.py
+
+Purpose: render track maps for add_map_to_timelapse.py. The static layers (axes background, basemap and track line) are
+         drawn once into a cached RGBA buffer; each frame only restores that buffer and draws the current position
+         (and breadcrumbs) on top of it, using matplotlib blitting. Breadcrumbs accumulate in a second cached buffer,
+         so each frame only draws the points visited since the previous frame.
+"""
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+def map_pixel_size(map_x_dim, map_y_dim):
+    """
+    :param map_x_dim: <float> map width, in inches
+    :param map_y_dim: <float> map height, in inches
+    :return: <tuple> (x_size, y_size) of a map rendered by MapRenderer, in pixels
+    """
+    dpi = matplotlib.rcParams['figure.dpi']
+    return int(round(map_x_dim * dpi)), int(round(map_y_dim * dpi))
+
+
+class MapRenderer():
+    def __init__(self, lats, longs, map_x_dim, map_y_dim, map_line_width, map_alpha, map_point_size, map_point_color,
+                 bc_point_size, bc_point_color, line_lats=None, line_longs=None, basemap=None, basemap_alpha=1.0):
+        """
+        :param lats: <list> latitude of every track point (in frame order; also used for breadcrumbs)
+        :param longs: <list> longitude of every track point (in frame order; also used for breadcrumbs)
+        :param map_x_dim: <float> map width, in inches
+        :param map_y_dim: <float> map height, in inches
+        :param map_line_width: <float> width of track line
+        :param map_alpha: <float> transparency of map background
+        :param map_point_size: <int> size of current location point
+        :param map_point_color: <str> color of current location point
+        :param bc_point_size: <int> size of breadcrumb points
+        :param bc_point_color: <str> color of breadcrumb points
+        :param line_lats: <list> latitude of track line vertices (default=None, use lats); e.g., a simplified track
+        :param line_longs: <list> longitude of track line vertices (default=None, use longs)
+        :param basemap: <tuple> (RGBA image, (min_long, max_long, min_lat, max_lat)) drawn behind the track, e.g.,
+                        from lib.basemap.load_basemap() (default=None, no basemap)
+        :param basemap_alpha: <float> transparency of basemap
+        """
+        self.crumb_offsets = np.column_stack([longs, lats]) if len(lats) else np.empty((0, 2))
+        self.fig = Figure(figsize=(map_x_dim, map_y_dim))
+        self.canvas = FigureCanvasAgg(self.fig)
+        ax = self.fig.subplots()
+        self.ax = ax
+
+        # set farthest background layer as transparent
+        self.fig.patch.set_alpha(0.0)
+
+        # disable map plot frame
+        for spine in ('top', 'right', 'bottom', 'left'):
+            ax.spines[spine].set_visible(False)
+
+        if basemap is not None:
+            ax.imshow(basemap[0], extent=basemap[1], aspect='auto', interpolation='bilinear', alpha=basemap_alpha,
+                      zorder=0)
+
+        if line_lats is None or line_longs is None:
+            line_lats, line_longs = lats, longs
+        ax.plot(line_longs, line_lats, linewidth=map_line_width, zorder=1)
+
+        # per-frame layers; animated artists are skipped by canvas.draw() and drawn explicitly in render()
+        self.breadcrumbs = ax.scatter([], [], c=bc_point_color, s=bc_point_size, linewidth=0, zorder=2,
+                                      animated=True)
+        self.point, = ax.plot([], [], marker='o', color=map_point_color, markersize=map_point_size, zorder=3,
+                              animated=True)
+
+        # set axes to specific alpha
+        ax.patch.set_alpha(map_alpha)
+
+        # exclude axes
+        ax.xaxis.set_visible(False)
+        ax.yaxis.set_visible(False)
+
+        # draw static layers once and cache them
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+        # static layers plus breadcrumbs drawn so far
+        self.crumb_background = self.background
+        self.crumb_count = 0
+
+    def get_size(self):
+        """
+        :return: <tuple> (x_size, y_size) of rendered map, in pixels
+        """
+        return self.canvas.get_width_height()
+
+    def _draw_breadcrumbs(self, breadcrumb_count):
+        """
+        Bring the breadcrumb layer up to breadcrumb_count points, drawing only points not yet in it
+
+        :param breadcrumb_count: <int> number of track points (from the start) shown as breadcrumbs
+        :return:
+        """
+        if breadcrumb_count < self.crumb_count:
+            # frames out of order; start over from the static layers
+            self.crumb_background = self.background
+            self.crumb_count = 0
+
+        self.canvas.restore_region(self.crumb_background)
+        if breadcrumb_count > self.crumb_count:
+            self.breadcrumbs.set_offsets(self.crumb_offsets[self.crumb_count:breadcrumb_count])
+            self.ax.draw_artist(self.breadcrumbs)
+            self.crumb_background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self.crumb_count = breadcrumb_count
+
+    def render(self, value, breadcrumb_count=0):
+        """
+        Render map with the current location (and breadcrumbs)
+
+        Rendering frames in increasing breadcrumb_count order costs O(1) per frame for breadcrumbs; a smaller count
+        than the previous call redraws the breadcrumb layer from scratch.
+
+        :param value: <list> [lat, long] of current location
+        :param breadcrumb_count: <int> number of track points (from the start) shown as breadcrumbs (default=0)
+        :return: <numpy.ndarray> RGBA map, shape (y_size, x_size, 4)
+        """
+        if breadcrumb_count:
+            self._draw_breadcrumbs(breadcrumb_count)
+        else:
+            self.canvas.restore_region(self.background)
+
+        self.point.set_data([value[1]], [value[0]])
+        self.ax.draw_artist(self.point)
+
+        return np.array(self.canvas.buffer_rgba())
@@ -0,0 +1,264 @@
+"""
+transfer.py
+
+Purpose: copy, link or move many files (e.g., 100k+ frames on SD/USB storage) for the file utilities. Transfers run
+         on a thread pool, data copies stay in the kernel (reflink via FICLONE, then copy_file_range, then sendfile),
+         and existing destinations are detected by the transfer itself rather than by a separate check per file.
+"""
+import os
+import time
+import errno
+import shutil
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from lib import common
+
+
+logger = common.logger
+
+# copy: file data; copy2: file data and metadata (like shutil.copy2); link: hard link; reflink: copy-on-write clone
+# (btrfs, XFS); move: rename. link and reflink fall back to copy2 and copy where the file system cannot link/clone
+# (e.g., FAT/exFAT cards, or src and dst on different devices), and move falls back to copy2 + delete.
+METHODS = ('copy', 'copy2', 'link', 'reflink', 'move')
+DEFAULT_THREADS = 4
+FICLONE = 0x40049409  # linux/fs.h
+COPY_CHUNK = 1 << 30  # bytes per copy_file_range/sendfile call
+FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS, errno.EINVAL,
+                   errno.EMLINK, errno.ENOTTY, errno.EBADF}
+
+# files: files transferred; bytes: bytes of file data copied (0 for links and renames); skipped: transfers whose
+# source and destination are the same file; fallbacks: links/clones/renames done as copies instead
+TransferStats = namedtuple('TransferStats', ['files', 'bytes', 'seconds', 'skipped', 'fallbacks'])
+
+_kernel_copy = {'clone': fcntl is not None, 'copy_file_range': hasattr(os, 'copy_file_range'),
+                'sendfile': hasattr(os, 'sendfile')}
+
+
+def _clone(src_fd, dst_fd):
+    """
+    :return: <bool> True if dst was made a copy-on-write clone of src
+    """
+    if not _kernel_copy['clone']:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError as err:
+        if err.errno not in FALLBACK_ERRNOS:
+            raise
+        return False
+
+
+def _copy_data(src_fd, dst_fd):
+    """
+    Copy file data, in the kernel where possible
+
+    :return: <int> bytes copied
+    """
+    size = os.fstat(src_fd).st_size
+    for name, func in (('copy_file_range', getattr(os, 'copy_file_range', None)),
+                       ('sendfile', getattr(os, 'sendfile', None))):
+        if not _kernel_copy[name]:
+            continue
+        copied = 0
+        try:
+            while True:
+                if name == 'sendfile':
+                    sent = func(dst_fd, src_fd, copied, COPY_CHUNK)
+                else:
+                    sent = func(src_fd, dst_fd, COPY_CHUNK)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as err:
+            if err.errno not in FALLBACK_ERRNOS or copied:
+                raise
+            # not supported here (e.g., older kernel or file system); stop trying it
+            _kernel_copy[name] = False
+            continue
+        if copied == size:
+            return copied
+        # short copy; some file systems (e.g., FUSE, overlay or CIFS mounts) report end of file instead of an error
+        # for data they cannot copy in the kernel. Start over with the next method.
+        logger.debug("{0} copied {1} of {2} bytes; falling back".format(name, copied, size))
+        os.lseek(src_fd, 0, os.SEEK_SET)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+        os.ftruncate(dst_fd, 0)
+
+    copied = 0
+    with open(src_fd, 'rb', closefd=False) as fsrc, open(dst_fd, 'wb', closefd=False) as fdst:
+        for chunk in iter(lambda: fsrc.read(1 << 20), b''):
+            fdst.write(chunk)
+            copied += len(chunk)
+    if copied != size:
+        raise Exception("copied {0} bytes, but the source has {1} bytes (did it change during the copy?)"
+                        .format(copied, size))
+
+    return copied
+
+
+def _open_dst(dst, overwrite):
+    try:
+        return os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
+        if not overwrite:
+            raise
+    # remove rather than truncate, so a destination hard linked to the source is never emptied
+    os.unlink(dst)
+    return os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+
+
+def copy_file(src, dst, overwrite=False, metadata=False, clone=True):
+    """
+    Copy a file, as a copy-on-write clone if the file system supports it
+
+    :param src: <str>
+    :param dst: <str>
+    :param overwrite: <bool> replace dst if it exists (otherwise raise FileExistsError)
+    :param metadata: <bool> also copy permissions and timestamps (like shutil.copy2)
+    :param clone: <bool> try a copy-on-write clone first
+    :return: <int> bytes copied (0 if cloned)
+    """
+    with open(src, 'rb') as fsrc:
+        dst_fd = _open_dst(dst, overwrite)
+        try:
+            if clone and _clone(fsrc.fileno(), dst_fd):
+                copied = 0
+            else:
+                copied = _copy_data(fsrc.fileno(), dst_fd)
+        finally:
+            os.close(dst_fd)
+    if metadata:
+        shutil.copystat(src, dst)
+
+    return copied
+
+
+def _rename_no_clobber(src, dst):
+    """
+    Rename src to dst, raising FileExistsError if dst exists
+    """
+    try:
+        # a hard link fails atomically if dst exists
+        os.link(src, dst)
+    except OSError as err:
+        if err.errno == errno.EXDEV or err.errno not in FALLBACK_ERRNOS:
+            raise
+        # no hard links on this file system (e.g., FAT)
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(src, dst)
+        return
+    os.unlink(src)
+
+
+def transfer_file(src, dst, method='copy', overwrite=False):
+    """
+    Copy, link or move one file (see METHODS)
+
+    :param src: <str>
+    :param dst: <str>
+    :param method: <str> 'copy', 'copy2', 'link', 'reflink' or 'move'
+    :param overwrite: <bool> replace dst if it exists (otherwise raise FileExistsError)
+    :return: <int>, <bool> bytes copied, True if method fell back to a copy
+    """
+    if method == 'copy':
+        return copy_file(src, dst, overwrite=overwrite, clone=False), False
+
+    if method == 'copy2':
+        return copy_file(src, dst, overwrite=overwrite, metadata=True, clone=False), False
+
+    if method == 'reflink':
+        copied = copy_file(src, dst, overwrite=overwrite)
+        return copied, copied > 0
+
+    if method == 'link':
+        try:
+            try:
+                os.link(src, dst)
+            except FileExistsError:
+                if not overwrite:
+                    raise
+                os.unlink(dst)
+                os.link(src, dst)
+            return 0, False
+        except OSError as err:
+            if err.errno not in FALLBACK_ERRNOS:
+                raise
+        return copy_file(src, dst, overwrite=overwrite, metadata=True, clone=False), True
+
+    if method == 'move':
+        try:
+            if overwrite:
+                os.replace(src, dst)
+            else:
+                _rename_no_clobber(src, dst)
+            return 0, False
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+        copied = copy_file(src, dst, overwrite=overwrite, metadata=True)
+        os.unlink(src)
+        return copied, True
+
+    raise Exception("transfer method must be one of {0}; value supplied: {1}".format(METHODS, method))
+
+
+def transfer_files(pairs, method='copy', overwrite=False, threads=DEFAULT_THREADS, dryrun=False):
+    """
+    Transfer files on a thread pool, and log a summary (files, bytes, seconds)
+
+    If a destination is also the source of another transfer (e.g., renaming files in place), transfers run one at a
+    time, in the given order.
+
+    :param pairs: <list> (src, dst) paths
+    :param method: <str> see METHODS
+    :param overwrite: <bool> replace existing destinations (otherwise raise FileExistsError)
+    :param threads: <int> number of concurrent transfers
+    :param dryrun: <bool> log the summary of what would be transferred, but do not transfer
+    :return: <TransferStats>
+    """
+    if method not in METHODS:
+        raise Exception("transfer method must be one of {0}; value supplied: {1}".format(METHODS, method))
+
+    t0 = time.time()
+    todo = [(src, dst) for src, dst in pairs if os.path.abspath(src) != os.path.abspath(dst)]
+    skipped = len(pairs) - len(todo)
+
+    if dryrun:
+        stats = TransferStats(len(todo), 0, 0., skipped, 0)
+        logger.info("dryrun: would {0} {1} files ({2} skipped)".format(method, len(todo), skipped))
+        return stats
+
+    sources = {os.path.abspath(src) for src, _ in todo}
+    chained = any(os.path.abspath(dst) in sources for _, dst in todo)
+    if chained or threads <= 1:
+        results = [transfer_file(src, dst, method, overwrite) for src, dst in todo]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(lambda pair: transfer_file(pair[0], pair[1], method, overwrite), todo))
+
+    stats = TransferStats(len(results), sum(r[0] for r in results), time.time() - t0, skipped,
+                          sum(r[1] for r in results))
+    log_summary(stats, method)
+
+    return stats
+
+
+def log_summary(stats, method):
+    """
+    :param stats: <TransferStats>
+    :param method: <str>
+    :return:
+    """
+    secs = max(stats.seconds, 1e-9)
+    logger.info("{0}: {1} files, {2:.1f} MB copied in {3:.2f}s ({4:.0f} files/s, {5:.1f} MB/s); {6} skipped, "
+                "{7} fell back to copy".format(method, stats.files, stats.bytes / 1e6, stats.seconds,
+                                               stats.files / secs, stats.bytes / 1e6 / secs, stats.skipped,
+                                               stats.fallbacks))
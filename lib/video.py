@@ -0,0 +1,124 @@
+"""
+video.py
+
+Purpose: encode frames straight to a movie by streaming raw RGB frames into an ffmpeg subprocess (stdin pipe), so
+         frames do not need to be written to and decoded from intermediate image files.
+"""
+import shutil
+import subprocess
+import numpy as np
+
+from lib import common
+
+
+logger = common.logger
+
+DEFAULT_FPS = 30  # matches scripts/create_timelapse_movie.sh
+DEFAULT_CODEC = 'libx264'
+DEFAULT_PIX_FMT = 'yuv420p'  # widely playable; requires even frame dimensions (padded by ffmpeg_command())
+
+
+def ffmpeg_command(video_out, width, height, fps=DEFAULT_FPS, codec=DEFAULT_CODEC, pix_fmt=DEFAULT_PIX_FMT,
+                   ffmpeg='ffmpeg'):
+    """
+    Build ffmpeg command line reading raw RGB frames from stdin
+
+    :param video_out: <str> path to output movie (e.g., 'ride.mp4')
+    :param width: <int> frame width, in pixels
+    :param height: <int> frame height, in pixels
+    :param fps: <float> frame rate
+    :param codec: <str> ffmpeg video codec
+    :param pix_fmt: <str> output pixel format
+    :param ffmpeg: <str> ffmpeg executable
+    :return: <list>
+    """
+    return [ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '{0}x{1}'.format(width, height), '-r', str(fps), '-i', '-',
+            '-an', '-vcodec', codec, '-pix_fmt', pix_fmt, '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            video_out]
+
+
+class VideoWriter():
+    """
+    Pipe RGB frames into ffmpeg; frames must all be the same size, and are encoded in the order they are written.
+    """
+    def __init__(self, video_out, width, height, fps=DEFAULT_FPS, codec=DEFAULT_CODEC, pix_fmt=DEFAULT_PIX_FMT,
+                 ffmpeg='ffmpeg'):
+        """
+        :param video_out: <str> path to output movie (e.g., 'ride.mp4')
+        :param width: <int> frame width, in pixels
+        :param height: <int> frame height, in pixels
+        :param fps: <float> frame rate
+        :param codec: <str> ffmpeg video codec
+        :param pix_fmt: <str> output pixel format
+        :param ffmpeg: <str> ffmpeg executable
+        """
+        if shutil.which(ffmpeg) is None:
+            raise Exception("could not find ffmpeg executable '{0}'".format(ffmpeg))
+
+        self.video_out = video_out
+        self.size = (width, height)
+        self.frame_bytes = width * height * 3
+        self.frame_count = 0
+        self.cmd = ffmpeg_command(video_out, width, height, fps=fps, codec=codec, pix_fmt=pix_fmt, ffmpeg=ffmpeg)
+        logger.debug("ffmpeg command: {}".format(" ".join(self.cmd)))
+        self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, frame):
+        """
+        Append frame to movie
+
+        :param frame: <PIL.Image, numpy.ndarray or bytes> RGB frame of the writer's size
+        :return:
+        """
+        if hasattr(frame, 'tobytes'):
+            if not isinstance(frame, np.ndarray) and frame.mode != 'RGB':
+                frame = frame.convert('RGB')
+            frame = frame.tobytes()
+        if len(frame) != self.frame_bytes:
+            raise Exception("frame {0} has {1} bytes, expected {2} ({3}x{4} RGB)"
+                            .format(self.frame_count, len(frame), self.frame_bytes, *self.size))
+        try:
+            self.proc.stdin.write(frame)
+        except BrokenPipeError:
+            raise Exception("ffmpeg exited early (return code {0}) writing {1}"
+                            .format(self.proc.wait(), self.video_out))
+        self.frame_count += 1
+
+    def close(self):
+        """
+        Finish encoding and wait for ffmpeg
+
+        :return: <int> number of frames written
+        """
+        if self.proc is None:
+            return self.frame_count
+        self.proc.stdin.close()
+        returncode = self.proc.wait()
+        self.proc = None
+        if returncode != 0:
+            raise Exception("ffmpeg failed (return code {0}) writing {1}".format(returncode, self.video_out))
+        logger.info("wrote {0} frames to {1}".format(self.frame_count, self.video_out))
+
+        return self.frame_count
+
+    def abort(self):
+        """
+        Stop ffmpeg without finishing the movie (e.g., after an error while rendering frames)
+
+        :return:
+        """
+        if self.proc is None:
+            return
+        self.proc.kill()
+        self.proc.wait()
+        self.proc = None
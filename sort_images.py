@@ -12,17 +12,46 @@ import os
 import pickle
 import time
 
-from classify_images import classify
-from lib import common
+from classify_images import classify_stream, find_images, DEFAULT_BATCH_SIZE
+from lib import cache, common, journal
 
 
 DEFAULT_MAX_CPUS = common.DEFAULT_MAX_CPUS
+JOURNAL_NAME = "sort_images.journal"  # default journal file, in the input dir
 logger = common.logger
 
 t0 = time.time()
 
 
-def main(img_path, img_ext, model, good_path, bad_path, threads=1, test=False, dryrun=False):
+def move_image(img, img_class, good_path, bad_path, dryrun=False):
+    """
+    Move an image to the output dir of its class
+
+    :param img: <str> path to image
+    :param img_class: <int> 1 (good/matching) or 0 (bad/non-matching)
+    :param good_path: <str> path to output dir for good/matching image(s)
+    :param bad_path: <str> path to output dir for bad/non-matching image(s)
+    :param dryrun: <bool> log the move, but do not move the image
+    :return: <str> destination path
+    """
+    if img_class == 1:
+        label, dst_dir = "GOOD", good_path
+    elif img_class == 0:
+        label, dst_dir = "BAD", bad_path
+    else:
+        raise Exception("Result value {0} is not 0 or 1.".format(img_class))
+
+    dst = os.path.join(dst_dir, os.path.basename(img))
+    logger.info("{0}. Moving {1} to {2}".format(label, img, dst))
+    if not dryrun:
+        os.rename(img, dst)
+
+    return dst
+
+
+def main(img_path, img_ext, model, good_path, bad_path, threads=1, test=False,
+         feature_scale=common.DEFAULT_FEATURE_SCALE, cache_path=None, cache_size=cache.DEFAULT_CACHE_SIZE,
+         batch_size=DEFAULT_BATCH_SIZE, dryrun=False, journal_path=None, resume=False):
     """
     :param img_path: <str> path to dir containing image(s)
     :param img_ext: <str> image extent (e.g., '.jpg')
@@ -31,36 +60,62 @@ def main(img_path, img_ext, model, good_path, bad_path, threads=1, test=False, d
     :param bad_path: <str> path to output dir for bad/non-matching image(s)
     :param threads: <int> number of threads to use for image classification process (default=1)
     :param test: <int> subset number of test images to use instead of the entire dataset
+    :param feature_scale: <int> 1 (full resolution), 2, 4 or 8 (1/N JPEG draft decode), or >8 (max edge in pixels)
+    :param cache_path: <str> path to feature cache database, reused across runs (default=None, no caching)
+    :param cache_size: <int> max number of vectors held in the feature cache
+    :param batch_size: <int> number of images per classifier predict() call
     :param dryrun: <bool> run code but do not move images
+    :param journal_path: <str> path to journal of classes and moves (default=None, JOURNAL_NAME in img_path)
+    :param resume: <bool> continue an interrupted run: images already in the journal are moved by their recorded
+                   class, without classifying them again
 
     :return:
     """
+    common.check_feature_scale(feature_scale)
+
     # load classifier model
     logger.info("Opening model {} ...".format(model))
     clf = pickle.load(open(model, 'rb'))
 
-    # classify images
-    logger.info("Classifying images ...")
-    results = classify(img_path, img_ext, clf, threads=threads, subset_count=test)
-
-    logger.info("Sorting each image by its classification ...")
-    for result in results:
-        img_name = os.path.basename(result[0])
-        if result[1] == 0:
-            logger.info("GOOD. Moving {0} to {1}".format(result[0], os.path.join(bad_path, img_name)))
-            if not dryrun:
-                os.rename(result[0], os.path.join(bad_path, img_name))
-
-        elif result[1] == 1:
-            logger.info("BAD. Moving {0} to {1}".format(result[0], os.path.join(good_path, img_name)))
-            if not dryrun:
-                os.rename(result[0], os.path.join(good_path, img_name))
-
-        else:
-            raise Exception("Result value {0} is not 0 or 1.".format(result[1]))
-
-        if dryrun:
-            logger.info("--dryrun option used, no files moved.")
+    # classify images; each image is moved as soon as its class is known, so an interrupted run leaves every
+    # image either sorted or untouched in img_path, and the journal records the class of each image as it goes
+    logger.info("Classifying and sorting images ...")
+    images = find_images(img_path, img_ext, subset_count=test)
+
+    if dryrun:
+        sort_journal = None
+    else:
+        if journal_path is None:
+            journal_path = os.path.join(img_path, JOURNAL_NAME)
+        sort_journal = journal.Journal(journal_path, resume=resume)
+
+    try:
+        if resume and sort_journal is not None:
+            # images still in img_path but already classified (e.g., the run stopped before moving them)
+            known = [(img, sort_journal.lookup(img)) for img in images]
+            images = [img for img, entry in known if entry is None]
+            known = [(img, entry.img_class) for img, entry in known if entry is not None]
+            logger.info("Resuming from {0}: {1} images already classified, {2} to classify"
+                        .format(journal_path, len(known), len(images)))
+            for img, img_class in known:
+                dst = move_image(img, img_class, good_path, bad_path)
+                sort_journal.record(img, img_class, journal.MOVED, dst=dst)
+
+        results = classify_stream(images, clf, threads=threads, feature_scale=feature_scale, cache_path=cache_path,
+                                  cache_size=cache_size, batch_size=batch_size) if images else []
+
+        for result in results:
+            if sort_journal is not None:
+                sort_journal.record(result[0], result[1], journal.CLASSIFIED)
+            dst = move_image(result[0], result[1], good_path, bad_path, dryrun=dryrun)
+            if sort_journal is not None:
+                sort_journal.record(result[0], result[1], journal.MOVED, dst=dst)
+    finally:
+        if sort_journal is not None:
+            sort_journal.close()
+
+    if dryrun:
+        logger.info("--dryrun option used, no files moved.")
 
     t1 = time.time()
     m, s = divmod(t1 - t0, 60)
@@ -85,6 +140,22 @@ if __name__ == "__main__":
                         .format(DEFAULT_MAX_CPUS), default=DEFAULT_MAX_CPUS, type=int, required=False)
     parser.add_argument("--test", help="Specify number of images on which to run model (instead of running on entire "
                                        "dataset)", type=int)
+    parser.add_argument("--feature-scale", help="Reduce resolution before vectorizing: 2, 4 or 8 for a 1/N JPEG draft "
+                                                "decode, or >8 for a max edge in pixels; should match the value used "
+                                                "to build the model (default={})".format(common.DEFAULT_FEATURE_SCALE),
+                        default=common.DEFAULT_FEATURE_SCALE, type=int, dest="feature_scale", required=False)
+    parser.add_argument("--cache", help="Path to feature cache database; vectors of unchanged images are reused "
+                                        "across runs (default=no cache)", dest="cache_path", required=False)
+    parser.add_argument("--cache-size", help="Max number of vectors held in the feature cache (default={})"
+                        .format(cache.DEFAULT_CACHE_SIZE), default=cache.DEFAULT_CACHE_SIZE, type=int,
+                        dest="cache_size", required=False)
+    parser.add_argument("--batch-size", help="Number of images per classifier call (default={})"
+                        .format(DEFAULT_BATCH_SIZE), default=DEFAULT_BATCH_SIZE, type=int, dest="batch_size",
+                        required=False)
+    parser.add_argument("--journal", help="Path to journal of classes and moves (default=<img_path>/{})"
+                        .format(JOURNAL_NAME), dest="journal_path", required=False)
+    parser.add_argument("--resume", help="Resume an interrupted run: images already in the journal are sorted without "
+                                         "classifying them again", action="store_true", required=False)
     parser.add_argument("--dryrun", help="Run script, but do not execute actions", action="store_true", required=False)
 
     arguments = parser.parse_args()
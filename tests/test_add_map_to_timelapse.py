@@ -1,5 +1,10 @@
+import os
 import pytest
+from PIL import Image
 import add_map_to_timelapse
+from lib import exif, geotools
+from tests.test_basemap import make_tile_dir
+from tests.test_video import make_fake_ffmpeg
 
 
 crds = [45, 20, 102872980]
@@ -21,35 +26,143 @@ map_dim = 200
 img_dim = 2000
 
 def test_get_dd():
-    dd_out = add_map_to_timelapse.get_dd(crds)
+    dd_out = geotools.get_dd(crds)
     assert dd_out == 45.335047883
 
 def test_get_coords():
-    lat, long = add_map_to_timelapse.get_coords(exif_data)
+    lat, long = geotools.get_coords(exif_data)
     assert lat == 44.18504787331667
     assert long == -94.00297701998333
 
 def test_calc_map_dims():
-    x_dim, y_dim = add_map_to_timelapse.calc_map_dims(x_size, y_size, mp_size, mp_dpi)
+    x_dim, y_dim = geotools.calc_map_dims(x_size, y_size, mp_size, mp_dpi)
     assert x_dim == 0.13333333333333333
     assert y_dim == 0.13333333333333333
 
 def test_calc_map_dims_bad_x():
     with pytest.raises(Exception):
-        add_map_to_timelapse.calc_map_dims(-1, y_size, mp_size, mp_dpi)
+        geotools.calc_map_dims(-1, y_size, mp_size, mp_dpi)
 
 def test_calc_map_dims_bad_y():
     with pytest.raises(Exception):
-        add_map_to_timelapse.calc_map_dims(x_size, -10, mp_size, mp_dpi)
+        geotools.calc_map_dims(x_size, -10, mp_size, mp_dpi)
 
 def test_calc_map_dims_bad_size():
     with pytest.raises(Exception):
-        add_map_to_timelapse.calc_map_dims(x_size, y_size, 0, mp_dpi)
+        geotools.calc_map_dims(x_size, y_size, 0, mp_dpi)
 
 def test_calc_map_dims_bad_dpi():
     with pytest.raises(Exception):
-        add_map_to_timelapse.calc_map_dims(x_size, y_size, mp_size, -100)
+        geotools.calc_map_dims(x_size, y_size, mp_size, -100)
 
 def test_scale_map_to_img():
-    map_pos = add_map_to_timelapse.scale_map_to_img(map_dim, img_dim)
+    map_pos = geotools.scale_map_to_img(map_dim, img_dim)
     assert map_pos == 250000
+
+
+def make_track(dst, count=6, size=(160, 120)):
+    paths = []
+    for i in range(count):
+        tags = Image.Exif()
+        gps = tags.get_ifd(34853)
+        gps[1] = 'N'
+        gps[2] = (44.0, 11.0, 10.0 + i)
+        gps[3] = 'W'
+        gps[4] = (94.0, 0.0, 17.0 + i * i)
+        path = str(dst / "GOPR{0:04d}.JPG".format(i))
+        Image.new('RGB', size, (40 * i, 90, 120)).save(path, exif=tags)
+        paths.append(path)
+    return paths
+
+map_args = dict(breadcrumbs=True, keep_map=False, dryrun=False, map_size=20, map_dpi=50, map_x=1.0, map_y=1.0,
+                map_line_width=3, map_alpha=0.25, map_point_size=25, map_point_color='red', bc_point_size=10,
+                bc_point_color='gray')
+
+def test_main_workers_match_serial(tmp_path):
+    serial_dir = tmp_path / "serial"
+    parallel_dir = tmp_path / "parallel"
+    serial_dir.mkdir()
+    parallel_dir.mkdir()
+    make_track(serial_dir)
+    make_track(parallel_dir)
+    add_map_to_timelapse.main(str(serial_dir), workers=1, **map_args)
+    add_map_to_timelapse.main(str(parallel_dir), workers=3, **map_args)
+    outputs = sorted(p.name for p in serial_dir.glob("*_map.JPG"))
+    assert len(outputs) == 6
+    assert not list(serial_dir.glob("*_transparent.png"))
+    for name in outputs:
+        assert (serial_dir / name).read_bytes() == (parallel_dir / name).read_bytes()
+
+def test_main_header_without_size(tmp_path, monkeypatch):
+    paths = make_track(tmp_path, count=3)
+    read_directory_metadata = exif.read_directory_metadata
+
+    def no_size(image_paths, **kwargs):
+        meta = read_directory_metadata(image_paths, **kwargs)
+        return type(meta)((k, v._replace(size=None)) for k, v in meta.items())
+
+    monkeypatch.setattr(add_map_to_timelapse.exif, 'read_directory_metadata', no_size)
+    add_map_to_timelapse.main(str(tmp_path), **map_args)
+    assert len(list(tmp_path.glob("*_map.JPG"))) == 3
+
+    def truncated(image_paths, **kwargs):
+        meta = no_size(image_paths, **kwargs)
+        open(paths[-1], 'wb').close()
+        return meta
+
+    monkeypatch.setattr(add_map_to_timelapse.exif, 'read_directory_metadata', truncated)
+    with pytest.raises(Exception, match="could not read image size"):
+        add_map_to_timelapse.main(str(tmp_path), **map_args)
+
+def test_main_keep_map(tmp_path):
+    make_track(tmp_path, count=3)
+    add_map_to_timelapse.main(str(tmp_path), **dict(map_args, keep_map=True))
+    assert len(list(tmp_path.glob("*_transparent.png"))) == 3
+    assert len(list(tmp_path.glob("*_map.JPG"))) == 3
+
+def test_main_rerun_skips_map_frames(tmp_path):
+    paths = make_track(tmp_path, count=3)
+    os.rename(paths[0], paths[0].replace(".JPG", ".jpg"))
+    add_map_to_timelapse.main(str(tmp_path), **map_args)
+    add_map_to_timelapse.main(str(tmp_path), **map_args)
+    assert sorted(p.name for p in tmp_path.glob("*_map.JPG")) == ["GOPR0000_map.JPG", "GOPR0001_map.JPG",
+                                                                  "GOPR0002_map.JPG"]
+
+def test_main_video(tmp_path):
+    fake = make_fake_ffmpeg(tmp_path)
+    outputs = []
+    for workers in (1, 3):
+        src = tmp_path / "w{}".format(workers)
+        src.mkdir()
+        make_track(src)
+        out = str(tmp_path / "w{}.raw".format(workers))
+        add_map_to_timelapse.main(str(src), workers=workers, video_out=out, ffmpeg=fake, **map_args)
+        assert not list(src.glob("*_map.JPG"))
+        outputs.append(open(out, 'rb').read())
+    assert len(outputs[0]) == 6 * 160 * 120 * 3
+    assert outputs[0] == outputs[1]
+
+def test_main_clean_track(tmp_path):
+    make_track(tmp_path, count=5)
+    # image without coordinates
+    Image.new('RGB', (160, 120)).save(str(tmp_path / "GOPR0005.JPG"))
+    add_map_to_timelapse.main(str(tmp_path), max_speed=50., simplify=1., **map_args)
+    assert len(list(tmp_path.glob("*_map.JPG"))) == 6
+
+def test_main_basemap(tmp_path):
+    src = tmp_path / "src"
+    tiles = tmp_path / "tiles"
+    src.mkdir()
+    tiles.mkdir()
+    make_track(src, count=3)
+    make_tile_dir(tiles)
+    add_map_to_timelapse.main(str(src), basemap_src=str(tiles), basemap_cache=str(tmp_path / "cache"), **map_args)
+    assert len(list(src.glob("*_map.JPG"))) == 3
+    assert len(list((tmp_path / "cache").glob("*.png"))) == 1
+
+def test_main_keeps_exif(tmp_path):
+    make_track(tmp_path, count=2)
+    add_map_to_timelapse.main(str(tmp_path), jpeg_preset='fast', **map_args)
+    for path in tmp_path.glob("*_map.JPG"):
+        original = exif.read_metadata(str(path).replace("_map.JPG", ".JPG"))
+        assert exif.read_metadata(str(path)).gps == original.gps
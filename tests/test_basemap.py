@@ -0,0 +1,94 @@
+import sqlite3
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+from lib import basemap, maprender
+
+
+ZOOM = 2
+COLORS = {(x, y): (40 * x + 10, 40 * y + 10, 200) for x in range(4) for y in range(4)}
+
+
+def make_tile_dir(dst):
+    for (x, y), color in COLORS.items():
+        (dst / str(ZOOM) / str(x)).mkdir(parents=True, exist_ok=True)
+        Image.new('RGB', (256, 256), color).save(str(dst / str(ZOOM) / str(x) / "{}.png".format(y)))
+    return str(dst)
+
+
+def make_mbtiles(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+    for (x, y), color in COLORS.items():
+        image = Image.new('RGB', (256, 256), color)
+        buf = BytesIO()
+        image.save(buf, format='PNG')
+        conn.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)", (ZOOM, x, 2 ** ZOOM - 1 - y, buf.getvalue()))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_tile_pixels():
+    assert basemap.lon_to_px(-180., 0) == 0.
+    assert basemap.lon_to_px(0., 3) == 1024.
+    assert np.isclose(basemap.lat_to_px(0., 0), 128.)
+    assert basemap.lat_to_px(60., 1) < basemap.lat_to_px(30., 1)
+
+def test_stitch_rows_linear_in_latitude(tmp_path):
+    source = basemap.open_tile_source(make_tile_dir(tmp_path))
+    # spans tiles x=0..1, y=1..2 at zoom 2 (tile row boundary at latitude 0)
+    extent = (-150., -30., -60., 60.)
+    mosaic = basemap.stitch(source, extent, ZOOM)
+    assert mosaic.shape[2] == 4
+    height = mosaic.shape[0]
+    # latitude 0 is halfway down the (linear latitude) image, even though it is not halfway in mercator pixels
+    assert tuple(mosaic[height // 2 - 2, 0, :3]) == COLORS[(0, 1)]
+    assert tuple(mosaic[height // 2 + 2, 0, :3]) == COLORS[(0, 2)]
+    assert tuple(mosaic[0, -1, :3]) == COLORS[(1, 1)]
+
+def test_mbtiles_matches_tile_dir(tmp_path):
+    tile_dir = tmp_path / "tiles"
+    tile_dir.mkdir()
+    extent = (-100., 80., -50., 50.)
+    from_dir = basemap.stitch(basemap.open_tile_source(make_tile_dir(tile_dir)), extent, ZOOM)
+    mbtiles = basemap.open_tile_source(make_mbtiles(str(tmp_path / "tiles.mbtiles")))
+    assert mbtiles.zoom_levels() == [ZOOM]
+    assert np.array_equal(basemap.stitch(mbtiles, extent, ZOOM), from_dir)
+
+def test_choose_zoom():
+    extent = (-94.01, -94., 44., 44.01)
+    assert basemap.choose_zoom(extent, (100, 100), range(20)) == 14
+    assert basemap.choose_zoom(extent, (100, 100), [2, 5]) == 5
+
+def test_load_basemap_cached(tmp_path, monkeypatch):
+    tile_dir = tmp_path / "tiles"
+    tile_dir.mkdir()
+    make_tile_dir(tile_dir)
+    cache_dir = str(tmp_path / "cache")
+    bbox = (-50., -120., 40., 60.)
+    image, extent = basemap.load_basemap(str(tile_dir), bbox, (100, 100), cache_dir=cache_dir)
+    assert len(list((tmp_path / "cache").glob("*.png"))) == 1
+
+    def fail(*args):
+        raise AssertionError("stitched again")
+
+    monkeypatch.setattr(basemap, 'stitch', fail)
+    cached, cached_extent = basemap.load_basemap(str(tile_dir), bbox, (100, 100), cache_dir=cache_dir)
+    assert np.array_equal(cached, image)
+    assert cached_extent == extent
+
+def test_renderer_with_basemap(tmp_path):
+    lats, longs = [44.0, 44.01, 44.02], [-94.0, -94.01, -94.0]
+    extent = basemap.basemap_extent((44.0, -94.01, 44.02, -94.0))
+    tiles = np.zeros((10, 10, 4), dtype=np.uint8)
+    tiles[..., 1] = 255
+    tiles[..., 3] = 255
+    renderer = maprender.MapRenderer(lats, longs, 2, 1.5, 3, 0.25, 25, 'red', 10, 'gray',
+                                     basemap=(tiles, extent))
+    assert renderer.get_size() == maprender.map_pixel_size(2, 1.5)
+    frame = renderer.render([44.01, -94.01])
+    # basemap fills the axes
+    assert (frame[..., 1] == 255).mean() > 0.3
+    assert renderer.ax.get_xlim() == extent[:2]
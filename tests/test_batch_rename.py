@@ -0,0 +1,21 @@
+import os
+
+from utils import batch_rename
+
+
+def test_batch_rename_renumber(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    for name in ["2018-01-01_10:00:05.jpg", "2018-01-01_10:00:00.JPG", "notes.txt"]:
+        (src / name).write_bytes(name.encode())
+    batch_rename.batch_rename(str(src), dst=str(dst), renumber=True)
+    assert sorted(os.listdir(str(dst))) == ["1.JPG", "2.jpg"]
+    assert (dst / "1.JPG").read_bytes() == b"2018-01-01_10:00:00.JPG"
+    assert len(os.listdir(str(src))) == 3
+
+def test_batch_rename_in_place_move(tmp_path):
+    (tmp_path / "2018-01-01_10:00:00.jpg").write_bytes(b"a")
+    batch_rename.batch_rename(str(tmp_path), move=True)
+    assert os.listdir(str(tmp_path)) == ["20180101100000.jpg"]
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import numpy as np
+import PIL.Image
+from lib import cache, common
+
+
+def make_jpg(path, value=100):
+    PIL.Image.fromarray(np.full((24, 32, 3), value, dtype=np.uint8)).save(path)
+    return path
+
+
+def test_lookup_hit_and_miss(tmp_path):
+    img = make_jpg(str(tmp_path / "a.jpg"))
+    calls = []
+
+    def compute(path):
+        calls.append(path)
+        return [0.25, 0.75]
+
+    with cache.FeatureCache(str(tmp_path / "cache.db")) as fc:
+        assert fc.lookup(img, "p", compute) == [0.25, 0.75]
+        assert fc.lookup(img, "p", compute) == [0.25, 0.75]
+        assert (fc.hits, fc.misses) == (1, 1)
+        fc.lookup(img, "other", compute)
+    assert len(calls) == 2
+
+def test_lookup_invalidated_on_change(tmp_path):
+    img = make_jpg(str(tmp_path / "a.jpg"))
+    db = str(tmp_path / "cache.db")
+    with cache.FeatureCache(db) as fc:
+        fc.lookup(img, "p", lambda p: [1.0])
+    st = os.stat(img)
+    os.utime(img, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    with cache.FeatureCache(db) as fc:
+        assert fc.lookup(img, "p", lambda p: [2.0]) == [2.0]
+        assert fc.misses == 1
+
+def test_evict_lru(tmp_path):
+    imgs = [make_jpg(str(tmp_path / "{}.jpg".format(i))) for i in range(4)]
+    with cache.FeatureCache(str(tmp_path / "cache.db"), max_entries=2) as fc:
+        for img in imgs:
+            fc.lookup(img, "p", lambda p: [0.0])
+        assert fc.evict() == 2
+        rows = fc.conn.execute("SELECT path FROM features").fetchall()
+    assert sorted(r[0] for r in rows) == sorted(os.path.abspath(i) for i in imgs[2:])
+
+def test_vectorize_matches_uncached(tmp_path):
+    imgs = [make_jpg(str(tmp_path / "{}.jpg".format(i)), value=i * 60) for i in range(3)]
+    expected = cache.vectorize(imgs)
+    db = str(tmp_path / "cache.db")
+    assert cache.vectorize(imgs, cache_path=db) == expected
+    assert cache.vectorize(imgs, cache_path=db) == expected
+    assert expected[0] == common.ImageIO(imgs[0]).get_feature_vector()
+
+def test_lookup_holds_no_write_lock(tmp_path):
+    imgs = [make_jpg(str(tmp_path / "{}.jpg".format(i))) for i in range(2)]
+    db = str(tmp_path / "cache.db")
+    with cache.FeatureCache(db) as fc:
+        fc.lookup(imgs[0], "p", lambda p: [1.0])
+        fc.flush()
+        fc.lookup(imgs[0], "p", lambda p: [1.0])
+        fc.lookup(imgs[1], "p", lambda p: [2.0])
+        assert not fc.conn.in_transaction
+        # another worker can write while this one is computing vectors
+        other = sqlite3.connect(db, timeout=0)
+        other.execute("BEGIN IMMEDIATE")
+        other.rollback()
+        other.close()
+    with cache.FeatureCache(db) as fc:
+        assert fc.lookup(imgs[1], "p", lambda p: [3.0]) == [2.0]
+
+def test_evict_once_per_run(tmp_path):
+    imgs = [make_jpg(str(tmp_path / "{}.jpg".format(i))) for i in range(4)]
+    db = str(tmp_path / "cache.db")
+    assert cache.vectorize_with_stats(imgs, cache_path=db, cache_size=2)[1:] == (0, 4)
+    # workers do not evict; the parent trims the cache once per run
+    assert cache.vectorize_with_stats(imgs, cache_path=db, cache_size=2)[1:] == (4, 0)
+    assert cache.evict_cache(db, cache_size=2) == 2
+    assert cache.evict_cache(None) == 0
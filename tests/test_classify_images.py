@@ -0,0 +1,61 @@
+import pickle
+import types
+import numpy as np
+import PIL.Image
+import pytest
+from sklearn import svm
+import classify_images
+from lib import cache
+
+
+def make_gray_images(dst, count, step):
+    paths = []
+    for i in range(count):
+        path = str(dst / "{0:02d}.jpg".format(i))
+        PIL.Image.new('RGB', (16, 16), (step * i, step * i, step * i)).save(path)
+        paths.append(path)
+    return paths
+
+def fit_classifier():
+    rng = np.random.RandomState(0)
+    data = np.vstack([rng.normal(0.2, 0.05, (20, 8)), rng.normal(0.8, 0.05, (20, 8))])
+    return svm.SVC(kernel='linear').fit(data, [0] * 20 + [1] * 20), rng.rand(37, 8)
+
+
+@pytest.mark.parametrize("batch_size", [1, 5, 37, 1000])
+def test_predict_batches_matches_per_image(batch_size):
+    clf, vectors = fit_classifier()
+    expected = [int(clf.predict(v.reshape(1, -1))[0]) for v in vectors]
+    classes, scores = classify_images.predict_batches(clf, vectors, batch_size=batch_size)
+    assert classes == expected
+    assert scores is None
+
+def test_predict_batches_scores():
+    clf, vectors = fit_classifier()
+    classes, scores = classify_images.predict_batches(clf, list(vectors), batch_size=8, scores=True)
+    np.testing.assert_allclose(scores, clf.decision_function(vectors))
+    assert classes == [int(s > 0) for s in scores]
+
+def test_predict_batches_bad_size():
+    clf, vectors = fit_classifier()
+    with pytest.raises(Exception):
+        classify_images.predict_batches(clf, vectors, batch_size=0)
+
+def test_classify_stream_order(tmp_path):
+    imgs = make_gray_images(tmp_path, 11, 20)
+    vectors = cache.vectorize(imgs)
+    clf = svm.SVC(kernel='linear').fit(vectors, [0] * 6 + [1] * 5)
+    model = types.SimpleNamespace(best_estimator_=clf)
+    out = list(classify_images.classify_stream(imgs, model, threads=2, chunk_size=3))
+    assert [o[0] for o in out] == imgs
+    assert [o[1] for o in out] == clf.predict(vectors).tolist()
+
+def test_classify_model_path(tmp_path):
+    imgs = make_gray_images(tmp_path, 9, 25)
+    vectors = cache.vectorize(imgs)
+    clf = svm.SVC(kernel='linear').fit(vectors, [0] * 5 + [1] * 4)
+    model_path = str(tmp_path / "model.pkl")
+    with open(model_path, 'wb') as f:
+        pickle.dump(types.SimpleNamespace(best_estimator_=clf), f)
+    out = dict(classify_images.classify(str(tmp_path), '.jpg', model_path, threads=2))
+    assert out == dict(zip(imgs, clf.predict(vectors).tolist()))
@@ -0,0 +1,162 @@
+import numpy as np
+import PIL.Image
+import pytest
+from lib import common
+
+
+def make_image(width=37, height=23, seed=0):
+    rng = np.random.RandomState(seed)
+    return PIL.Image.fromarray(rng.randint(0, 256, size=(height, width, 3), dtype=np.uint8), 'RGB')
+
+
+@pytest.mark.parametrize("blocks", [1, 2, 3, 4, 5, 6, 8, 16])
+def test_calc_feature_vector_matches_reference(blocks):
+    image = make_image()
+    assert common.calc_feature_vector(image, blocks) == common.calc_feature_vector_reference(image, blocks)
+
+def test_calc_feature_vector_length():
+    vec = common.calc_feature_vector(make_image(), blocks=4)
+    assert len(vec) == 64
+    assert sum(vec) == pytest.approx(1.0)
+
+def test_calc_feature_vector_bad_mode():
+    with pytest.raises(Exception):
+        common.calc_feature_vector(make_image().convert('L'))
+
+def test_reduce_for_features_draft(tmp_path):
+    path = str(tmp_path / "frame.jpg")
+    make_image(width=320, height=240).save(path)
+    image = common.reduce_for_features(PIL.Image.open(path), 4)
+    assert image.size == (80, 60)
+    assert len(common.calc_feature_vector(image)) == 64
+
+def test_reduce_for_features_max_edge(tmp_path):
+    path = str(tmp_path / "frame.png")
+    make_image(width=320, height=240).save(path)
+    image = common.reduce_for_features(PIL.Image.open(path), 100)
+    assert max(image.size) == 100
+
+def test_check_feature_scale_bad():
+    with pytest.raises(Exception):
+        common.check_feature_scale(3)
+
+def test_imageio_lazy(tmp_path):
+    path = str(tmp_path / "frame.jpg")
+    make_image(width=64, height=48).save(path)
+    image = common.ImageIO(path)
+    assert image._image_open is None
+    assert image.get_size() == (64, 48)
+    assert image.image_exif == {}
+    assert image._pixels is None
+    image.close()
+    assert image._image_open is None
+    assert image.get_size() == (64, 48)
+
+def test_imageio_context_manager(tmp_path):
+    path = str(tmp_path / "frame.jpg")
+    make_image(width=64, height=48).save(path)
+    with common.ImageIO(path) as image:
+        vec = image.get_feature_vector()
+        assert vec == common.calc_feature_vector(PIL.Image.open(path))
+    assert image._image_open is None
+
+def test_imageio_overlay(tmp_path):
+    base_path = str(tmp_path / "frame.jpg")
+    map_path = str(tmp_path / "map.png")
+    make_image(width=64, height=48).save(base_path)
+    PIL.Image.new("RGBA", (10, 10), (255, 0, 0, 255)).save(map_path)
+    with common.ImageIO(base_path) as base, common.ImageIO(map_path) as overlay:
+        out = base.overlay(overlay, 5, 5).rgba_to_rgb_mask()
+    assert out.mode == "RGB"
+    assert out.getpixel((7, 7)) == (255, 0, 0)
+
+def test_imageio_overlay_rgb_matches_overlay(tmp_path):
+    base_path = str(tmp_path / "frame.jpg")
+    make_image(width=64, height=48).save(base_path)
+    rng = np.random.default_rng(0)
+    map_img = common.ImageIO.from_image(PIL.Image.fromarray(rng.integers(0, 256, (20, 30, 4), dtype=np.uint8),
+                                                            "RGBA"))
+    # inside, partially outside (each edge), and fully outside the frame
+    for pos in [(5, 5), (-10, 3), (50, 40), (20, -15), (100, 100)]:
+        with common.ImageIO(base_path) as base:
+            expected = np.asarray(base.overlay(map_img, *pos).rgba_to_rgb_mask())
+        out = common.ImageIO(base_path).overlay_rgb(map_img, *pos)
+        assert out.mode == "RGB"
+        assert np.array_equal(np.asarray(out), expected)
+
+def test_save_jpeg_presets(tmp_path):
+    tags = PIL.Image.Exif()
+    tags[306] = "2018:05:12 10:00:00"
+    image = make_image(width=64, height=48)
+    for preset in common.JPEG_PRESETS:
+        path = str(tmp_path / "{}.jpg".format(preset))
+        common.save_jpeg(image, path, preset=preset, exif=tags.tobytes())
+        with PIL.Image.open(path) as out:
+            assert out.format == "JPEG"
+            assert out.size == (64, 48)
+            assert out.getexif()[306] == "2018:05:12 10:00:00"
+
+def test_save_jpeg_bad_preset(tmp_path):
+    with pytest.raises(Exception):
+        common.save_jpeg(make_image(), str(tmp_path / "out.jpg"), preset="lossless")
+
+def test_scan_dir(tmp_path):
+    for name in ["b.JPG", "a.jpg", "c.png", "d.jpeg"]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "sub.jpg").mkdir()
+    assert common.scan_dir(str(tmp_path), ".jpg") == [str(tmp_path / "a.jpg"), str(tmp_path / "b.JPG")]
+    assert len(common.scan_dir(str(tmp_path), (".jpg", ".jpeg"))) == 3
+    assert len(common.scan_dir(str(tmp_path))) == 4
+
+def square_all(task):
+    return [x * x for x in task]
+
+def fail_on_three(task):
+    if 3 in task:
+        raise ValueError("bad task")
+    return task
+
+def test_task_size():
+    assert common.task_size(0, 4) == 1
+    assert common.task_size(100, 4, tasks_per_process=5) == 5
+    assert common.task_size(100000, 4) == common.MAX_TASK_SIZE
+
+def test_split_tasks():
+    assert common.split_tasks(list(range(7)), 3) == [[0, 1, 2], [3, 4, 5], [6]]
+
+@pytest.mark.parametrize("max_pending", [None, 1, 3])
+def test_schedule_ordered(max_pending):
+    tasks = common.split_tasks(list(range(50)), 4)
+    out = list(common.schedule(square_all, tasks, process_count=3, max_pending=max_pending))
+    assert [idx for idx, _ in out] == list(range(len(tasks)))
+    assert [x for _, res in out for x in res] == [x * x for x in range(50)]
+
+def test_schedule_unordered():
+    tasks = common.split_tasks(list(range(20)), 1)
+    out = dict(common.schedule(square_all, tasks, process_count=2, ordered=False))
+    assert out == {i: [i * i] for i in range(20)}
+
+def test_schedule_raises():
+    with pytest.raises(ValueError):
+        list(common.schedule(fail_on_three, [[1], [2], [3]], process_count=2))
+
+def test_schedule_payload_only_measured_for_debug(monkeypatch):
+    def no_pickle(obj):
+        raise AssertionError("task payload pickled with debug logging off")
+
+    monkeypatch.setattr(common, 'pickle', type('NoPickle', (), {'dumps': staticmethod(no_pickle)}))
+    level = common.logger.level
+    common.logger.setLevel(common.logging.INFO)
+    try:
+        assert list(common.schedule(square_all, [[2]], process_count=1)) == [(0, [4])]
+    finally:
+        common.logger.setLevel(level)
+
+def test_imageio_from_image(tmp_path):
+    base_path = str(tmp_path / "frame.jpg")
+    make_image(width=64, height=48).save(base_path)
+    overlay = common.ImageIO.from_image(PIL.Image.new("RGBA", (10, 10), (0, 0, 255, 255)))
+    assert overlay.get_size() == (10, 10)
+    with common.ImageIO(base_path) as base:
+        out = base.overlay(overlay, 0, 0).rgba_to_rgb_mask()
+    assert out.getpixel((3, 3)) == (0, 0, 255)
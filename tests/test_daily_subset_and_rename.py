@@ -0,0 +1,35 @@
+import os
+import pytest
+
+from utils import daily_subset_and_rename
+
+
+def make_captures(dst, stamps):
+    dst.mkdir()
+    for stamp in stamps:
+        (dst / "{0}.jpg".format(stamp)).write_bytes(stamp.encode())
+
+def test_main_hours(tmp_path):
+    make_captures(tmp_path / "src", ["20180512075959", "20180512080000", "20180512175959", "20180512180000",
+                                     "20180513120000"])
+    daily_subset_and_rename.main(str(tmp_path / "src"), str(tmp_path / "dst"), 8, 17)
+    assert sorted(os.listdir(str(tmp_path / "dst"))) == ["20180512080000.jpg", "20180512175959.jpg",
+                                                         "20180513120000.jpg"]
+
+def test_main_windows_renumber(tmp_path):
+    make_captures(tmp_path / "src", ["20180512073000", "20180512083000", "20180512233000", "20180513013000",
+                                     "20180513023000"])
+    daily_subset_and_rename.main(str(tmp_path / "src"), str(tmp_path / "dst"), renumber=True,
+                                 windows=["07:30-08:00", "22:00-02:00"])
+    dst = tmp_path / "dst"
+    assert sorted(os.listdir(str(dst))) == ["1.jpg", "2.jpg", "3.jpg"]
+    assert [(dst / "{}.jpg".format(i)).read_bytes() for i in (1, 2, 3)] == [b"20180512073000", b"20180512233000",
+                                                                           b"20180513013000"]
+
+def test_main_requires_window(tmp_path):
+    make_captures(tmp_path / "src", ["20180512073000"])
+    with pytest.raises(SystemExit):
+        daily_subset_and_rename.main(str(tmp_path / "src"), str(tmp_path / "dst"), dryrun=True)
+    with pytest.raises(SystemExit):
+        daily_subset_and_rename.main(str(tmp_path / "src"), str(tmp_path / "dst"), windows=["12:00-13:00"],
+                                     dryrun=True)
@@ -0,0 +1,61 @@
+import struct
+import PIL.Image
+import pytest
+from datetime import datetime
+from lib import exif
+
+
+def make_geotagged_jpg(path, size=(64, 48), timestamp="2018:05:12 10:20:30"):
+    tags = PIL.Image.Exif()
+    tags[exif.TAG_DATETIME] = timestamp
+    gps = tags.get_ifd(exif.TAG_GPS_IFD)
+    gps[1] = 'N'
+    gps[2] = (44.0, 11.0, 10.25)
+    gps[3] = 'W'
+    gps[4] = (94.0, 0.0, 17.5)
+    PIL.Image.new('RGB', size, (10, 20, 30)).save(path, exif=tags)
+    return path
+
+
+def test_read_metadata(tmp_path):
+    path = make_geotagged_jpg(str(tmp_path / "GOPR0001.JPG"), size=(80, 60))
+    meta = exif.read_metadata(path)
+    assert meta.size == (80, 60)
+    assert meta.timestamp == datetime(2018, 5, 12, 10, 20, 30)
+    assert meta.gps[1] == 'N'
+    assert meta.gps[3] == 'W'
+    assert [n / float(d) for n, d in meta.gps[2]] == [44.0, 11.0, 10.25]
+    assert [n / float(d) for n, d in meta.gps[4]] == [94.0, 0.0, 17.5]
+
+def test_read_metadata_matches_pil(tmp_path):
+    path = make_geotagged_jpg(str(tmp_path / "GOPR0001.JPG"))
+    gps_pil = PIL.Image.open(path)._getexif()[exif.TAG_GPS_IFD]
+    gps = exif.read_metadata(path).gps
+    for tag in (2, 4):
+        assert [n / float(d) for n, d in gps[tag]] == [float(v) for v in gps_pil[tag]]
+
+def test_read_metadata_no_exif(tmp_path):
+    path = str(tmp_path / "plain.jpg")
+    PIL.Image.new('RGB', (32, 16)).save(path)
+    meta = exif.read_metadata(path)
+    assert meta.gps is None
+    assert meta.timestamp is None
+    assert meta.size == (32, 16)
+
+def test_read_metadata_not_jpeg(tmp_path):
+    path = str(tmp_path / "map.png")
+    PIL.Image.new('RGB', (32, 16)).save(path)
+    with pytest.raises(Exception):
+        exif.read_metadata(path)
+
+def test_parse_tiff_big_endian():
+    # IFD0 with one entry: DateTime (ASCII, 20 bytes, stored at offset 26)
+    value = b"2019:08:03 12:00:00\x00"
+    tiff = b'MM' + struct.pack('>HL', 42, 8) + struct.pack('>H', 1) + \
+        struct.pack('>HHLL', exif.TAG_DATETIME, 2, len(value), 26) + struct.pack('>L', 0) + value
+    assert exif.parse_tiff(tiff) == {exif.TAG_DATETIME: "2019:08:03 12:00:00"}
+
+def test_read_directory_metadata_order(tmp_path):
+    paths = [make_geotagged_jpg(str(tmp_path / "GOPR{0:04d}.JPG".format(i))) for i in range(5)]
+    meta = exif.read_directory_metadata(paths, threads=3, show_progress=False)
+    assert list(meta.keys()) == paths
@@ -0,0 +1,95 @@
+from datetime import datetime
+import pytest
+from PIL import Image
+
+from lib import frames
+
+
+def test_parse_timestamp():
+    assert frames.parse_timestamp("/cap/20180512103005.jpg") == datetime(2018, 5, 12, 10, 30, 5)
+    assert frames.parse_timestamp("2018-05-12_10:30:05.JPG") == datetime(2018, 5, 12, 10, 30, 5)
+    assert frames.parse_timestamp("20180512103005_map.JPG") == datetime(2018, 5, 12, 10, 30, 5)
+    assert frames.parse_timestamp("GOPR0001.JPG") is None
+    assert frames.parse_timestamp("0001.jpg") is None
+    # not a valid date
+    assert frames.parse_timestamp("20181312103005.jpg") is None
+    # longer run of digits than a timestamp
+    assert frames.parse_timestamp("920180512103005.jpg") is None
+
+def test_frame_index_scan(tmp_path):
+    for name in ["20180512103005.jpg", "20180512093000.JPG", "IMG_0001.Jpg", "notes.txt", "20180513060000.png"]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "sub.jpg").mkdir()
+    index = frames.FrameIndex.scan(str(tmp_path), '.jpg')
+    assert [p.rsplit("/", 1)[-1] for p in index.paths] == ["20180512093000.JPG", "20180512103005.jpg",
+                                                           "IMG_0001.Jpg"]
+    assert len(index) == 3
+    assert index[0].timestamp == datetime(2018, 5, 12, 9, 30)
+    assert [f.path for f in index.untimed] == [index.paths[2]]
+
+def test_frame_index_between():
+    index = frames.FrameIndex(["2018-05-12_23:59:59.jpg", "20180512080000.jpg", "20180512120000.jpg",
+                               "20180513080000.jpg", "GOPR0001.JPG"])
+    names = lambda fs: [f.path for f in fs]
+    # time order, not name order
+    assert names(index.between()) == ["20180512080000.jpg", "20180512120000.jpg", "2018-05-12_23:59:59.jpg",
+                                      "20180513080000.jpg"]
+    # start inclusive, end exclusive
+    assert names(index.between(datetime(2018, 5, 12, 8), datetime(2018, 5, 12, 12))) == ["20180512080000.jpg"]
+    assert names(index.between(start=datetime(2018, 5, 13))) == ["20180513080000.jpg"]
+    assert names(index.between(end=datetime(2018, 5, 12, 8))) == []
+
+def test_parse_window():
+    assert frames.parse_window("07:30-9") == frames.TimeWindow((None, 450), (None, 540))
+    assert frames.parse_window("Sunset-30-sunset+30") == frames.TimeWindow(("sunset", -30), ("sunset", 30))
+    assert frames.parse_window("sunrise-12:00") == frames.TimeWindow(("sunrise", 0), (None, 720))
+    assert frames.hour_window(8, 17) == frames.TimeWindow((None, 480), (None, 1080))
+    for spec in ["7:30", "25:00-26:00", "08:60-09:00", "dawn-09:00"]:
+        with pytest.raises(Exception):
+            frames.parse_window(spec)
+
+def test_frame_index_select():
+    names = ["20180512{0}00.jpg".format(hm) for hm in ["0559", "0600", "1030", "1759", "1800", "2300"]]
+    names += ["20180513{0}00.jpg".format(hm) for hm in ["0130", "0200", "1030"]]
+    index = frames.FrameIndex(names + ["GOPR0001.JPG"])
+    select = lambda *specs: [f.path[8:12] for f in index.select([frames.parse_window(s) for s in specs])]
+    assert select("06:00-18:00") == ["0600", "1030", "1759", "1030"]
+    # wraps past midnight, including the night before the first frame
+    assert select("22:00-02:00") == ["2300", "0130"]
+    assert select("05:00-06:00", "05:30-06:01", "10:00-11:00") == ["0559", "0600", "1030", "1030"]
+    assert frames.FrameIndex([]).select([frames.parse_window("00-24")]) == []
+
+def test_frame_index_select_after_missing_day():
+    # no captures on 13 May
+    index = frames.FrameIndex(["20180512230000.jpg", "20180514013000.jpg", "20180514120000.jpg"])
+    select = lambda spec, **kwargs: [f.path for f in index.select([frames.parse_window(spec)], **kwargs)]
+    assert select("22:00-02:00") == ["20180512230000.jpg", "20180514013000.jpg"]
+    assert select("sunset-sunrise", lat=44.98, lon=-93.27, utc_offset=-5) == ["20180512230000.jpg",
+                                                                               "20180514013000.jpg"]
+
+def test_frame_index_select_sun():
+    # Minneapolis, 21 June 2018 (CDT): sunrise 05:26, sunset 21:03
+    index = frames.FrameIndex(["20180621{0}00.jpg".format(hm) for hm in ["0455", "0520", "0600", "2050", "2110"]])
+    window = frames.parse_window("sunrise-30-sunrise+30")
+    assert [f.path[8:12] for f in index.select([window], lat=44.98, lon=-93.27, utc_offset=-5)] == ["0520"]
+    window = frames.parse_window("sunset-sunrise")
+    assert [f.path[8:12] for f in index.select([window], lat=44.98, lon=-93.27, utc_offset=-5)] == ["0455", "0520",
+                                                                                                     "2110"]
+    with pytest.raises(Exception):
+        index.select([window])
+    # no sunrise during polar day
+    assert index.select([window], lat=78.2, lon=15.6, utc_offset=2) == []
+
+def test_exif_timestamps(tmp_path):
+    paths = [str(tmp_path / "0.jpg"), str(tmp_path / "1.jpg")]
+    tags = Image.Exif()
+    tags.get_ifd(34665)[36867] = "2018:05:12 10:30:05"
+    Image.new('RGB', (32, 24)).save(paths[0], exif=tags)
+    Image.new('RGB', (32, 24)).save(paths[1])
+    expected = [datetime(2018, 5, 12, 10, 30, 5), None]
+    assert frames.exif_timestamps(paths) == expected
+    db = str(tmp_path / "cache.db")
+    assert frames.exif_timestamps(paths, cache_path=db) == expected
+    assert frames.exif_timestamps(paths, cache_path=db) == expected
+    index = frames.FrameIndex.scan(str(tmp_path), '.jpg', exif_time=True, cache_path=db)
+    assert index.between() == [frames.Frame(paths[0], expected[0])]
@@ -0,0 +1,83 @@
+import os
+import logging
+import numpy as np
+import PIL.Image
+import pytest
+import generate_classifier
+from lib import common
+
+
+def test_vector_store_roundtrip(tmp_path):
+    store = str(tmp_path / "image_vectors.npy")
+    vectors = np.random.RandomState(0).rand(3, 64)
+    generate_classifier.append_vector_store(store, vectors, ["a.jpg", "b.jpg", "c.jpg"])
+    out, sources = generate_classifier.read_vector_store(store)
+    assert sources == ["a.jpg", "b.jpg", "c.jpg"]
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(out, vectors.astype(np.float32))
+
+def test_vector_store_append(tmp_path):
+    store = str(tmp_path / "image_vectors.npy")
+    vectors = np.random.RandomState(0).rand(5, 64)
+    generate_classifier.append_vector_store(store, vectors[:2], ["0", "1"])
+    generate_classifier.append_vector_store(store, vectors[2:], ["2", "3", "4"])
+    out, sources = generate_classifier.read_vector_store(store, mmap=False)
+    assert sources == ["0", "1", "2", "3", "4"]
+    np.testing.assert_array_equal(out, vectors.astype(np.float32))
+
+def test_vector_store_append_wrong_width(tmp_path):
+    store = str(tmp_path / "image_vectors.npy")
+    generate_classifier.append_vector_store(store, np.zeros((1, 64)), ["0"])
+    with pytest.raises(Exception):
+        generate_classifier.append_vector_store(store, np.zeros((1, 8)), ["1"])
+
+def test_read_vector_file_npy(tmp_path):
+    store = str(tmp_path / "image_vectors.npy")
+    generate_classifier.append_vector_store(store, np.ones((2, 4)), ["0", "1"])
+    assert generate_classifier.read_vector_file(store).shape == (2, 4)
+
+def make_images(dst, colors):
+    paths = []
+    for i, color in enumerate(colors):
+        path = str(dst / "{0}.jpg".format(i))
+        PIL.Image.new('RGB', (32, 24), color).save(path)
+        paths.append(path)
+    return paths
+
+def test_update_vector_store(tmp_path):
+    paths = make_images(tmp_path, [(200, 10, 10), (10, 200, 10), (10, 10, 200)])
+    out = generate_classifier.update_vector_store(str(tmp_path), '.jpg', 1, feature_scale=2)
+    assert out.shape == (3, generate_classifier.FEATURE_BLOCKS ** 3)
+    store = str(tmp_path / generate_classifier.vector_store_name(2))
+    assert [src for src, _ in generate_classifier.read_store_sources(store)] == sorted(paths)
+
+    # removed, changed in place, and new images
+    os.remove(paths[0])
+    PIL.Image.new('RGB', (32, 24), (250, 250, 250)).save(paths[1])
+    os.utime(paths[1], ns=(1, 1))
+    paths.append(str(tmp_path / "3.jpg"))
+    PIL.Image.new('RGB', (32, 24)).save(paths[-1])
+    generate_classifier.update_vector_store(str(tmp_path), '.jpg', 1, feature_scale=2)
+    out, sources = generate_classifier.read_vector_store(store, mmap=False)
+    assert sorted(sources) == sorted(paths[1:])
+    expected = generate_classifier.calc_img_vector(sources, feature_scale=2)
+    np.testing.assert_allclose(out, np.asarray(expected, dtype=np.float32))
+
+    # other feature settings get their own store
+    generate_classifier.update_vector_store(str(tmp_path), '.jpg', 1, feature_scale=4)
+    assert generate_classifier.read_vector_store(store)[0].shape[0] == 3
+    assert os.path.isfile(str(tmp_path / generate_classifier.vector_store_name(4)))
+
+def test_thread_image_vectorization_logs_cache_total(tmp_path, caplog):
+    for i in range(6):
+        PIL.Image.new('RGB', (32, 24), (i * 40, 0, 0)).save(str(tmp_path / "{}.jpg".format(i)))
+    db = str(tmp_path / "cache.db")
+    expected = generate_classifier.thread_image_vectorization(str(tmp_path), '.jpg', 1, feature_scale=2)
+    for hits, misses in [(0, 6), (6, 0)]:
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger=common.logger.name):
+            vectors = generate_classifier.thread_image_vectorization(str(tmp_path), '.jpg', 2, feature_scale=2,
+                                                                     cache_path=db)
+        assert vectors == expected
+        totals = [r.getMessage().strip() for r in caplog.records if "feature cache" in r.getMessage()]
+        assert totals == ["feature cache: {0} hits, {1} misses".format(hits, misses)]
@@ -0,0 +1,111 @@
+import numpy as np
+from collections import OrderedDict
+from datetime import date, datetime
+from PIL.TiffImagePlugin import IFDRational
+
+from lib import exif, geotools
+
+
+gps = {
+    1: u'N',
+    2: ((44, 1), (11, 1), (102872399, 10000000)),
+    3: u'W',
+    4: ((94, 1), (0, 1), (178621199, 10000000)),
+}
+
+
+def meta(path, tags, second=0):
+    return exif.ImageMetadata(path, tags, (160, 120), datetime(2018, 1, 1, 20, 9, second))
+
+
+def test_rationals_to_float():
+    values = geotools.rationals_to_float([gps[2], ((1, 2), (3, 0), (0, 1))])
+    assert np.allclose(values[0], [44., 11., 10.2872399])
+    assert np.isnan(values[1, 1])
+
+def test_rationals_to_float_ifdrational():
+    values = geotools.rationals_to_float([[IFDRational(n, d) for n, d in gps[2]]])
+    assert np.allclose(values[0], [44., 11., 10.2872399])
+
+def test_dms_to_dd():
+    dd = geotools.dms_to_dd([[44., 11., 10.2872399], [94., 0., 17.8621199]], ['N', 'W'])
+    assert np.allclose(dd, [44 + 11 / 60. + 10.2872399 / 3600., -(94 + 17.8621199 / 3600.)])
+
+def test_haversine():
+    # one degree of latitude
+    assert np.isclose(geotools.haversine(0., 0., 1., 0.), 111195., rtol=1e-4)
+    assert geotools.haversine(44., -94., 44., -94.) == 0.
+
+def test_track_from_metadata():
+    moved = dict(gps)
+    moved[2] = ((44, 1), (11, 1), (112872399, 10000000))  # one second of latitude north
+    track, skipped = geotools.track_from_metadata([meta("a.JPG", gps, 0), meta("b.JPG", None, 1),
+                                                   meta("c.JPG", moved, 2)])
+    assert track.paths == ["a.JPG", "c.JPG"]
+    assert skipped == ["b.JPG"]
+    assert np.isclose(track.lats[0], 44 + 11 / 60. + 10.2872399 / 3600.)
+    assert np.isclose(track.longs[0], -(94 + 17.8621199 / 3600.))
+    assert track.distance[0] == 0.
+    assert np.isclose(track.distance[1], 30.9, atol=0.1)
+    assert np.isnan(track.speed[0])
+    assert np.isclose(track.speed[1], track.distance[1] / 2.)
+    assert track.bbox == (track.lats[0], track.longs[0], track.lats[1], track.longs[1])
+
+def test_track_from_metadata_empty():
+    track, skipped = geotools.track_from_metadata([meta("a.JPG", {})])
+    assert track.paths == []
+    assert track.bbox is None
+    assert skipped == ["a.JPG"]
+
+def test_frame_times():
+    times = geotools.frame_times([0., 0., 1., np.nan, 3., 3.])
+    assert np.allclose(times, [0., 0.5, 1., 2., 3., 4.])
+    assert np.allclose(geotools.frame_times([np.nan, np.nan]), [0., 1.])
+
+def test_find_jumps():
+    # ~11 m per second northwards, with a spike at 3 (two fixes long) and a spike at the first fix
+    lats = 44. + np.arange(12) * 1e-4
+    lats[[3, 4]] += 0.05
+    lats[0] -= 0.05
+    jumps = geotools.find_jumps(lats, np.full(12, -94.), np.arange(12.), max_speed=20.)
+    assert np.flatnonzero(jumps).tolist() == [0, 3, 4]
+
+def test_find_jumps_relocation():
+    # a lasting change of position (e.g., camera paused) is not a jump
+    lats = np.r_[np.full(4, 44.), np.full(8, 44.5)]
+    assert not geotools.find_jumps(lats, np.full(12, -94.), np.arange(12.), max_speed=20.).any()
+
+def test_clean_coords():
+    img_coords = OrderedDict([("a", (44., -94.)), ("b", None), ("c", (45., -94.)), ("d", (44.0003, -94.)),
+                              ("e", (44.0004, -94.))])
+    cleaned, fixed = geotools.clean_coords(img_coords, [0., 1., 2., 3., np.nan])
+    assert list(cleaned) == ["a", "b", "c", "d", "e"]
+    assert fixed == ["b", "c"]
+    assert np.allclose([lat for lat, _ in cleaned.values()], [44., 44.0001, 44.0002, 44.0003, 44.0004])
+
+def test_clean_coords_out_of_time_order():
+    # straight track listed out of time order (e.g., file names after a counter roll-over); frames 2 and 6 have no fix
+    order = [5, 0, 8, 3, 9, 1, 6, 2, 7, 4]
+    img_coords = OrderedDict((str(i), None if i in (2, 6) else (44. + 0.0001 * i, -94.)) for i in order)
+    cleaned, fixed = geotools.clean_coords(img_coords, [float(i) for i in order])
+    assert list(cleaned) == [str(i) for i in order]
+    assert fixed == ["6", "2"]
+    assert np.allclose([lat for lat, _ in cleaned.values()], [44. + 0.0001 * i for i in order])
+
+def test_simplify():
+    lats = np.r_[np.linspace(44., 44.01, 50), np.full(50, 44.01)]
+    longs = np.r_[np.full(50, -94.), np.linspace(-94., -93.99, 50)]
+    assert geotools.simplify(lats, longs, 1.).tolist() == [0, 49, 99]
+    assert geotools.simplify(lats, longs, 0.).tolist() == list(range(100))
+
+def test_sun_times():
+    # Minneapolis; published times 05:26/21:03 CDT and 07:47/16:33 CST
+    sunrise, sunset = geotools.sun_times(date(2018, 6, 21), 44.98, -93.27, utc_offset=-5)
+    assert abs((sunrise - datetime(2018, 6, 21, 5, 26)).total_seconds()) < 90
+    assert abs((sunset - datetime(2018, 6, 21, 21, 3)).total_seconds()) < 90
+    sunrise, sunset = geotools.sun_times(date(2018, 12, 21), 44.98, -93.27, utc_offset=-6)
+    assert abs((sunrise - datetime(2018, 12, 21, 7, 47)).total_seconds()) < 90
+    assert abs((sunset - datetime(2018, 12, 21, 16, 33)).total_seconds()) < 90
+    # midnight sun and polar night in Svalbard
+    assert geotools.sun_times(date(2018, 6, 21), 78.2, 15.6) == (None, None)
+    assert geotools.sun_times(date(2018, 12, 21), 78.2, 15.6) == (None, None)
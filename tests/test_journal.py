@@ -0,0 +1,42 @@
+import os
+import json
+
+from lib import journal
+
+
+def test_journal_roundtrip(tmp_path):
+    path = str(tmp_path / "sort.journal")
+    with journal.Journal(path) as j:
+        j.record("a.jpg", 1, journal.CLASSIFIED)
+        j.record("b.jpg", 0, journal.CLASSIFIED)
+        j.record("a.jpg", 1, journal.MOVED, dst="good/a.jpg")
+    # torn record from a crash while writing
+    with open(path, 'a') as f:
+        f.write('{"path": "/x/c.jpg", "cla')
+    entries = journal.read_journal(path)
+    assert len(entries) == 2
+    assert entries[os.path.abspath("a.jpg")] == journal.Entry(1, journal.MOVED, "good/a.jpg")
+    with journal.Journal(path, resume=True) as j:
+        assert j.lookup("b.jpg") == journal.Entry(0, journal.CLASSIFIED, None)
+        assert j.lookup("c.jpg") is None
+        j.record("c.jpg", 1, journal.CLASSIFIED)
+    assert journal.Journal(path, resume=True).lookup("c.jpg").img_class == 1
+    # a new run starts a new journal
+    journal.Journal(path).close()
+    assert journal.read_journal(path) == {}
+    assert journal.read_journal(str(tmp_path / "missing.journal")) == {}
+
+def test_journal_batched_sync(tmp_path, monkeypatch):
+    syncs = []
+    monkeypatch.setattr(journal.os, 'fsync', lambda fd: syncs.append(fd))
+    monkeypatch.setattr(journal, 'SYNC_INTERVAL', 10)
+    monkeypatch.setattr(journal, 'SYNC_SECONDS', 1e9)
+    path = str(tmp_path / "sort.journal")
+    j = journal.Journal(path)
+    for i in range(25):
+        j.record("{}.jpg".format(i), i % 2, journal.CLASSIFIED)
+    assert len(syncs) == 2
+    j.close()
+    assert len(syncs) == 3
+    lines = open(path).read().splitlines()
+    assert len(lines) == 25 and json.loads(lines[-1])['class'] == 0
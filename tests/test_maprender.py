@@ -0,0 +1,51 @@
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from lib import maprender
+
+
+lats = [44.00, 44.01, 44.03, 44.02, 44.05]
+longs = [-94.00, -93.98, -93.97, -93.95, -93.96]
+style = dict(map_line_width=3, map_alpha=0.25, map_point_size=25, map_point_color='red', bc_point_size=10,
+             bc_point_color='gray')
+
+
+def full_render(value, prev_pts):
+    # per-frame render as originally done in add_map_to_timelapse.py
+    plt.rcParams["figure.figsize"] = (3.2, 2.4)
+    fig, ax = plt.subplots()
+    fig.patch.set_alpha(0.0)
+    for spine in ('top', 'right', 'bottom', 'left'):
+        ax.spines[spine].set_visible(False)
+    ax.plot(longs, lats, linewidth=style['map_line_width'], zorder=1)
+    if prev_pts:
+        ax.scatter([lc[1] for lc in prev_pts], [lc[0] for lc in prev_pts], c=style['bc_point_color'],
+                   s=style['bc_point_size'], linewidth=0, zorder=2)
+    ax.plot(value[1], value[0], marker='o', color=style['map_point_color'], markersize=style['map_point_size'],
+            zorder=3)
+    ax.patch.set_alpha(style['map_alpha'])
+    ax.xaxis.set_visible(False)
+    ax.yaxis.set_visible(False)
+    fig.canvas.draw()
+    out = np.array(fig.canvas.buffer_rgba())
+    plt.close('all')
+    return out
+
+
+def test_render_matches_full_render():
+    renderer = maprender.MapRenderer(lats, longs, 3.2, 2.4, **style)
+    coords = list(zip(lats, longs))
+    for i, value in enumerate(coords):
+        np.testing.assert_array_equal(renderer.render(value, i), full_render(value, coords[:i]))
+
+def test_render_out_of_order():
+    renderer = maprender.MapRenderer(lats, longs, 3.2, 2.4, **style)
+    coords = list(zip(lats, longs))
+    for i in (4, 1, 3, 0, 2):
+        np.testing.assert_array_equal(renderer.render(coords[i], i), full_render(coords[i], coords[:i]))
+
+def test_get_size():
+    renderer = maprender.MapRenderer(lats, longs, 3.2, 2.4, **style)
+    assert renderer.get_size() == (320, 240)
+    assert renderer.render([lats[0], longs[0]]).shape == (240, 320, 4)
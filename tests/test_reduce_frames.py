@@ -0,0 +1,56 @@
+import numpy as np
+import PIL.Image
+
+from utils import reduce_frames
+
+
+def make_frames(dst, levels):
+    paths = []
+    for i, level in enumerate(levels):
+        path = str(dst / "{0:04d}.jpg".format(i))
+        PIL.Image.new('RGB', (160, 120), (level, level, level)).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_select_by_threshold():
+    sigs = np.array([[0.], [0.01], [0.02], [0.5], [0.51], [0.9]], dtype=np.float32)
+    assert reduce_frames.select_by_threshold(sigs, 0.015).tolist() == [True, False, True, True, False, True]
+
+def test_select_by_count():
+    # long static stretch, then a busy one
+    sigs = np.r_[np.zeros(50), np.linspace(0, 1, 10)].reshape(-1, 1)
+    keep = reduce_frames.select_by_count(sigs, 8)
+    assert keep.sum() == 8
+    assert keep[0]
+    assert keep[:50].sum() == 1
+    assert reduce_frames.select_by_count(np.zeros((5, 1)), 3).sum() == 3
+    assert reduce_frames.select_by_count(np.zeros((2, 1)), 3).all()
+
+def test_frame_signature(tmp_path):
+    path = make_frames(tmp_path, [128])[0]
+    sig = reduce_frames.frame_signature(path)
+    assert len(sig) == reduce_frames.SIGNATURE_SIZE ** 2
+    assert np.allclose(sig, 128 / 255., atol=0.01)
+
+def test_reduce_frames_threshold_cached(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    src.mkdir()
+    make_frames(src, [10, 11, 12, 200, 201, 60])
+    cache_path = str(tmp_path / "cache.db")
+    for threshold, expected in [(0.1, ["0000.jpg", "0003.jpg", "0005.jpg"]), (0.6, ["0000.jpg", "0003.jpg"])]:
+        dst = tmp_path / "dst{}".format(threshold)
+        dst.mkdir()
+        reduce_frames.reduce_frames(str(src), str(dst), 2, ".jpg", "copy", no_renumber=True, threshold=threshold,
+                                    cache_path=cache_path)
+        assert sorted(p.name for p in dst.iterdir()) == expected
+
+        # second run reads every signature from the cache
+        def fail(path):
+            raise AssertionError("signature recomputed")
+        monkeypatch.setattr(reduce_frames, 'frame_signature', fail)
+
+def test_read_signatures_parallel(tmp_path):
+    paths = make_frames(tmp_path, list(range(0, 250, 25)))
+    serial = reduce_frames.read_signatures(paths)
+    assert np.array_equal(reduce_frames.read_signatures(paths, threads=3), serial)
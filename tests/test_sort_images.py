@@ -0,0 +1,43 @@
+import os
+import pickle
+import pytest
+
+import sort_images
+
+
+def make_images(dst, count):
+    dst.mkdir()
+    for i in range(count):
+        (dst / "{0:02d}.jpg".format(i)).write_bytes(b"")
+
+def test_main_resume(tmp_path, monkeypatch):
+    src, good, bad = tmp_path / "src", tmp_path / "good", tmp_path / "bad"
+    make_images(src, 6)
+    good.mkdir()
+    bad.mkdir()
+    model = str(tmp_path / "model.pkl")
+    pickle.dump({}, open(model, 'wb'))
+    classified = []
+
+    def fake_stream(images, clf, fail_after=None, **kwargs):
+        for i, img in enumerate(sorted(images)):
+            if i == fail_after:
+                raise KeyboardInterrupt
+            classified.append(os.path.basename(img))
+            yield img, int(img[-5]) % 2
+
+    args = (str(src), '.jpg', model, str(good), str(bad))
+    monkeypatch.setattr(sort_images, 'classify_stream', lambda *a, **kw: fake_stream(*a, fail_after=3, **kw))
+    with pytest.raises(KeyboardInterrupt):
+        sort_images.main(*args)
+    assert sorted(os.listdir(str(good)) + os.listdir(str(bad))) == ["00.jpg", "01.jpg", "02.jpg"]
+
+    # classified before the run stopped, but not moved
+    os.rename(str(bad / "00.jpg"), str(src / "00.jpg"))
+    classified.clear()
+    monkeypatch.setattr(sort_images, 'classify_stream', fake_stream)
+    sort_images.main(*args, resume=True)
+    assert classified == ["03.jpg", "04.jpg", "05.jpg"]
+    assert sorted(os.listdir(str(good))) == ["01.jpg", "03.jpg", "05.jpg"]
+    assert sorted(os.listdir(str(bad))) == ["00.jpg", "02.jpg", "04.jpg"]
+    assert os.listdir(str(src)) == [sort_images.JOURNAL_NAME]
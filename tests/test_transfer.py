@@ -0,0 +1,115 @@
+import os
+import errno
+import pytest
+
+from lib import transfer
+
+
+def make_files(dst, count=3):
+    paths = []
+    for i in range(count):
+        path = str(dst / "{0}.jpg".format(i))
+        with open(path, 'wb') as f:
+            f.write(os.urandom(1000 + i))
+        paths.append(path)
+    return paths
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("method", ['copy', 'copy2', 'link', 'reflink'])
+def test_transfer_files(tmp_path, method):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    paths = make_files(src)
+    pairs = [(p, str(dst / os.path.basename(p))) for p in paths]
+    stats = transfer.transfer_files(pairs, method, threads=2)
+    assert stats.files == 3
+    for s, d in pairs:
+        assert read(s) == read(d)
+    if method in ('copy', 'copy2'):
+        assert stats.bytes == sum(os.path.getsize(p) for p in paths)
+
+def test_transfer_no_overwrite(tmp_path):
+    src, dst = make_files(tmp_path, 2)
+    for method in transfer.METHODS:
+        with pytest.raises(FileExistsError):
+            transfer.transfer_file(src, dst, method)
+    assert os.path.exists(src)
+
+def test_copy_overwrite_hard_linked_dst(tmp_path):
+    # replacing a destination that is a hard link of the source must not truncate the source
+    src = make_files(tmp_path, 1)[0]
+    data = read(src)
+    dst = str(tmp_path / "dst.jpg")
+    os.link(src, dst)
+    transfer.transfer_file(src, dst, 'copy', overwrite=True)
+    assert read(src) == data
+    assert read(dst) == data
+
+def test_link_fallback(tmp_path, monkeypatch):
+    src, = make_files(tmp_path, 1)
+
+    def no_link(src, dst):
+        raise OSError(errno.EPERM, "hard links not supported")
+
+    monkeypatch.setattr(os, 'link', no_link)
+    stats = transfer.transfer_files([(src, str(tmp_path / "out.jpg"))], 'link')
+    assert stats.fallbacks == 1
+    assert read(src) == read(str(tmp_path / "out.jpg"))
+
+def test_copy_kernel_copy_reports_eof(tmp_path, monkeypatch):
+    src, = make_files(tmp_path, 1)
+    empty = str(tmp_path / "empty.jpg")
+    open(empty, 'wb').close()
+
+    def short_sendfile(out_fd, in_fd, offset, count):
+        # copies part of the file, then reports end of file
+        if offset:
+            return 0
+        return os.write(out_fd, os.pread(in_fd, 10, 0))
+
+    monkeypatch.setattr(os, 'copy_file_range', lambda src_fd, dst_fd, count: 0, raising=False)
+    monkeypatch.setattr(os, 'sendfile', short_sendfile, raising=False)
+    monkeypatch.setitem(transfer._kernel_copy, 'copy_file_range', True)
+    monkeypatch.setitem(transfer._kernel_copy, 'sendfile', True)
+    assert transfer.copy_file(src, str(tmp_path / "out.jpg"), clone=False) == 1000
+    assert read(src) == read(str(tmp_path / "out.jpg"))
+    assert transfer.copy_file(empty, str(tmp_path / "out_empty.jpg"), clone=False) == 0
+
+def test_move(tmp_path):
+    src, dst = make_files(tmp_path, 2)
+    data = read(src)
+    transfer.transfer_file(src, str(tmp_path / "moved.jpg"), 'move')
+    assert not os.path.exists(src)
+    assert read(str(tmp_path / "moved.jpg")) == data
+    transfer.transfer_file(str(tmp_path / "moved.jpg"), dst, 'move', overwrite=True)
+    assert read(dst) == data
+
+def test_chained_renames_in_order(tmp_path):
+    a, b, c = make_files(tmp_path, 3)
+    data = [read(p) for p in (a, b, c)]
+    # shift 1 -> 0 would clobber; listed so each destination is vacated first
+    os.unlink(a)
+    stats = transfer.transfer_files([(b, a), (c, b)], 'move', overwrite=True, threads=4)
+    assert stats.files == 2
+    assert read(a) == data[1]
+    assert read(b) == data[2]
+    assert not os.path.exists(c)
+
+def test_same_file_skipped(tmp_path):
+    src, = make_files(tmp_path, 1)
+    stats = transfer.transfer_files([(src, src)], 'copy2', overwrite=True)
+    assert stats.skipped == 1
+    assert stats.files == 0
+
+def test_dryrun(tmp_path):
+    src, = make_files(tmp_path, 1)
+    stats = transfer.transfer_files([(src, str(tmp_path / "out.jpg"))], 'copy', dryrun=True)
+    assert stats.files == 1
+    assert not os.path.exists(str(tmp_path / "out.jpg"))
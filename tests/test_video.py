@@ -0,0 +1,45 @@
+import sys
+import stat
+import pytest
+import numpy as np
+from PIL import Image
+
+from lib import video
+
+
+def make_fake_ffmpeg(dst):
+    # stand-in for ffmpeg: copy raw frames from stdin to the output path (last argument)
+    path = dst / "fake_ffmpeg"
+    path.write_text("#!{0}\nimport sys, shutil\nwith open(sys.argv[-1], 'wb') as f:\n"
+                    "    shutil.copyfileobj(sys.stdin.buffer, f)\n".format(sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_ffmpeg_command():
+    cmd = video.ffmpeg_command("ride.mp4", 640, 480, fps=24)
+    assert cmd[0] == 'ffmpeg'
+    assert cmd[-1] == "ride.mp4"
+    assert cmd[cmd.index('-s') + 1] == "640x480"
+    assert cmd[cmd.index('-r') + 1] == "24"
+    assert cmd[cmd.index('-i') + 1] == '-'
+    assert cmd[cmd.index('-f') + 1] == 'rawvideo'
+
+def test_writer_streams_frames(tmp_path):
+    out = str(tmp_path / "out.raw")
+    frames = [np.full((4, 6, 3), i, dtype=np.uint8) for i in range(3)]
+    with video.VideoWriter(out, 6, 4, ffmpeg=make_fake_ffmpeg(tmp_path)) as writer:
+        writer.write(frames[0])
+        writer.write(Image.fromarray(frames[1]).convert('RGBA'))
+        writer.write(frames[2].tobytes())
+    assert writer.frame_count == 3
+    assert open(out, 'rb').read() == b"".join(f.tobytes() for f in frames)
+
+def test_writer_wrong_size(tmp_path):
+    with pytest.raises(Exception):
+        with video.VideoWriter(str(tmp_path / "out.raw"), 6, 4, ffmpeg=make_fake_ffmpeg(tmp_path)) as writer:
+            writer.write(np.zeros((4, 5, 3), dtype=np.uint8))
+
+def test_writer_missing_ffmpeg(tmp_path):
+    with pytest.raises(Exception):
+        video.VideoWriter(str(tmp_path / "out.mp4"), 6, 4, ffmpeg=str(tmp_path / "no_ffmpeg"))
@@ -9,8 +9,11 @@ Created:    18 November 2017
 Python version: 3.9.2
 """
 import os
-import shutil
-import glob
+import sys
+
+# make the repository's lib package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import frames, transfer
 
 DEFAULT_EXTENSION = "jpg"
 
@@ -19,29 +22,26 @@ def get_sorted_images(src, ext):
     """
 
     :param src: <str>
-    :param ext: <str>
+    :param ext: <str> extension without the dot, matched case-insensitively
     :return: <list>
     """
-    return sorted(glob.glob(os.path.join(src, '*.{}'.format(ext))))
+    return frames.FrameIndex.scan(src, '.{}'.format(ext)).paths
 
 
-def batch_rename(src, extension=DEFAULT_EXTENSION, dst=None, move=False, renumber=False, dryrun=False):
+def batch_rename(src, extension=DEFAULT_EXTENSION, dst=None, move=False, renumber=False, dryrun=False,
+                 threads=transfer.DEFAULT_THREADS):
 
     print("dst: {0}".format(dst))
     fn_in = get_sorted_images(src, extension)
     if not fn_in:
-        fn_in = get_sorted_images(src, extension.upper())
-        if not fn_in:
-            fn_in = get_sorted_images(src, extension.lower())
-    if not fn_in:
-        raise Exception(f"No input images found in '{src}' with extensions '{extension}' "
-                        f"(also tried '{extension.upper()}' and '{extension.lower()}')")
+        raise Exception(f"No input images found in '{src}' with extension '{extension}' (any case)")
 
     if renumber:
         img_ct = 0
         # determine number of digits
         num_dig = len(str(len(fn_in)))
 
+    transfers = []
     for f in fn_in:
         fin = os.path.splitext(os.path.basename(f))[0]
 
@@ -64,11 +64,10 @@ def batch_rename(src, extension=DEFAULT_EXTENSION, dst=None, move=False, renumbe
 
         if dryrun:
             print("Dryrun: copy {0} to {1}".format(f, fn_out))
-        else:
-            if move:
-                shutil.move(f, fn_out)
-            else:
-                shutil.copy2(f, fn_out)  # use .copy2() to preserve metadata
+        transfers.append((f, fn_out))
+
+    # copy2 preserves metadata; in-place renames that chain into each other run in order
+    transfer.transfer_files(transfers, 'move' if move else 'copy2', overwrite=True, threads=threads, dryrun=dryrun)
 
 
 if __name__ == "__main__":
@@ -88,6 +87,8 @@ if __name__ == "__main__":
     parser.add_argument("--renumber", help="Rename files to sequential numbers by alphanumeric order",
                         action="store_true", required=False)
     parser.add_argument("-m", "--move", help="Move files instead of making a copy", action="store_true", required=False)
+    parser.add_argument("--threads", help="Number of concurrent file transfers (default={})"
+                        .format(transfer.DEFAULT_THREADS), type=int, default=transfer.DEFAULT_THREADS, required=False)
     parser.add_argument("--dryrun", help="Run script, but do not execute actions", action="store_true", required=False)
 
     arguments = parser.parse_args()
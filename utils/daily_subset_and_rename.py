@@ -3,85 +3,74 @@ daily_subset_and_rename.py
 
 Purpose: copy images from times X to Y for each day to new folder, optionally rename using batch_rename.py
 
+         Times are whole hours, or time windows with minutes, past midnight, or relative to sunrise/sunset.
+
 
 '''
 import os
 import sys
-import glob
-import re
-import shutil
-import batch_rename
-
-
-def int2padstr(int_val):
-    """
-
-    :param int_val:
-    :return:
-    """
-    if int_val < 10:
-        return str(int_val).zfill(2)
-    else:
-        return str(int_val)
-
-
-def build_regex(int_val, end_val=9):
-    """
-
-    :param int_val:
-    :param end_val:
-    :return:
-    """
-    return '[{0}][{1}-{2}]'.format(int_val[0], int_val[1], end_val)
-
 
-def build_re_range(val_one, val_two):
-    # make sure numbers have ones and tens place
-    str_one = int2padstr(val_one)
-    str_two = int2padstr(val_two)
-
-    # if same tens place, do not create min|max range
-    if str_one[0] == str_two[0]:
-        time_range = '{0}'.format(build_regex(str_one, end_val=int(str_two[1])))
-    else:
-        time_range = '[{0}|{1}]'.format(build_regex(str_one), build_regex(str_two))
-
-    return re.compile(time_range + ':\d{2}:\d{2}')
+# make the repository's lib package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import frames, transfer
+from utils import batch_rename
 
 
-def main(src, dst, time_start, time_end, ext='.jpg', renumber=False, dryrun=False):
+def main(src, dst, time_start=None, time_end=None, ext='.jpg', renumber=False, dryrun=False,
+         threads=transfer.DEFAULT_THREADS, windows=None, lat=None, lon=None, utc_offset=None, exif_time=False,
+         cache_path=None):
     """
 
     :param dir_in: <str>
     :param dir_out: <str>
-    :param time_start: <int>
-    :param time_end: <int>
+    :param time_start: <int> start hour
+    :param time_end: <int> end hour (inclusive)
     :param ext: <str>
     :param renumber: <bool>
     :param dryrun: <bool>
+    :param threads: <int> number of concurrent file copies
+    :param windows: <list> time windows, e.g., ['07:30-09:00', '22:00-02:00', 'sunset-30-sunset+30'] (see
+                    lib.frames.parse_window); used with or instead of time_start and time_end
+    :param lat: <float> latitude of the camera, for sunrise/sunset windows
+    :param lon: <float> longitude of the camera, for sunrise/sunset windows
+    :param utc_offset: <float> hours from UTC of the capture times (default=None, local time zone of this computer)
+    :param exif_time: <bool> read capture times from EXIF instead of the file names
+    :param cache_path: <str> with exif_time, path to cache database of EXIF times (default=None, no caching)
     :return:
     """
+    time_windows = [frames.parse_window(w) for w in windows or []]
+    if time_start is not None or time_end is not None:
+        if time_start is None or time_end is None:
+            sys.exit("Both time_start and time_end are required")
+        time_windows.append(frames.hour_window(time_start, time_end))
+    if not time_windows:
+        sys.exit("Specify time_start and time_end, or at least one --window")
+
     if not os.path.exists(dst) and not dryrun:
         print("Creating directory {0}".format(dst))
         os.mkdir(dst)
 
     # get files
-    fn_in = sorted(glob.glob(os.path.join(src, '*' + ext)))
-    if not fn_in:
+    index = frames.FrameIndex.scan(src, ext, exif_time=exif_time, cache_path=cache_path)
+    if not len(index):
         sys.exit("Could not find any files for input dir {0} using extension {1}".format(src, ext))
+    if index.untimed:
+        print("Skipping {0} files without a capture time in their {1}".format(len(index.untimed),
+                                                                            "EXIF" if exif_time else "name"))
 
-    # sort files by time of day
-    fn_in_match = [i for i in fn_in if build_re_range(time_start, time_end).findall(i)]
+    # select files by time of day
+    fn_in_match = [f.path for f in index.select(time_windows, lat=lat, lon=lon, utc_offset=utc_offset)]
     if not fn_in_match:
-        sys.exit("Could not find any matches in {0} between hours {1} and {2}".format(src, time_start, time_end))
+        sys.exit("Could not find any matches in {0} within the time window(s)".format(src))
 
     # copy to new dir
     if not dryrun:
-        [shutil.copy2(fc, dst) for fc in fn_in_match]
+        transfer.transfer_files([(fc, os.path.join(dst, os.path.basename(fc))) for fc in fn_in_match], 'copy2',
+                                overwrite=True, threads=threads)
 
         # optionally re-number using batch_rename.py
         if renumber:
-            batch_rename.main(dst, renumber=True)
+            batch_rename.batch_rename(dst, extension=ext.lstrip('.'), move=True, renumber=True, threads=threads)
 
     else:
         print("--dryrun uesd; no files will be moved. Results: {0}".format(fn_in_match))
@@ -96,12 +85,27 @@ if __name__ == "__main__":
 
     req_named.add_argument("src", help="Dir of input images.")
     req_named.add_argument("dst", help="Output dir for moved images.")
-    req_named.add_argument("time_start", help="Start hour.")
-    req_named.add_argument("time_end", help="End hour.")
+    parser.add_argument("time_start", help="Start hour.", type=int, nargs="?")
+    parser.add_argument("time_end", help="End hour (inclusive).", type=int, nargs="?")
 
     parser.add_argument("--ext", help="Extension of input files (default='.jpg')", default=".jpg", required=False)
     parser.add_argument("--renumber", help="Rename files to sequential numbers by alphanumeric order",
                         action="store_true", required=False)
+    parser.add_argument("--threads", help="Number of concurrent file copies (default={})"
+                        .format(transfer.DEFAULT_THREADS), type=int, default=transfer.DEFAULT_THREADS, required=False)
+    parser.add_argument("-w", "--window", help="Time window START-END, each HH[:MM] or sunrise/sunset[+-MINUTES] "
+                        "(e.g., '07:30-09:00', '22:00-02:00' or 'sunset-30-sunset+30'); may be repeated",
+                        action="append", dest="windows", required=False)
+    parser.add_argument("--lat", help="Latitude of the camera, for sunrise/sunset windows", type=float,
+                        required=False)
+    parser.add_argument("--lon", help="Longitude of the camera (east positive), for sunrise/sunset windows",
+                        type=float, required=False)
+    parser.add_argument("--utc-offset", help="Hours from UTC of the capture times, for sunrise/sunset windows "
+                        "(default=time zone of this computer)", type=float, required=False)
+    parser.add_argument("--exif-time", help="Read capture times from EXIF DateTimeOriginal instead of file names",
+                        action="store_true", required=False)
+    parser.add_argument("--cache", help="With --exif-time, cache EXIF times in this database file",
+                        dest="cache_path", required=False)
     parser.add_argument("--dryrun", help="Run script, but do not execute actions", action="store_true", required=False)
 
     arguments = parser.parse_args()
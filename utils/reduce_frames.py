@@ -1,39 +1,148 @@
 import os
 import sys
-import glob
 import time
-import shutil
+import functools
+import numpy as np
+import PIL.Image
+
+# make the repository's lib package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import cache, common, frames, transfer
 
 
 DEFAULT_FILE_EXTENSION = ".jpg"
 DEFAULT_KEEP_FACTOR = 2
-TRANSFER_METHODS = ["link", "copy"]
+TRANSFER_METHODS = ["link", "reflink", "copy", "copy2"]
 DEFAULT_TRANSFER_METHOD = "link"
+DEFAULT_THREADS = 1
+SIGNATURE_SIZE = 16  # frames are compared as SIGNATURE_SIZE x SIGNATURE_SIZE luma thumbnails
+
+
+def frame_signature(fn_in, size=SIGNATURE_SIZE):
+	"""
+	Perceptual signature of a frame: luma, downscaled to size x size
+
+	:param fn_in: <str> path to image
+	:param size: <int>
+	:return: <list> size * size values in [0, 1]
+	"""
+	with PIL.Image.open(fn_in) as image:
+		# JPEG frames are decoded at reduced scale (up to 1/8) straight from the DCT coefficients
+		image.draft('L', (size * 8, size * 8))
+		luma = image.convert('L').resize((size, size), PIL.Image.BOX)
+
+	return (np.asarray(luma, dtype=np.float64) / 255.).ravel().tolist()
+
+
+def signature_params(size=SIGNATURE_SIZE):
+	"""
+	:param size: <int>
+	:return: <str> feature cache key of frame_signature()
+	"""
+	return "luma:size={0}".format(size)
+
+
+def compute_signatures(files_in, cache_path=None):
+	"""
+	Signatures of a task of frames; cached signatures are reused, so later runs (e.g., with another threshold) do
+	not decode the frames again
+
+	:param files_in: <list>
+	:param cache_path: <str> path to feature cache database (default=None, no caching)
+	:return: <list>
+	"""
+	if not cache_path:
+		return [frame_signature(f) for f in files_in]
+
+	with cache.FeatureCache(cache_path) as fc:
+		return [fc.lookup(f, signature_params(), frame_signature) for f in files_in]
+
+
+def read_signatures(files_in, threads=DEFAULT_THREADS, cache_path=None):
+	"""
+	Signatures of all frames, computed in parallel
+
+	:param files_in: <list>
+	:param threads: <int> number of processes
+	:param cache_path: <str> path to feature cache database (default=None, no caching)
+	:return: <numpy.ndarray> shape (len(files_in), SIGNATURE_SIZE ** 2)
+	"""
+	tasks = common.split_tasks(files_in, common.task_size(len(files_in), threads))
+	task_func = functools.partial(compute_signatures, cache_path=cache_path)
+	if threads > 1:
+		results = [sigs for _, sigs in common.schedule(task_func, tasks, process_count=threads)]
+	else:
+		results = [task_func(task) for task in tasks]
+	cache.evict_cache(cache_path)
+
+	return np.array([sig for sigs in results for sig in sigs], dtype=np.float32).reshape(len(files_in), -1)
+
+
+def select_by_threshold(signatures, threshold):
+	"""
+	Keep the first frame, then each frame whose mean absolute luma difference from the last kept frame exceeds
+	threshold
+
+	:param signatures: <numpy.ndarray> see read_signatures()
+	:param threshold: <float> in [0, 1]
+	:return: <numpy.ndarray> bool, True for frames to keep
+	"""
+	keep = np.zeros(len(signatures), dtype=bool)
+	if not len(signatures):
+		return keep
+
+	keep[0] = True
+	last = signatures[0]
+	for i in range(1, len(signatures)):
+		if np.abs(signatures[i] - last).mean() > threshold:
+			keep[i] = True
+			last = signatures[i]
+
+	return keep
+
+
+def select_by_count(signatures, target_count):
+	"""
+	Keep target_count frames, spread evenly over the accumulated change between consecutive frames, so static
+	stretches get few frames and busy stretches many
+
+	:param signatures: <numpy.ndarray> see read_signatures()
+	:param target_count: <int>
+	:return: <numpy.ndarray> bool, True for frames to keep
+	"""
+	frame_count = len(signatures)
+	if frame_count <= target_count:
+		return np.ones(frame_count, dtype=bool)
+
+	keep = np.zeros(frame_count, dtype=bool)
+	change = np.r_[0., np.abs(np.diff(signatures, axis=0)).mean(axis=1)]
+	cumulative = np.cumsum(change)
+	if cumulative[-1] > 0:
+		# first frame to reach each of target_count evenly spaced levels of change
+		idx = np.searchsorted(cumulative, np.linspace(0, cumulative[-1], target_count))
+	else:
+		idx = np.linspace(0, frame_count - 1, target_count).round().astype(int)
+	keep[np.minimum(idx, frame_count - 1)] = True
 
+	# a single large change can cover several levels; top up with the largest remaining changes
+	missing = target_count - keep.sum()
+	if missing > 0:
+		candidates = np.flatnonzero(~keep)
+		keep[candidates[np.argsort(change[candidates], kind='stable')[::-1][:missing]]] = True
 
-def do_transfer(fn_in, fn_out, transfer_method, overwrite=False):
-	out_exists = os.path.isfile(fn_out)
-	if transfer_method == "link":
-		if out_exists and overwrite:
-			os.remove(fn_out)
-		os.link(fn_in, fn_out)
-
-	elif transfer_method == "copy":
-		if out_exists and overwrite:
-			os.remove(fn_out)
-		shutil.copyfile(fn_in, fn_out)
-
-	else:
-		print("ERROR: transfer method {} not supported!".format(transfer_method))
-		sys.exit(1)
+	return keep
 
 
-def reduce_frames(src, dst, keep_factor, file_ext, transfer_method, no_renumber=False, overwrite=False, dryrun=False):
+def reduce_frames(src, dst, keep_factor, file_ext, transfer_method, no_renumber=False, overwrite=False, dryrun=False,
+				  threshold=None, target_count=None, threads=DEFAULT_THREADS, cache_path=None,
+				  transfer_threads=transfer.DEFAULT_THREADS):
 	print("---------------------------------------------------------")
 	print("Inputs:")
 	print("  src: {}".format(src))
 	print("  dst: {}".format(dst))
 	print("  keep_factor: {}".format(keep_factor))
+	print("  threshold: {}".format(threshold))
+	print("  target_count: {}".format(target_count))
 	print("  file_ext: {}".format(file_ext))
 	print("  transfer_method: {}".format(transfer_method))
 	print("  no_renumber: {}".format(no_renumber))
@@ -41,11 +150,27 @@ def reduce_frames(src, dst, keep_factor, file_ext, transfer_method, no_renumber=
 	print("  dryrun: {}".format(dryrun))
 	print("---------------------------------------------------------\n")
 
-	dir_with_pattern = os.path.join(src, "*{}".format(file_ext))
-	files_in = sorted(glob.glob(dir_with_pattern))
+	files_in = frames.FrameIndex.scan(src, file_ext).paths
 	if not files_in:
-		print("ERROR: no files found using wildcard path {}".format(dir_with_pattern))
+		print("ERROR: no files found in {0} with extension {1}".format(src, file_ext))
 		sys.exit(1)
+
+	if threshold is not None and target_count is not None:
+		print("ERROR: use either a threshold or a target count, not both")
+		sys.exit(1)
+
+	if threshold is not None or target_count is not None:
+		# content-aware: compare small luma thumbnails of the frames
+		print("computing signatures of {} files ...".format(len(files_in)))
+		signatures = read_signatures(files_in, threads=threads, cache_path=cache_path)
+		if threshold is not None:
+			keep = select_by_threshold(signatures, threshold)
+		else:
+			keep = select_by_count(signatures, target_count)
+		print("keeping {0} of {1} files".format(keep.sum(), len(files_in)))
+	else:
+		keep = [i % keep_factor == 0 for i in range(len(files_in))]
+
 	it = 0
 	renumber_ct = 0
 	# determine number of digits
@@ -54,8 +179,9 @@ def reduce_frames(src, dst, keep_factor, file_ext, transfer_method, no_renumber=
 		print("WARNING: files will be renamed sequentially, using {} number places".format(num_dig))
 		print("  sleeping 15 seconds before continuing...")
 		time.sleep(15)
+	transfers = []
 	for f in files_in:
-		if it % keep_factor == 0:
+		if keep[it]:
 			if no_renumber:
 				file_out = os.path.join(dst, os.path.basename(f))
 			else:
@@ -64,9 +190,10 @@ def reduce_frames(src, dst, keep_factor, file_ext, transfer_method, no_renumber=
 				fin_fix = str(renumber_ct).zfill(num_dig)
 				file_out = os.path.join(dst, fin_fix + file_ext)
 			print("'{0}' {1} to {2} ...".format(transfer_method, f, file_out))
-			if not dryrun:
-				do_transfer(f, file_out, transfer_method, overwrite=overwrite)
+			transfers.append((f, file_out))
 		it += 1
+
+	transfer.transfer_files(transfers, transfer_method, overwrite=overwrite, threads=transfer_threads, dryrun=dryrun)
 	if dryrun:
 		print("\n--dryrun used; no files transferred.\n")
 
@@ -74,7 +201,8 @@ def reduce_frames(src, dst, keep_factor, file_ext, transfer_method, no_renumber=
 if __name__ == "__main__":
 	import argparse
 
-	parser = argparse.ArgumentParser(description="Decimate files (sorted by name) using a keep factor")
+	parser = argparse.ArgumentParser(description="Decimate files (sorted by name) using a keep factor, or by how much "
+												 "frames differ from each other")
 
 	req_named = parser.add_argument_group("Required named arguments")
 
@@ -91,6 +219,18 @@ if __name__ == "__main__":
 						   help="How to transfer kept files (default='{}')".format(DEFAULT_TRANSFER_METHOD),
 						   default=DEFAULT_TRANSFER_METHOD, choices=TRANSFER_METHODS, type=str)
 
+	parser.add_argument("-t", "--threshold",
+						help="Keep frames whose mean luma difference (0-1) from the last kept frame exceeds this value, "
+							 "instead of using a keep factor (e.g., 0.02)", type=float, required=False)
+	parser.add_argument("-n", "--target-count",
+						help="Keep this many frames, chosen where frames change the most, instead of using a keep factor",
+						type=int, required=False)
+	parser.add_argument("--threads", help="Number of processes computing frame signatures (default={})"
+						.format(DEFAULT_THREADS), type=int, default=DEFAULT_THREADS, required=False)
+	parser.add_argument("--cache", help="Path to feature cache database; signatures of unchanged files are reused "
+										"across runs (default=no cache)", dest="cache_path", required=False)
+	parser.add_argument("--transfer-threads", help="Number of concurrent file transfers (default={})"
+						.format(transfer.DEFAULT_THREADS), type=int, default=transfer.DEFAULT_THREADS, required=False)
 	parser.add_argument("--no-renumber", help="Do NOT rename transferred files to sequential numbering",
 						action="store_true")
 	parser.add_argument("--overwrite", help="Overwrite existing destination file(s)", action="store_true")